@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import numpy as np
+import stlloader
+
+SHAPES = ("flat", "deep", "wide")
+
+def entity(i, shape="box"):
+    e = {
+        "name": "{} {}".format(shape, i),
+        "type": "entity",
+        "shape": shape,
+        "pos": [i % 97 - 48, i % 89 - 44, i % 83 - 41, i % 360 - 180, 0, 0],
+        "color": [i * 37 % 256, i * 91 % 256, i * 53 % 256],
+    }
+    if shape == "box":
+        e["size"] = [1 + i % 3, 1 + i % 5, 1 + i % 7]
+    else:
+        e["size"] = [1 + i % 4]
+    return e
+
+def group(name, children):
+    return { "name": name, "type": "group", "pos": [0] * 6, "children": children }
+
+def syntheticScene(kind, n):
+    """ dumpData style tree with n nodes: flat list, nested chain or a few wide groups """
+    if kind == "flat":
+        return [entity(i, "box" if i % 4 else "sphere") for i in range(n)]
+    if kind == "deep":
+        # chains of 100 nested groups, each holding a few entities
+        rst = []
+        i = 0
+        while i < n:
+            root = group("group {}".format(i), [])
+            node = root
+            i += 1
+            for _ in range(100):
+                for _ in range(4):
+                    if i >= n:
+                        break
+                    node["children"].append(entity(i))
+                    i += 1
+                if i >= n:
+                    break
+                child = group("group {}".format(i), [])
+                node["children"].append(child)
+                node = child
+                i += 1
+            rst.append(root)
+        return rst
+    if kind == "wide":
+        groups = 4
+        per = max((n - groups) // groups, 0)
+        return [group("group {}".format(g), [entity(g * per + j) for j in range(per)])
+            for g in range(groups)]
+    raise ValueError("unknown scene kind " + kind)
+
+def syntheticSTL(path, triangles):
+    """ Writes a binary STL height field with the given number of triangles """
+    side = int(np.ceil(np.sqrt(triangles / 2))) + 1
+    x, y = np.meshgrid(np.arange(side, dtype=np.float32), np.arange(side, dtype=np.float32))
+    z = np.sin(x * 0.1) * np.cos(y * 0.1) * 5
+    grid = np.stack([x, y, z], axis=-1)
+    a, b = grid[:-1, :-1].reshape(-1, 3), grid[:-1, 1:].reshape(-1, 3)
+    c, d = grid[1:, :-1].reshape(-1, 3), grid[1:, 1:].reshape(-1, 3)
+    tri = np.concatenate([np.stack([a, b, d], 1), np.stack([a, d, c], 1)])[:triangles]
+    facets = np.zeros(len(tri), dtype=stlloader.BINARY_FACET)
+    facets["v"] = tri
+    with open(path, "wb") as fp:
+        fp.write(b"\0" * 80)
+        fp.write(np.uint32(len(tri)).tobytes())
+        fp.write(facets.tobytes())
+
+def best(fn, repeat, setup=None):
+    rst = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        t = time.perf_counter() - start
+        rst = t if rst is None else min(rst, t)
+    return rst
+
+def benchSTL(triangles, repeat, tmp):
+    path = os.path.join(tmp, "synthetic-{}.stl".format(triangles))
+    syntheticSTL(path, triangles)
+    mesh = stlloader.load(path)
+    rst = {
+        "parse": best(lambda: stlloader.load(path), repeat),
+        "weld": best(lambda: stlloader.weld(mesh), repeat),
+    }
+    os.remove(path)
+    return rst
+
+def benchModel(tree, repeat, tmp, ops=1000, headless=False):
+    """ Timings of DataModel and the tree view, or of the Qt-free SceneCore when headless """
+    if headless:
+        from scenecore import SceneCore
+        model = SceneCore(path=os.path.join(tmp, "scene.json"))
+        view = None
+    else:
+        from PySide2.QtWidgets import QApplication
+        from model import DataModel
+        from treeview import TreeView
+        app = QApplication.instance() or QApplication([])
+        model = DataModel(path=os.path.join(tmp, "scene.json"))
+        view = TreeView()
+    rst = {}
+
+    def load():
+        with model.batch():
+            for entry in tree:
+                model.loadData(entry, 0)
+
+    rst["load"] = best(load, repeat, model.clearData)
+    rst["dump"] = best(lambda: model.dumpData(0), repeat)
+
+    def save():
+        model.dumpToFile()
+        model.flushToFile()
+
+    rst["dump_to_file"] = best(save, repeat)
+    if view is not None:
+        rst["tree_update"] = best(lambda: view.updateData(model._data, 0), repeat)
+        model.assignCallback("tree", view.updateData)
+        model.assignCallback("tree-change", view.changeData)
+
+    entities = [i for i, el in model._data.items() if el.type == "entity"]
+    if entities:
+        target = entities[len(entities) // 2]
+        start = time.perf_counter()
+        for k in range(ops):
+            model.setValue(target, dx=float(k % 100))
+        rst["set_value_per_s"] = ops / (time.perf_counter() - start)
+
+    # the group with the most children, or the root for flat scenes
+    groups = [i for i, el in model._data.items() if el.type in ("group", "root")]
+    big = max(groups, key=lambda i: len(model._data[i].children))
+    model.selectElement(big)
+    start = time.perf_counter()
+    for _ in range(ops):
+        model.addShape("box")
+    rst["add_shape_big_group"] = (time.perf_counter() - start) / ops
+    added = model._data[big].children[-ops:]
+    model.setSelection(added)
+    rst["offset_selection"] = best(lambda: model.offsetSelection(dx=1.0, rz=5.0), repeat)
+    rst["color_selection"] = best(lambda: model.colorNodes(added, (10, 20, 30)), repeat)
+    rst["undo_offset_selection"] = best(model.undoChange, repeat,
+        lambda: model.offsetSelection(dx=1.0))
+    start = time.perf_counter()
+    for i in added:
+        model.delShape(i)
+    rst["del_shape_big_group"] = (time.perf_counter() - start) / ops
+
+    for _ in range(ops):
+        model.addShape("box")
+    model.setSelection(model._data[big].children[-ops:])
+    start = time.perf_counter()
+    model.delSelection()
+    rst["del_selection_big_group"] = (time.perf_counter() - start) / ops
+
+    model.close()
+    if view is not None:
+        view.deleteLater()
+        app.processEvents()
+    return rst
+
+def run(args):
+    tmp = tempfile.mkdtemp(prefix="pyqt3dviewer-bench-")
+    results = {}
+    headless = args.headless
+    try:
+        for kind in args.scenes:
+            for n in args.sizes:
+                tree = syntheticScene(kind, n)
+                name = "{}-{}".format(kind, n)
+                results[name + ".json_bytes"] = len(json.dumps(tree))
+                try:
+                    timings = benchModel(tree, args.repeat, tmp, headless=headless)
+                except ImportError as e:
+                    print("no Qt, timing SceneCore instead:", e, file=sys.stderr)
+                    headless = True
+                    timings = benchModel(tree, args.repeat, tmp, headless=True)
+                for k, v in timings.items():
+                    results["{}.{}".format(name, k)] = v
+                print(name, "done", file=sys.stderr)
+        for triangles in args.stl:
+            for k, v in benchSTL(triangles, args.repeat, tmp).items():
+                results["stl-{}.{}".format(triangles, k)] = v
+            print("stl", triangles, "done", file=sys.stderr)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "repeat": args.repeat,
+            "headless": headless,
+        },
+        "results": results,
+    }
+
+def compare(base, current):
+    """ (key, baseline, current, slowdown) of the timings in both files, worst first """
+    rst = []
+    for k, old in base["results"].items():
+        new = current["results"].get(k)
+        if new is None or not old or k.endswith("_bytes"):
+            continue
+        # throughput keys are better when larger
+        ratio = old / new if k.endswith("_per_s") else new / old
+        rst.append((k, old, new, ratio))
+    rst.sort(key=lambda r: -r[3])
+    return rst
+
+def printComparison(rows, tolerance):
+    failed = 0
+    for k, old, new, ratio in rows:
+        mark = ""
+        if ratio > 1 + tolerance:
+            mark = "REGRESSION"
+            failed += 1
+        print("{:<44} {:>12.6g} {:>12.6g} {:>7.2f}x {}".format(k, old, new, ratio, mark))
+    return failed
+
+def sizes(text):
+    return [int(float(s)) for s in text.split(",") if s]
+
+if __name__ == '__main__':
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    parser = argparse.ArgumentParser(description="headless benchmarks")
+    sub = parser.add_subparsers(dest="cmd")
+    r = sub.add_parser("run")
+    r.add_argument("--scenes", type=lambda s: s.split(","), default=list(SHAPES),
+        help="comma separated scene kinds: flat, deep, wide")
+    r.add_argument("--sizes", type=sizes, default=[1000, 10000],
+        help="node counts, e.g. 1000,10000,100000")
+    r.add_argument("--stl", type=sizes, default=[10000, 1000000],
+        help="synthetic STL triangle counts, e.g. 10000,5000000")
+    r.add_argument("--repeat", type=int, default=3)
+    r.add_argument("--headless", action="store_true",
+        help="time the Qt-free SceneCore instead of DataModel")
+    r.add_argument("--out", help="write the results to this JSON file")
+    r.add_argument("--baseline", help="compare against a previous results file")
+    r.add_argument("--tolerance", type=float, default=0.2)
+    c = sub.add_parser("compare")
+    c.add_argument("baseline")
+    c.add_argument("current")
+    c.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.cmd == "run":
+        current = run(args)
+        text = json.dumps(current, indent=2)
+        if args.out:
+            with open(args.out, "w") as fp:
+                fp.write(text)
+        else:
+            print(text)
+        if args.baseline:
+            base = json.load(open(args.baseline))
+            sys.exit(1 if printComparison(compare(base, current), args.tolerance) else 0)
+    elif args.cmd == "compare":
+        base = json.load(open(args.baseline))
+        current = json.load(open(args.current))
+        sys.exit(1 if printComparison(compare(base, current), args.tolerance) else 0)
+    else:
+        parser.print_help()
+        sys.exit(1)
@@ -0,0 +1,341 @@
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+from array import array
+
+# Binary scene layout, little-endian, nodes stored in pre-order:
+#   header   magic, version, flags, node count, string count, journal seq, last id
+#   kind     u8[n]      0 group, 1 box, 2 sphere, 3 stl, | 0x80 instanced group
+#   color    u8[n*3]
+#   parent   i32[n]     node index of the parent, -1 for top level nodes
+#   end      u32[n]     one past the last node of the subtree
+#   ident    u32[n]
+#   name     i32[n]     string table index
+#   url      i32[n]     string table index, -1 when unset, stl file or group reference
+#   pos      f64[n*6]   dx dy dz rx ry rz
+#   size     f64[n*3]   box l w h, sphere r, stl scale
+#   stroff   u32[s+1]   string table offsets into the utf-8 blob
+#   strblob
+# Every column starts on an 8 byte boundary.
+
+MAGIC = b"P3DS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIQI")
+
+KINDS = ["group", "box", "sphere", "stl"]
+KIND_ID = { k: i for i, k in enumerate(KINDS) }
+# high bit of the kind byte, groups drawn with instancing
+INSTANCED = 0x80
+
+if sys.byteorder != "little":
+    raise ImportError("binscene only supports little-endian hosts")
+
+def _align(n):
+    return (n + 7) & ~7
+
+def _layout(count, nstrings):
+    columns = [
+        ("kind", "B", count),
+        ("color", "B", count * 3),
+        ("parent", "i", count),
+        ("end", "I", count),
+        ("ident", "I", count),
+        ("name", "i", count),
+        ("url", "i", count),
+        ("pos", "d", count * 6),
+        ("size", "d", count * 3),
+        ("stroff", "I", nstrings + 1),
+    ]
+    rst = {}
+    off = _align(HEADER.size)
+    for name, fmt, n in columns:
+        rst[name] = (off, fmt, n)
+        off = _align(off + struct.calcsize(fmt) * n)
+    rst["strblob"] = (off, "B", None)
+    return rst
+
+class SceneBuilder():
+    def __init__(self):
+        self.kind = array("B")
+        self.color = array("B")
+        self.parent = array("i")
+        self.end = array("I")
+        self.ident = array("I")
+        self.name = array("i")
+        self.url = array("i")
+        self.pos = array("d")
+        self.size = array("d")
+        self._strings = {}
+        self._blob = []
+
+    def string(self, s):
+        if s is None:
+            return -1
+        if s not in self._strings:
+            self._strings[s] = len(self._blob)
+            self._blob.append(s.encode("utf-8"))
+        return self._strings[s]
+
+    def addNode(self, kind, parent, ident, name, pos, color=(0, 0, 0), size=(0, 0, 0), url=None,
+            instanced=False):
+        i = len(self.kind)
+        self.kind.append(KIND_ID[kind] | (INSTANCED if instanced else 0))
+        self.color.extend(int(c) for c in color)
+        self.parent.append(parent)
+        self.end.append(i + 1)
+        self.ident.append(ident)
+        self.name.append(self.string(name))
+        self.url.append(self.string(url))
+        self.pos.extend(pos)
+        self.size.extend((list(size) + [0, 0, 0])[:3])
+        return i
+
+    def closeNode(self, i):
+        self.end[i] = len(self.kind)
+
+    def addTree(self, tree, parent=-1):
+        """ Adds nodes in the dumpData layout """
+        for entry in tree:
+            ident = entry.get("id", len(self.kind) + 1)
+            if entry["type"] == "group":
+                i = self.addNode("group", parent, ident, entry["name"], entry["pos"],
+                    url=entry.get("ref"), instanced=entry.get("instanced", False))
+                self.addTree(entry["children"], i)
+                self.closeNode(i)
+            elif entry["shape"] == "stl":
+                self.addNode("stl", parent, ident, entry["name"], entry["pos"],
+                    entry["color"], [entry["scale"]], entry["url"])
+            else:
+                self.addNode(entry["shape"], parent, ident, entry["name"], entry["pos"],
+                    entry["color"], entry["size"])
+
+    def tobytes(self, seq=0, no=0):
+        count = len(self.kind)
+        stroff = array("I", [0])
+        for b in self._blob:
+            stroff.append(stroff[-1] + len(b))
+        layout = _layout(count, len(self._blob))
+        out = bytearray(layout["strblob"][0] + stroff[-1])
+        HEADER.pack_into(out, 0, MAGIC, VERSION, 0, count, len(self._blob), seq, no)
+        for name in ["kind", "color", "parent", "end", "ident", "name", "url", "pos", "size"]:
+            raw = getattr(self, name).tobytes()
+            off = layout[name][0]
+            out[off:off + len(raw)] = raw
+        raw = stroff.tobytes()
+        off = layout["stroff"][0]
+        out[off:off + len(raw)] = raw
+        off = layout["strblob"][0]
+        out[off:] = b"".join(self._blob)
+        return bytes(out)
+
+def dump(data, path):
+    """ Writes a dumpData tree (or journal snapshot dict) to path """
+    seq, no = 0, 0
+    if isinstance(data, dict):
+        seq, no, data = data["seq"], data["no"], data["scene"]
+    builder = SceneBuilder()
+    builder.addTree(data)
+    with open(path, "wb") as fp:
+        fp.write(builder.tobytes(seq, no))
+
+class BinaryScene():
+    def __init__(self, path):
+        self._fp = open(path, "rb")
+        size = os.fstat(self._fp.fileno()).st_size
+        if size < HEADER.size:
+            raise ValueError("not a binary scene: {}".format(path))
+        self._map = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._map)
+        magic, version, _, count, nstrings, self.seq, self.no = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            buf.release()
+            self.close()
+            raise ValueError("not a binary scene: {}".format(path))
+        self.count = count
+        self._strcache = {}
+        layout = _layout(count, nstrings)
+        self._views = [buf]
+        for name, (off, fmt, n) in layout.items():
+            if n is None:
+                view = buf[off:]
+            else:
+                view = buf[off:off + struct.calcsize(fmt) * n].cast(fmt)
+            self._views.append(view)
+            setattr(self, "_" + name, view)
+
+    def __len__(self):
+        return self.count
+
+    def string(self, i):
+        if i < 0:
+            return None
+        s = self._strcache.get(i)
+        if s is None:
+            s = bytes(self._strblob[self._stroff[i]:self._stroff[i + 1]]).decode("utf-8")
+            self._strcache[i] = s
+        return s
+
+    def kind(self, i):
+        return KINDS[self._kind[i] & ~INSTANCED]
+
+    def parent(self, i):
+        return self._parent[i]
+
+    def ident(self, i):
+        return self._ident[i]
+
+    def children(self, i=-1):
+        """ Child node indices of node i, or the top level nodes for -1 """
+        j = i + 1
+        end = self._end[i] if i >= 0 else self.count
+        while j < end:
+            yield j
+            j = self._end[j]
+
+    def node(self, i):
+        """ Decodes a single node into the dumpData layout, without children """
+        kind = KINDS[self._kind[i] & ~INSTANCED]
+        rst = { "name": self.string(self._name[i]), "id": self._ident[i],
+            "pos": list(self._pos[i * 6:i * 6 + 6]) }
+        if kind == "group":
+            rst["type"] = "group"
+            if self._kind[i] & INSTANCED:
+                rst["instanced"] = True
+            # the url column holds the scene file a group references
+            ref = self.string(self._url[i])
+            if ref is not None:
+                rst["ref"] = ref
+            rst["children"] = []
+            return rst
+        rst["type"] = "entity"
+        rst["shape"] = kind
+        rst["color"] = list(self._color[i * 3:i * 3 + 3])
+        if kind == "box":
+            rst["size"] = list(self._size[i * 3:i * 3 + 3])
+        elif kind == "sphere":
+            rst["size"] = [self._size[i * 3]]
+        elif kind == "stl":
+            rst["scale"] = self._size[i * 3]
+            rst["url"] = self.string(self._url[i])
+        return rst
+
+    def tree(self, i=-1):
+        """ Decodes the subtree under node i into the dumpData layout """
+        rst = []
+        for j in self.children(i):
+            entry = self.node(j)
+            if entry["type"] == "group":
+                entry["children"] = self.tree(j)
+            rst.append(entry)
+        return rst
+
+    def close(self):
+        for view in reversed(getattr(self, "_views", [])):
+            view.release()
+        self._views = []
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def load(path):
+    with BinaryScene(path) as scene:
+        return scene.tree()
+
+def isBinary(path):
+    with open(path, "rb") as fp:
+        return fp.read(4) == MAGIC
+
+def convert(src, dst):
+    if isBinary(src):
+        with open(dst, "w") as fp:
+            json.dump(load(src), fp)
+    else:
+        dump(json.load(open(src)), dst)
+
+def bench(path, repeat=5):
+    tree = json.load(open(path))
+    if isinstance(tree, dict):
+        tree = tree["scene"]
+    tmp_json = path + ".bench.json"
+    tmp_bin = path + ".bench.p3ds"
+
+    def timeit(fn):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            t = time.perf_counter() - start
+            best = t if best is None else min(best, t)
+        return best
+
+    def jsonSave():
+        with open(tmp_json, "w") as fp:
+            json.dump(tree, fp)
+
+    def binaryLazy():
+        with BinaryScene(tmp_bin) as scene:
+            for i in scene.children():
+                scene.node(i)
+
+    rst = {
+        "json_save": timeit(jsonSave),
+        "binary_save": timeit(lambda: dump(tree, tmp_bin)),
+        "json_load": timeit(lambda: json.load(open(tmp_json))),
+        "binary_load": timeit(lambda: load(tmp_bin)),
+        "binary_open_top_level": timeit(binaryLazy),
+        "json_bytes": os.path.getsize(tmp_json),
+        "binary_bytes": os.path.getsize(tmp_bin),
+    }
+    try:
+        rst.update(benchModel(tree, tmp_bin, timeit))
+    except ImportError as e:
+        print("skip DataModel timings:", e)
+    os.remove(tmp_json)
+    os.remove(tmp_bin)
+    return rst
+
+def benchModel(tree, path, timeit):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide2.QtWidgets import QApplication
+    from model import DataModel
+    app = QApplication.instance() or QApplication([])
+    model = DataModel(path=path + ".model.json")
+
+    def loadJson():
+        model.clearData()
+        for entry in tree:
+            model.loadData(entry, 0)
+
+    def loadBinary():
+        model.clearData()
+        with BinaryScene(path) as scene:
+            model.loadScene(scene)
+
+    rst = {
+        "model_load_json": timeit(loadJson),
+        "model_load_binary": timeit(loadBinary),
+        "model_dump_json": timeit(lambda: json.dumps(model.dumpData(0))),
+        "model_dump_binary": timeit(model.dumpBinary),
+    }
+    model._save_timer.stop()
+    model._writer.close()
+    return rst
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == "convert":
+        convert(sys.argv[2], sys.argv[3])
+    elif len(sys.argv) == 3 and sys.argv[1] == "bench":
+        print(json.dumps(bench(sys.argv[2]), indent=2))
+    else:
+        print("usage: binscene.py convert SRC DST | bench SCENE.json")
+        sys.exit(1)
@@ -0,0 +1,95 @@
+import weakref
+import numpy as np
+
+# grid cells along the longest side for each level after the full mesh
+LOD_LEVELS = (96, 32, 12)
+
+def cluster(mesh, resolution):
+    """ Vertex clustering decimation on a uniform grid, returns a new STLMesh """
+    tri = mesh.triangles()
+    if len(tri) == 0:
+        return mesh
+    lo = np.asarray(mesh.bounds[0], dtype=np.float64)
+    hi = np.asarray(mesh.bounds[1], dtype=np.float64)
+    cell = max((hi - lo).max() / resolution, 1e-12)
+    dims = np.maximum(np.ceil((hi - lo) / cell).astype(np.int64), 1) + 1
+
+    points = tri.reshape(-1, 3)
+    q = np.floor((points - lo) / cell).astype(np.int64)
+    cells = (q[:, 0] * dims[1] + q[:, 1]) * dims[2] + q[:, 2]
+    uniq, inverse = np.unique(cells, return_inverse=True)
+    inverse = inverse.ravel()
+
+    # each cluster collapses to the mean of its vertices
+    counts = np.bincount(inverse, minlength=len(uniq)).astype(np.float64)
+    centers = np.empty((len(uniq), 3), dtype=np.float64)
+    for axis in range(3):
+        centers[:, axis] = np.bincount(inverse, weights=points[:, axis], minlength=len(uniq)) / counts
+
+    faces = inverse.reshape(-1, 3)
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    faces = faces[keep]
+    if len(faces):
+        # drop duplicates of the same triangle with the same winding
+        _, first = np.unique(_canonical(faces), axis=0, return_index=True)
+        faces = faces[np.sort(first)]
+    out = centers[faces].astype(np.float32)
+    import stlloader
+    lod = stlloader.STLMesh(mesh.path, stlloader.buildBuffer(out), mesh.parse_time, bounds=mesh.bounds)
+    return stlloader.weld(lod)
+
+def _canonical(faces):
+    """ Rotates each triangle so its smallest index comes first, keeping the winding """
+    shift = faces.argmin(axis=1)
+    idx = (np.arange(3)[None, :] + shift[:, None]) % 3
+    return np.take_along_axis(faces, idx, axis=1)
+
+def buildLODs(mesh, levels=LOD_LEVELS, disk=None, key=None):
+    """ Decimated versions of mesh, coarsest last, levels that barely reduce are skipped """
+    rst = []
+    last = mesh.triangle_count
+    for res in levels:
+        if disk is not None and key is not None:
+            lod = disk.loadLOD(mesh, key, res, cluster)
+        else:
+            lod = cluster(mesh, res)
+        if lod.triangle_count == 0 or lod.triangle_count > last * 0.7:
+            continue
+        rst.append(lod)
+        last = lod.triangle_count
+    return rst
+
+class LODSettings():
+    def __init__(self):
+        self.levels = LOD_LEVELS
+        # projected size in pixels below which the next level is used
+        self.thresholds = [240.0, 80.0, 24.0]
+        self.camera = None
+        self.drag_lowest = False
+        self.force_lowest = False
+        self._users = weakref.WeakSet()
+
+    def register(self, obj):
+        self._users.add(obj)
+
+    def unregister(self, obj):
+        self._users.discard(obj)
+
+    def setForceLowest(self, on):
+        if on == self.force_lowest:
+            return
+        self.force_lowest = on
+        for obj in list(self._users):
+            obj.applyLOD()
+
+    def dragging(self, on):
+        if self.drag_lowest:
+            self.setForceLowest(on)
+
+_settings = None
+
+def lodSettings():
+    global _settings
+    if _settings is None:
+        _settings = LODSettings()
+    return _settings
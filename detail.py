@@ -1,5 +1,6 @@
-from PySide2.QtCore import(Property, QObject, QPropertyAnimation, Signal)
-from PySide2.QtWidgets import *
+from PySide2.QtCore import QTimer
+from PySide2.QtWidgets import (QCheckBox, QDoubleSpinBox, QFileDialog, QFormLayout, QGroupBox,
+    QHBoxLayout, QLineEdit, QPushButton, QSpinBox, QVBoxLayout, QWidget)
 
 class ObjectDetail(QVBoxLayout):
     def __init__(self):
@@ -97,55 +98,104 @@ class ObjectDetail(QVBoxLayout):
         self._stl_layout.addWidget(self._stl_button)
         self.addWidget(self._stl_detail)
 
+        self._group_detail = QGroupBox()
+        self._group_detail.setTitle("Group")
+        self._group_layout = QVBoxLayout()
+        self._group_detail.setLayout(self._group_layout)
+        self._group_instanced = QCheckBox("Instanced rendering")
+        self._group_instanced.toggled.connect(self.callback("instanced", debounce=False))
+        self._group_layout.addWidget(self._group_instanced)
+        self.addWidget(self._group_detail)
+
         self._name_detail.hide()
         self._co_detail.hide()
         self._color_detail.hide()
         self._box_detail.hide()
         self._sphere_detail.hide()
         self._stl_detail.hide()
+        self._group_detail.hide()
 
         self._sel = 0
         self._callback = None
+        self._preview = None
+
+        # a burst of edits is previewed live and sent to the model once
+        self._pending = {}
+        self._pending_sel = 0
+        self._commit_timer = QTimer(self)
+        self._commit_timer.setSingleShot(True)
+        self._commit_timer.setInterval(300)
+        self._commit_timer.timeout.connect(self.commitEdits)
     
     def setCallback(self, fn):
         self._callback = fn
-        
+
+    def setEditable(self, on):
+        """ Locks every field, e.g. while the scene is still loading """
+        for w in [self._name_detail, self._co_detail, self._color_detail, self._box_detail,
+                self._sphere_detail, self._stl_detail, self._group_detail]:
+            w.setEnabled(on)
+
+    def setPreviewCallback(self, fn):
+        self._preview = fn
+
+    def setWidget(self, w, value):
+        """ Updates a widget only when it shows something else, without echoing the edit back """
+        if isinstance(w, QLineEdit):
+            if w.text() == value:
+                return
+            w.blockSignals(True)
+            w.setText(value)
+        elif isinstance(w, QCheckBox):
+            if w.isChecked() == value:
+                return
+            w.blockSignals(True)
+            w.setChecked(value)
+        else:
+            if w.value() == value:
+                return
+            w.blockSignals(True)
+            w.setValue(value)
+        w.blockSignals(False)
+
     def updateValue(self, sel, data):
-        self._sel = 0
+        if sel != self._pending_sel:
+            self.commitEdits()
         if data.type == "entity":
             self._name_detail.show()
             self._co_detail.show()
             self._color_detail.show()
+            self._group_detail.hide()
 
-            self._name.setText(data.name)
-            self._translate_control["x"].setValue(data.dx)
-            self._translate_control["y"].setValue(data.dy)
-            self._translate_control["z"].setValue(data.dz)
-            self._rotate_control["x"].setValue(data.rx)
-            self._rotate_control["y"].setValue(data.ry)
-            self._rotate_control["z"].setValue(data.rz)
+            self.setWidget(self._name, data.name)
+            self.setWidget(self._translate_control["x"], data.dx)
+            self.setWidget(self._translate_control["y"], data.dy)
+            self.setWidget(self._translate_control["z"], data.dz)
+            self.setWidget(self._rotate_control["x"], data.rx)
+            self.setWidget(self._rotate_control["y"], data.ry)
+            self.setWidget(self._rotate_control["z"], data.rz)
             r, g, b = data.color
-            self._color_control["r"][1].setValue(r)
-            self._color_control["g"][1].setValue(g)
-            self._color_control["b"][1].setValue(b)
+            self.setWidget(self._color_control["r"][1], r)
+            self.setWidget(self._color_control["g"][1], g)
+            self.setWidget(self._color_control["b"][1], b)
             
             if data.shape == "box":
                 self._box_detail.show()
                 self._sphere_detail.hide()
                 self._stl_detail.hide()
-                self._box_control["length"].setValue(data.length)
-                self._box_control["width" ].setValue(data.width)
-                self._box_control["height"].setValue(data.height)
+                self.setWidget(self._box_control["length"], data.length)
+                self.setWidget(self._box_control["width" ], data.width)
+                self.setWidget(self._box_control["height"], data.height)
             elif data.shape == 'sphere':
                 self._box_detail.hide()
                 self._sphere_detail.show()
                 self._stl_detail.hide()
-                self._sphere_radius.setValue(data.radius)
+                self.setWidget(self._sphere_radius, data.radius)
             elif data.shape == 'stl':
                 self._box_detail.hide()
                 self._sphere_detail.hide()
                 self._stl_detail.show()
-                self._stl_scale.setValue(data.scale)
+                self.setWidget(self._stl_scale, data.scale)
             else:
                 self._box_detail.hide()
                 self._sphere_detail.hide()
@@ -156,14 +206,16 @@ class ObjectDetail(QVBoxLayout):
             self._box_detail.hide()
             self._sphere_detail.hide()
             self._stl_detail.hide()
+            self._group_detail.show()
 
-            self._name.setText(data.name)
-            self._translate_control["x"].setValue(data.dx)
-            self._translate_control["y"].setValue(data.dy)
-            self._translate_control["z"].setValue(data.dz)
-            self._rotate_control["x"].setValue(data.rx)
-            self._rotate_control["y"].setValue(data.ry)
-            self._rotate_control["z"].setValue(data.rz)
+            self.setWidget(self._name, data.name)
+            self.setWidget(self._group_instanced, data.instanced)
+            self.setWidget(self._translate_control["x"], data.dx)
+            self.setWidget(self._translate_control["y"], data.dy)
+            self.setWidget(self._translate_control["z"], data.dz)
+            self.setWidget(self._rotate_control["x"], data.rx)
+            self.setWidget(self._rotate_control["y"], data.ry)
+            self.setWidget(self._rotate_control["z"], data.rz)
         else:
             self._name_detail.hide()
             self._co_detail.hide()
@@ -171,18 +223,39 @@ class ObjectDetail(QVBoxLayout):
             self._box_detail.hide()
             self._sphere_detail.hide()
             self._stl_detail.hide()
+            self._group_detail.hide()
         self._sel = sel
 
-    def callback(self, field):
+    def callback(self, field, debounce=True):
         def fn(value):
-            if self._sel != 0:
+            if self._sel == 0:
+                return
+            if not debounce:
+                self.commitEdits()
                 if self._callback is not None:
                     self._callback(self._sel, **{ field: value })
+                return
+            if self._pending_sel != self._sel:
+                self.commitEdits()
+            self._pending_sel = self._sel
+            self._pending[field] = value
+            if self._preview is not None:
+                self._preview(self._sel, **{ field: value })
+            self._commit_timer.start()
         return fn
+
+    def commitEdits(self):
+        self._commit_timer.stop()
+        if not self._pending:
+            return
+        pending = self._pending
+        self._pending = {}
+        if self._callback is not None and self._pending_sel != 0:
+            self._callback(self._pending_sel, **pending)
     
     def stlOpenFile(self):
         print("stl open file")
         fname = QFileDialog.getOpenFileName(None, "Open file", "", "STL (*.stl)")
         print(fname)
         if fname[0] != '':
-            self.callback("url")(fname[0])
\ No newline at end of file
+            self.callback("url", debounce=False)(fname[0])
\ No newline at end of file
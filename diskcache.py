@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import numpy as np
+import stlloader
+
+CACHE_DIR = os.path.expanduser("~/.pyqt3dviewer/cache")
+
+class DiskCache():
+    def __init__(self, root=CACHE_DIR, cap=2 << 30):
+        self.root = root
+        self.cap = cap
+        self.hits = 0
+        self.misses = 0
+
+    def entryDir(self, key, lod=None):
+        if lod is not None:
+            key = "{}-lod{}".format(key, lod)
+        return os.path.join(self.root, "{}-v{}".format(key, stlloader.LOADER_VERSION))
+
+    def load(self, path, key, progress=None):
+        """ Returns the welded mesh for path, from the cache when possible """
+        mesh = self.read(self.entryDir(key), path)
+        if mesh is not None:
+            self.hits += 1
+            return mesh
+        self.misses += 1
+        mesh = stlloader.weld(stlloader.load(path, progress))
+        try:
+            self.write(self.entryDir(key), mesh)
+            self.trim()
+        except OSError as e:
+            print("mesh cache write failed:", e)
+        return mesh
+
+    def loadLOD(self, mesh, key, res, make):
+        """ Returns the welded level `res` of mesh, built by make(mesh, res) on a miss """
+        d = self.entryDir(key, res)
+        lod = self.read(d, mesh.path)
+        if lod is not None:
+            return lod
+        lod = stlloader.weld(make(mesh, res))
+        try:
+            self.write(d, lod)
+        except OSError as e:
+            print("mesh cache write failed:", e)
+        return lod
+
+    def read(self, d, path):
+        meta = os.path.join(d, "meta.json")
+        try:
+            info = json.load(open(meta))
+            buffer = np.load(os.path.join(d, "buffer.npy"), mmap_mode="r")
+            indices = np.load(os.path.join(d, "index.npy"), mmap_mode="r")
+            # mtime is the last use for trimming
+            os.utime(meta)
+        except (OSError, ValueError):
+            return None
+        bounds = tuple(tuple(b) for b in info["bounds"])
+        return stlloader.STLMesh(path, buffer, info["parse_time"], indices, bounds)
+
+    def write(self, d, mesh):
+        os.makedirs(self.root, exist_ok=True)
+        # private to this write, workers may store the same key at once
+        tmp = tempfile.mkdtemp(prefix=os.path.basename(d) + ".tmp", dir=self.root)
+        np.save(os.path.join(tmp, "buffer.npy"), mesh.buffer)
+        np.save(os.path.join(tmp, "index.npy"), mesh.indices)
+        with open(os.path.join(tmp, "meta.json"), "w") as fp:
+            json.dump({
+                "source": mesh.path,
+                "triangles": mesh.triangle_count,
+                "bounds": mesh.bounds,
+                "parse_time": mesh.parse_time,
+                "version": stlloader.LOADER_VERSION,
+            }, fp)
+        try:
+            os.replace(tmp, d)
+        except OSError:
+            # another worker stored the same key first
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def entries(self):
+        """ (dir, bytes, last use) of every stored mesh, oldest first """
+        rst = []
+        if not os.path.isdir(self.root):
+            return rst
+        for name in os.listdir(self.root):
+            d = os.path.join(self.root, name)
+            if not os.path.isdir(d) or ".tmp" in name:
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(d, f)) for f in os.listdir(d))
+                used = os.path.getmtime(os.path.join(d, "meta.json"))
+            except OSError:
+                used = 0
+                size = 0
+            rst.append((d, size, used))
+        rst.sort(key=lambda e: e[2])
+        return rst
+
+    def trim(self, cap=None):
+        if cap is None:
+            cap = self.cap
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        removed = 0
+        for d, size, _ in entries:
+            if total <= cap:
+                break
+            shutil.rmtree(d, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def clean(self, everything=False):
+        """ Removes stale loader versions and leftovers, or everything """
+        if not os.path.isdir(self.root):
+            return 0
+        suffix = "-v{}".format(stlloader.LOADER_VERSION)
+        removed = 0
+        for name in os.listdir(self.root):
+            if everything or not name.endswith(suffix):
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                removed += 1
+        return removed
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(e[1] for e in entries),
+            "cap": self.cap,
+        }
+
+def sceneURLs(path):
+    """ STL files referenced by a .json or .p3ds scene """
+    import binscene
+    if binscene.isBinary(path):
+        tree = binscene.load(path)
+    else:
+        tree = json.load(open(path))
+        if isinstance(tree, dict):
+            tree = tree["scene"]
+    rst = []
+    def walk(entries):
+        for e in entries:
+            if e["type"] == "group":
+                walk(e["children"])
+            elif e.get("shape") == "stl" and e.get("url"):
+                rst.append(e["url"])
+    walk(tree)
+    return sorted(set(rst))
+
+def prewarm(cache, scene, lod_levels=None):
+    from meshcache import fileHash
+    import decimate
+    if lod_levels is None:
+        lod_levels = decimate.LOD_LEVELS
+    for url in sceneURLs(scene):
+        start = time.perf_counter()
+        try:
+            key = fileHash(url)
+            mesh = cache.load(url, key)
+            decimate.buildLODs(mesh, lod_levels, cache, key)
+        except (OSError, ValueError) as e:
+            print("skip {}: {}".format(url, e))
+            continue
+        print("{} {} triangles {:.3f}s".format(url, mesh.triangle_count, time.perf_counter() - start))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="preprocessed STL cache")
+    parser.add_argument("--cap-mb", type=int, default=2048)
+    sub = parser.add_subparsers(dest="cmd")
+    sub.add_parser("stats")
+    clean = sub.add_parser("clean")
+    clean.add_argument("--all", action="store_true", help="remove every cached mesh")
+    warm = sub.add_parser("prewarm")
+    warm.add_argument("scene", nargs="+")
+    args = parser.parse_args()
+
+    cache = DiskCache(cap=args.cap_mb << 20)
+    if args.cmd == "stats":
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.cmd == "clean":
+        print("removed", cache.clean(args.all) + cache.trim())
+    elif args.cmd == "prewarm":
+        for scene in args.scene:
+            prewarm(cache, scene)
+    else:
+        parser.print_help()
+        sys.exit(1)
@@ -0,0 +1,316 @@
+import os
+import sys
+import json
+import time
+import shutil
+import struct
+import argparse
+import numpy as np
+import stlloader
+from scenestore import KINDS
+from spatial import TransformCache
+from scenecore import SceneCore, scene_store
+
+# triangles transformed per numpy step, bounds the memory of an export
+CHUNK_TRIANGLES = 1 << 18
+
+# tessellation of spheres, QSphereMesh's defaults
+SPHERE_RINGS = 16
+SPHERE_SLICES = 16
+
+def unitBox():
+    """ (12, 3, 3) triangles of the cube [-0.5, 0.5]^3, wound outwards """
+    c = np.array([[x, y, z] for x in (-0.5, 0.5) for y in (-0.5, 0.5) for z in (-0.5, 0.5)])
+    quads = [(0, 1, 3, 2), (4, 6, 7, 5), (0, 4, 5, 1), (2, 3, 7, 6), (0, 2, 6, 4), (1, 5, 7, 3)]
+    return np.array([c[[a, b, d]] for q in quads for a, b, d in
+        ((q[0], q[1], q[2]), (q[0], q[2], q[3]))], dtype=np.float32)
+
+def unitSphere(rings=SPHERE_RINGS, slices=SPHERE_SLICES):
+    """ Triangles of a radius 1 UV sphere around the y axis, pole caps without degenerate faces """
+    theta = np.linspace(0, np.pi, rings + 1)
+    phi = np.linspace(0, 2 * np.pi, slices + 1)
+    p = np.stack([
+        np.sin(theta)[:, None] * np.cos(phi)[None, :],
+        np.repeat(np.cos(theta)[:, None], slices + 1, axis=1),
+        -np.sin(theta)[:, None] * np.sin(phi)[None, :],
+    ], axis=-1)
+    tri = []
+    for i in range(rings):
+        for j in range(slices):
+            a, b, c, d = p[i, j], p[i + 1, j], p[i + 1, j + 1], p[i, j + 1]
+            if i != 0:
+                tri.append((a, b, d))
+            if i != rings - 1:
+                tri.append((b, c, d))
+    return np.array(tri, dtype=np.float32)
+
+def stlTriangles(path):
+    """ Triangles of an STL file, binary files stay memory-mapped """
+    if stlloader.isBinary(path):
+        return stlloader.readBinary(path)[0]
+    return stlloader.readASCII(path)[0]
+
+def bake(matrices, tri):
+    """ Yields (k, 3, 3) world triangles of the mesh tri under each (4, 4) matrix, chunk by chunk
+
+    The second value is the index of the matrix the triangles belong to
+    (one per triangle), so callers can look up per-instance colors.
+    """
+    tri = np.asarray(tri)
+    n = len(tri)
+    if n == 0 or len(matrices) == 0:
+        return
+    if n <= CHUNK_TRIANGLES:
+        # many instances of a small mesh per step
+        verts = tri.reshape(-1, 3).astype(np.float64)
+        step = max(1, CHUNK_TRIANGLES // n)
+        for start in range(0, len(matrices), step):
+            m = matrices[start:start + step]
+            out = np.einsum("kij,vj->kvi", m[:, :3, :3], verts) + m[:, None, :3, 3]
+            owner = np.repeat(np.arange(start, start + len(m)), n)
+            yield out.reshape(-1, 3, 3).astype(np.float32), owner
+        return
+    # a large mesh is streamed per instance
+    for k, m in enumerate(matrices):
+        for start in range(0, n, CHUNK_TRIANGLES):
+            verts = np.asarray(tri[start:start + CHUNK_TRIANGLES], dtype=np.float64).reshape(-1, 3)
+            out = verts @ m[:3, :3].T + m[:3, 3]
+            yield out.reshape(-1, 3, 3).astype(np.float32), np.full(len(out) // 3, k)
+
+def sceneTriangles(scene):
+    """ Yields (triangles, colors) chunks of every entity of a SceneCore in world space
+
+    World matrices come from one TransformCache pass over the tree from
+    root 0. Box sizes and sphere radii are folded into the matrices, so all
+    boxes share one unit mesh and all spheres another.
+    """
+    cache = TransformCache(scene._data, scene_store)
+    cache.update()
+    rows = np.nonzero(cache.entity)[0]
+    if len(rows) == 0:
+        return
+    store = cache.store
+    srow = cache.srow[rows]
+    world = cache.world[rows]
+    kind = store.kind[srow]
+    size = store.size[srow]
+    color = store.color[srow]
+
+    box = kind == KINDS["box"]
+    if box.any():
+        m = world[box] @ scaleMatrices(size[box])
+        colors = color[box]
+        for tri, owner in bake(m, unitBox()):
+            yield tri, colors[owner]
+    sphere = kind == KINDS["sphere"]
+    if sphere.any():
+        m = world[sphere] @ scaleMatrices(np.repeat(size[sphere][:, :1], 3, axis=1))
+        colors = color[sphere]
+        for tri, owner in bake(m, unitSphere()):
+            yield tri, colors[owner]
+    # each STL file is read once for all entities that show it
+    stl = np.nonzero(kind == KINDS["stl"])[0]
+    urls = {}
+    for k in stl.tolist():
+        url = scene._data[cache.idOf(int(rows[k]))].url
+        if url is not None:
+            urls.setdefault(url, []).append(k)
+    for url, ks in urls.items():
+        try:
+            tri = stlTriangles(url)
+        except (OSError, ValueError) as e:
+            print("skip {}: {}".format(url, e))
+            continue
+        colors = color[ks]
+        for out, owner in bake(world[ks], tri):
+            yield out, colors[owner]
+
+def scaleMatrices(scale):
+    m = np.zeros((len(scale), 4, 4))
+    m[:, 0, 0] = scale[:, 0]
+    m[:, 1, 1] = scale[:, 1]
+    m[:, 2, 2] = scale[:, 2]
+    m[:, 3, 3] = 1
+    return m
+
+def faceNormals(tri):
+    n = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    length = np.linalg.norm(n, axis=1)
+    ok = length > 0
+    n[ok] /= length[ok, None]
+    # degenerate faces still need a unit normal in glTF
+    n[~ok] = (0, 0, 1)
+    return n.astype(np.float32, copy=False)
+
+class STLWriter():
+    """ Binary STL written facet chunk by facet chunk, the count is patched in on close """
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._fp = open(path, "wb")
+        self._fp.write(b"pyqt3dviewer export".ljust(80, b" "))
+        self._fp.write(struct.pack("<I", 0))
+
+    def write(self, tri, color):
+        facets = np.zeros(len(tri), dtype=stlloader.BINARY_FACET)
+        facets["normal"] = faceNormals(tri)
+        facets["v"] = tri
+        self._fp.write(facets.tobytes())
+        self.count += len(tri)
+        if self.count >= 1 << 32:
+            raise ValueError("more than 2^32 triangles do not fit a binary STL")
+
+    def close(self):
+        self._fp.seek(80)
+        self._fp.write(struct.pack("<I", self.count))
+        self._fp.close()
+
+# sRGB scene colors to the linear values glTF expects for COLOR_0
+SRGB_TO_LINEAR = np.round(
+    np.where(np.arange(256) / 255 <= 0.04045, np.arange(256) / 255 / 12.92,
+        ((np.arange(256) / 255 + 0.055) / 1.055) ** 2.4) * 255).astype(np.uint8)
+
+VERTEX = np.dtype([("position", "<f4", (3,)), ("normal", "<f4", (3,)), ("color", "u1", (4,))])
+
+class GLTFWriter():
+    """ One flat-shaded triangle list with per-vertex colors, as .gltf + .bin or .glb
+
+    Vertices go straight to the .bin file, or for .glb to a spill file that
+    is copied behind the JSON chunk once the counts and bounds are known.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.binary = path.lower().endswith(".glb")
+        self.bin_path = path + ".bin.tmp" if self.binary else os.path.splitext(path)[0] + ".bin"
+        self.count = 0
+        self.lo = np.full(3, np.inf)
+        self.hi = np.full(3, -np.inf)
+        self._fp = open(self.bin_path, "wb")
+
+    def write(self, tri, color):
+        v = np.empty((len(tri), 3), dtype=VERTEX)
+        v["position"] = tri
+        v["normal"] = faceNormals(tri)[:, None, :]
+        v["color"][:, :, :3] = SRGB_TO_LINEAR[color][:, None, :]
+        v["color"][:, :, 3] = 255
+        self._fp.write(v.tobytes())
+        self.count += len(tri) * 3
+        flat = tri.reshape(-1, 3)
+        self.lo = np.minimum(self.lo, flat.min(axis=0))
+        self.hi = np.maximum(self.hi, flat.max(axis=0))
+        if self.binary and self.count * VERTEX.itemsize >= (1 << 32) - (1 << 20):
+            raise ValueError("the scene does not fit a 4 GB .glb, export to .gltf or .stl")
+
+    def document(self):
+        size = self.count * VERTEX.itemsize
+        doc = {
+            "asset": { "version": "2.0", "generator": "pyqt3dviewer export.py" },
+            "scene": 0,
+            "scenes": [{ "nodes": [] }],
+            "nodes": [],
+        }
+        if self.count == 0:
+            return doc
+        buffer = { "byteLength": size }
+        if not self.binary:
+            buffer["uri"] = os.path.basename(self.bin_path)
+        doc["scenes"][0]["nodes"] = [0]
+        doc["nodes"] = [{ "name": "scene", "mesh": 0 }]
+        doc["meshes"] = [{ "primitives": [{ "mode": 4, "material": 0,
+            "attributes": { "POSITION": 0, "NORMAL": 1, "COLOR_0": 2 } }] }]
+        doc["materials"] = [{ "pbrMetallicRoughness": {
+            "baseColorFactor": [1, 1, 1, 1], "metallicFactor": 0, "roughnessFactor": 1 } }]
+        doc["buffers"] = [buffer]
+        doc["bufferViews"] = [{ "buffer": 0, "byteOffset": 0, "byteLength": size,
+            "byteStride": VERTEX.itemsize, "target": 34962 }]
+        doc["accessors"] = [
+            { "bufferView": 0, "byteOffset": 0, "componentType": 5126, "count": self.count,
+                "type": "VEC3", "min": self.lo.tolist(), "max": self.hi.tolist() },
+            { "bufferView": 0, "byteOffset": 12, "componentType": 5126, "count": self.count,
+                "type": "VEC3" },
+            { "bufferView": 0, "byteOffset": 24, "componentType": 5121, "normalized": True,
+                "count": self.count, "type": "VEC4" },
+        ]
+        return doc
+
+    def close(self):
+        self._fp.close()
+        text = json.dumps(self.document()).encode()
+        if not self.binary:
+            with open(self.path, "wb") as fp:
+                fp.write(text)
+            return
+        text += b" " * (-len(text) % 4)
+        size = os.path.getsize(self.bin_path)
+        total = 12 + 8 + len(text) + (8 + size if size else 0)
+        with open(self.path, "wb") as fp:
+            fp.write(struct.pack("<III", 0x46546C67, 2, total))
+            fp.write(struct.pack("<II", len(text), 0x4E4F534A))
+            fp.write(text)
+            if size:
+                fp.write(struct.pack("<II", size, 0x004E4942))
+                with open(self.bin_path, "rb") as src:
+                    shutil.copyfileobj(src, fp, 1 << 24)
+        os.remove(self.bin_path)
+
+def meshWriter(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".stl":
+        return STLWriter(path)
+    if ext in (".glb", ".gltf"):
+        return GLTFWriter(path)
+    raise ValueError("unknown mesh format " + ext + ", use .stl, .glb or .gltf")
+
+def loadReferences(scene):
+    """ Builds the payloads of every referenced group, nested ones included """
+    scene.payload_budget = float("inf")
+    tried = set()
+    while True:
+        # missing or cyclic references stay unloaded and are not retried
+        pending = [i for i in scene._refs if i in scene._data
+            and scene._data[i].payload is None and i not in tried]
+        if not pending:
+            return
+        for i in pending:
+            tried.add(i)
+            scene.loadPayload(i)
+
+def exportScene(scene, path):
+    """ Writes all entities of a SceneCore (or DataModel) as one mesh, returns the triangle count """
+    writer = meshWriter(path)
+    triangles = 0
+    try:
+        for tri, color in sceneTriangles(scene):
+            writer.write(tri, color)
+            triangles += len(tri)
+    finally:
+        writer.close()
+    return triangles
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="flatten a scene into one mesh file")
+    parser.add_argument("scene", help="scene file, .json or binary .p3ds")
+    parser.add_argument("out", help="mesh file, .stl (binary), .glb or .gltf")
+    parser.add_argument("--no-refs", action="store_true",
+        help="leave out the content of referenced scene files")
+    args = parser.parse_args()
+    if not os.path.exists(args.scene):
+        print("no such scene:", args.scene)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    # the source scene and its journal are left exactly as they are
+    scene = SceneCore(path=args.scene, readonly=True)
+    if not args.no_refs:
+        loadReferences(scene)
+    loaded = time.perf_counter()
+    try:
+        triangles = exportScene(scene, args.out)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    finally:
+        scene.close()
+    print("{} nodes, {} triangles to {} ({} bytes) in {:.2f}s, scene loaded in {:.2f}s".format(
+        len(scene._data) - 1, triangles, args.out, os.path.getsize(args.out),
+        time.perf_counter() - start, loaded - start))
@@ -0,0 +1,110 @@
+import json
+import time
+from collections import deque
+import numpy as np
+
+# bytes of undo and redo records kept before the oldest are dropped
+UNDO_BUDGET = 64 << 20
+
+def recordSize(rec):
+    """ Rough memory of a record, exact for numpy columns """
+    n = 64
+    for k, v in rec.items():
+        if k == "steps":
+            n += sum(recordSize(step) for step in v)
+        elif isinstance(v, np.ndarray):
+            n += v.nbytes
+        elif isinstance(v, (dict, list)):
+            n += len(json.dumps(v, default=lambda o: None))
+    return n
+
+class SceneHistory():
+    """ Undo and redo stacks of edits stored as old and new values
+
+    A record is a dict with an "op" like a journal record. Column edits keep
+    the ids and the old and new rows as numpy arrays, so undoing a bulk edit
+    is one store write. Records pushed between begin() and the matching end()
+    become one step, and a "set" of the same fields of the same node within
+    merge_window seconds of the previous one is folded into it.
+    """
+    def __init__(self, max_bytes=UNDO_BUDGET, merge_window=1.0):
+        self.max_bytes = max_bytes
+        self.merge_window = merge_window
+        self.undo = deque()
+        self.redo = []
+        self.size = 0
+        self.evicted = 0
+        self._depth = 0
+        self._steps = []
+
+    def begin(self):
+        self._depth += 1
+
+    def end(self):
+        self._depth -= 1
+        if self._depth == 0 and self._steps:
+            steps = self._steps
+            self._steps = []
+            self.push(steps[0] if len(steps) == 1 else { "op": "steps", "steps": steps })
+
+    def record(self, rec):
+        if self._depth > 0:
+            self._steps.append(rec)
+        else:
+            self.push(rec)
+
+    def push(self, rec):
+        now = time.perf_counter()
+        last = self.undo[-1] if self.undo else None
+        if last is not None and now - last["time"] <= self.merge_window and self.sameTarget(last, rec):
+            self.size -= last["bytes"]
+            last["new"] = rec["new"]
+            last["bytes"] = recordSize(last)
+            last["time"] = now
+            self.size += last["bytes"]
+        else:
+            rec["time"] = now
+            rec["bytes"] = recordSize(rec)
+            self.undo.append(rec)
+            self.size += rec["bytes"]
+        self.size -= sum(r["bytes"] for r in self.redo)
+        self.redo = []
+        self.trim()
+
+    def sameTarget(self, last, rec):
+        return (last["op"] == "set" and rec["op"] == "set" and last["id"] == rec["id"]
+            and last["new"].keys() == rec["new"].keys())
+
+    def trim(self):
+        """ Drops the oldest undo steps past max_bytes, always keeping the newest """
+        while self.size > self.max_bytes and len(self.undo) > 1:
+            self.size -= self.undo.popleft()["bytes"]
+            self.evicted += 1
+
+    def takeUndo(self):
+        if not self.undo:
+            return None
+        rec = self.undo.pop()
+        self.redo.append(rec)
+        if self.undo:
+            # a new edit after an undo starts its own step
+            self.undo[-1]["time"] = float("-inf")
+        return rec
+
+    def takeRedo(self):
+        if not self.redo:
+            return None
+        rec = self.redo.pop()
+        self.undo.append(rec)
+        # nothing newer may be merged into a step that was undone and redone
+        rec["time"] = float("-inf")
+        return rec
+
+    def clear(self):
+        self.undo.clear()
+        self.redo = []
+        self.size = 0
+
+    def stats(self):
+        return { "undo": len(self.undo), "redo": len(self.redo), "bytes": self.size,
+            "max_bytes": self.max_bytes, "evicted": self.evicted }
@@ -0,0 +1,173 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PySide2.QtCore import QObject, Signal, Slot
+import stlloader
+from meshcache import meshCache
+from tracing import tracer
+
+class ImportTicket():
+    def __init__(self, path, callback):
+        self.path = path
+        self.callback = callback
+        self.progress = 0.0
+        self.cancelled = False
+        self.build = None
+        self.load = None
+
+class PendingLoad():
+    """ One parse of a file, shared by every ticket requesting it meanwhile """
+    def __init__(self, path):
+        self.path = path
+        self.tickets = []
+        self.progress = 0.0
+        self.future = None
+
+    @property
+    def cancelled(self):
+        return all(t.cancelled for t in self.tickets)
+
+    def attach(self, ticket):
+        ticket.load = self
+        ticket.progress = self.progress
+        self.tickets.append(ticket)
+
+class MeshImporter(QObject):
+    # emitted from the workers, delivered on the GUI thread
+    _done = Signal(object, object)
+    _progress = Signal(object, float)
+
+    fileProgress = Signal(str, float)
+    activity = Signal(int, float)
+
+    def __init__(self, workers=None):
+        super().__init__()
+        if workers is None:
+            # leave one core to the GUI thread
+            workers = max(1, (os.cpu_count() or 2) - 1)
+        self.workers = workers
+        self.sync = False
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="MeshImporter")
+        # absolute path -> PendingLoad, so concurrent requests parse a file once
+        self._pending = {}
+        self._done.connect(self._onDone)
+        self._progress.connect(self._onProgress)
+
+    def request(self, path, callback, build=None):
+        """ Loads path through the mesh cache, callback(entry, error) runs on the GUI thread """
+        ticket = ImportTicket(path, callback)
+        ticket.build = build
+        if self.sync:
+            load = PendingLoad(path)
+            load.attach(ticket)
+            self._onDone(load, self._work(load))
+            return ticket
+        load = self._pending.get(os.path.abspath(path)) or self._submit(path)
+        load.attach(ticket)
+        self._emitActivity()
+        return ticket
+
+    def _submit(self, path):
+        load = PendingLoad(path)
+        self._pending[os.path.abspath(path)] = load
+        load.future = self._pool.submit(self._run, load)
+        return load
+
+    def _work(self, load):
+        cache = meshCache()
+        try:
+            key = cache.keyOf(load.path)
+            if cache.contains(key):
+                return (key, None, None)
+            def progress(f):
+                if load.cancelled:
+                    raise stlloader.Cancelled()
+                if f - load.progress >= 0.01 or f >= 1:
+                    load.progress = f
+                    self._progress.emit(load, f)
+            with tracer().span("stl.load", path=load.path):
+                mesh = cache.load(load.path, key, progress)
+            return (key, mesh, None)
+        except (OSError, ValueError) as e:
+            return (None, None, e)
+
+    def _run(self, load):
+        try:
+            rst = self._work(load)
+        except stlloader.Cancelled:
+            rst = None
+        self._done.emit(load, rst)
+
+    @Slot(object, float)
+    def _onProgress(self, load, f):
+        if not load.cancelled:
+            for ticket in load.tickets:
+                ticket.progress = f
+            self.fileProgress.emit(load.path, f)
+            self._emitActivity()
+
+    def _forget(self, load):
+        name = os.path.abspath(load.path)
+        if self._pending.get(name) is load:
+            del self._pending[name]
+
+    @Slot(object, object)
+    def _onDone(self, load, rst):
+        self._forget(load)
+        tickets = [t for t in load.tickets if not t.cancelled]
+        if rst is None:
+            if tickets:
+                # requested again after the parse was stopped
+                retry = self._pending.get(os.path.abspath(load.path)) or self._submit(load.path)
+                for ticket in tickets:
+                    retry.attach(ticket)
+            self._emitActivity()
+            return
+        self._emitActivity()
+        if not tickets:
+            return
+        key, mesh, error = rst
+        self.fileProgress.emit(load.path, 1.0)
+        for ticket in tickets:
+            entry = None
+            if error is None:
+                try:
+                    entry = meshCache().acquireLoaded(key, mesh, ticket.build)
+                except KeyError:
+                    # evicted while the worker was running
+                    try:
+                        entry = meshCache().acquire(ticket.path, ticket.build)
+                    except (OSError, ValueError) as e:
+                        error = e
+            ticket.progress = 1.0
+            ticket.callback(entry, error)
+
+    def _emitActivity(self):
+        n = len(self._pending)
+        f = sum(load.progress for load in self._pending.values()) / n if n else 1.0
+        self.activity.emit(n, f)
+
+    def cancel(self, ticket):
+        ticket.cancelled = True
+        load = ticket.load
+        if load is not None and load.cancelled and load.future is not None and load.future.cancel():
+            # never started, no _onDone will follow
+            self._forget(load)
+            self._emitActivity()
+
+    def pending(self):
+        return len(self._pending)
+
+    def shutdown(self):
+        for load in list(self._pending.values()):
+            for ticket in load.tickets:
+                self.cancel(ticket)
+        self._pool.shutdown(wait=True)
+
+_importer = None
+
+def meshImporter():
+    """ The process-wide STL import pool """
+    global _importer
+    if _importer is None:
+        _importer = MeshImporter()
+    return _importer
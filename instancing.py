@@ -0,0 +1,149 @@
+import numpy as np
+from PySide2.QtCore import QByteArray
+from PySide2.Qt3DCore import Qt3DCore
+from PySide2.Qt3DExtras import Qt3DExtras
+from PySide2.Qt3DRender import Qt3DRender
+from spatial import eulerQuaternions
+from model import sharedParent
+
+# offset xyz, rotation quaternion xyzw, color rgb
+INSTANCE_FLOATS = 10
+
+VERTEX_SHADER = b"""
+#version 150 core
+in vec3 vertexPosition;
+in vec3 vertexNormal;
+in vec3 instanceOffset;
+in vec4 instanceRotation;
+in vec3 instanceColor;
+out vec3 worldNormal;
+out vec3 color;
+uniform mat4 modelMatrix;
+uniform mat3 modelNormalMatrix;
+uniform mat4 viewProjectionMatrix;
+
+vec3 rotate(vec4 q, vec3 v)
+{
+    return v + 2.0 * cross(q.xyz, cross(q.xyz, v) + q.w * v);
+}
+
+void main()
+{
+    vec3 p = rotate(instanceRotation, vertexPosition) + instanceOffset;
+    worldNormal = normalize(modelNormalMatrix * rotate(instanceRotation, vertexNormal));
+    color = instanceColor;
+    gl_Position = viewProjectionMatrix * modelMatrix * vec4(p, 1.0);
+}
+"""
+
+FRAGMENT_SHADER = b"""
+#version 150 core
+in vec3 worldNormal;
+in vec3 color;
+out vec4 fragColor;
+
+void main()
+{
+    vec3 light = normalize(vec3(-1.0, 1.0, 1.0));
+    float diffuse = max(dot(normalize(worldNormal), light), 0.0);
+    fragColor = vec4(color * (0.1 + 0.9 * diffuse), 1.0);
+}
+"""
+
+_material = None
+
+def instancedMaterial():
+    """ Shared shader material reading per-instance offset, rotation and color """
+    global _material
+    if _material is not None:
+        return _material
+    material = Qt3DRender.QMaterial(sharedParent())
+    effect = Qt3DRender.QEffect(material)
+    technique = Qt3DRender.QTechnique(effect)
+    api = technique.graphicsApiFilter()
+    api.setApi(Qt3DRender.QGraphicsApiFilter.OpenGL)
+    api.setProfile(Qt3DRender.QGraphicsApiFilter.CoreProfile)
+    api.setMajorVersion(3)
+    api.setMinorVersion(2)
+    key = Qt3DRender.QFilterKey(technique)
+    key.setName("renderingStyle")
+    key.setValue("forward")
+    technique.addFilterKey(key)
+    rpass = Qt3DRender.QRenderPass(technique)
+    program = Qt3DRender.QShaderProgram(rpass)
+    program.setVertexShaderCode(QByteArray(VERTEX_SHADER))
+    program.setFragmentShaderCode(QByteArray(FRAGMENT_SHADER))
+    rpass.setShaderProgram(program)
+    technique.addRenderPass(rpass)
+    effect.addTechnique(technique)
+    material.setEffect(effect)
+    _material = material
+    return material
+
+class InstancedBatch():
+    """ Draws the children of a group that share one primitive mesh in a single call """
+    def __init__(self, parent, key):
+        self.key = key
+        self.entity = Qt3DCore.QEntity(parent)
+        if key[0] == "box":
+            self.geometry = Qt3DExtras.QCuboidGeometry(self.entity)
+            self.geometry.setXExtent(key[1])
+            self.geometry.setYExtent(key[2])
+            self.geometry.setZExtent(key[3])
+        else:
+            self.geometry = Qt3DExtras.QSphereGeometry(self.entity)
+            self.geometry.setRadius(key[1])
+        self.data = np.zeros((0, INSTANCE_FLOATS), dtype=np.float32)
+        self._rows = {}
+
+        self.buffer = Qt3DRender.QBuffer(self.geometry)
+        stride = INSTANCE_FLOATS * 4
+        for name, size, offset in [("instanceOffset", 3, 0),
+                ("instanceRotation", 4, 12), ("instanceColor", 3, 28)]:
+            attr = Qt3DRender.QAttribute(self.geometry)
+            attr.setName(name)
+            attr.setAttributeType(Qt3DRender.QAttribute.VertexAttribute)
+            attr.setVertexBaseType(Qt3DRender.QAttribute.Float)
+            attr.setVertexSize(size)
+            attr.setByteOffset(offset)
+            attr.setByteStride(stride)
+            attr.setDivisor(1)
+            attr.setBuffer(self.buffer)
+            self.geometry.addAttribute(attr)
+
+        self.renderer = Qt3DRender.QGeometryRenderer(self.entity)
+        self.renderer.setGeometry(self.geometry)
+        self.renderer.setInstanceCount(0)
+        self.entity.addComponent(self.renderer)
+        self.entity.addComponent(instancedMaterial())
+
+    def setInstances(self, objs):
+        self._rows = { el.idnum: i for i, el in enumerate(objs) }
+        data = np.empty((len(objs), INSTANCE_FLOATS), dtype=np.float32)
+        if objs:
+            store = objs[0]._store
+            rows = [el._row for el in objs]
+            pos = store.pos[rows]
+            data[:, 0:3] = pos[:, :3]
+            data[:, 3:7] = eulerQuaternions(pos[:, 3], pos[:, 4], pos[:, 5])
+            data[:, 7:10] = store.color[rows] / 255
+        self.data = data
+        self.buffer.setData(QByteArray(data.tobytes()))
+        self.renderer.setInstanceCount(len(objs))
+
+    def updateInstance(self, el):
+        i = self._rows.get(el.idnum)
+        if i is None:
+            return
+        row = self.data[i]
+        row[0:3] = (el.dx, el.dy, el.dz)
+        row[3:7] = eulerQuaternions(el.rx, el.ry, el.rz)
+        row[7:10] = np.array(el.color, dtype=np.float32) / 255
+        self.buffer.updateData(i * INSTANCE_FLOATS * 4, QByteArray(row.tobytes()))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def destroy(self):
+        self.entity.setParent(None)
+        self.entity.deleteLater()
@@ -0,0 +1,99 @@
+import os
+import json
+import threading
+
+class SceneJournal():
+    def __init__(self, path, max_records=2000, max_bytes=1 << 20):
+        self.path = path
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.seq = 0
+        self.records = 0
+        self.size = 0
+        self.compacting = False
+        self._base = 0
+        self._lock = threading.Lock()
+        self._fp = None
+
+    def load(self, after=0):
+        """ Reads the records newer than seq `after`, a torn last line is dropped """
+        rst = []
+        self._base = after
+        self.seq = after
+        self.records = 0
+        self.size = 0
+        if os.path.exists(self.path):
+            with open(self.path) as fp:
+                for line in fp:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break
+                    if rec["seq"] > after:
+                        rst.append(rec)
+                        self.seq = max(self.seq, rec["seq"])
+                        self.records += 1
+                        self.size += len(line)
+        return rst
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._rewrite(self._base)
+
+    def append(self, op, **fields):
+        with self._lock:
+            self.seq += 1
+            rec = dict(fields, seq=self.seq, op=op)
+            line = json.dumps(rec) + "\n"
+            self._fp.write(line)
+            self._fp.flush()
+            self.records += 1
+            self.size += len(line)
+            return self.seq
+
+    def needsCompaction(self):
+        return not self.compacting and (
+            self.records >= self.max_records or self.size >= self.max_bytes)
+
+    def truncate(self, upto):
+        """ Drops the records already folded into a snapshot at seq `upto` """
+        with self._lock:
+            self._rewrite(upto)
+            self.compacting = False
+
+    def abortCompaction(self, error=None):
+        """ The snapshot never reached the disk, keep every record and let the next save retry """
+        with self._lock:
+            self.compacting = False
+
+    def _rewrite(self, upto):
+        keep = []
+        if self._fp is not None:
+            self._fp.close()
+        if os.path.exists(self.path):
+            with open(self.path) as fp:
+                for line in fp:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break
+                    if rec["seq"] > upto:
+                        keep.append(line)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as fp:
+            fp.writelines(keep)
+        os.replace(tmp, self.path)
+        self.records = len(keep)
+        self.size = sum(len(l) for l in keep)
+        self._fp = open(self.path, "a")
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        with self._lock:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
@@ -1,31 +1,62 @@
 #!python3
 
+import time
+START = time.perf_counter()
+
 import sys
-from PySide2.QtCore import(Property, QObject, QPropertyAnimation, Signal)
-from PySide2.QtGui import (QGuiApplication, QMatrix4x4, QQuaternion, QVector3D, QColor)
-from PySide2.Qt3DCore import (Qt3DCore)
-from PySide2.Qt3DExtras import (Qt3DExtras)
-from PySide2.Qt3DRender import (Qt3DRender)
-from PySide2.QtWidgets import *
+import json
+import argparse
+from PySide2.QtCore import QTimer
+from PySide2.QtGui import QKeySequence
+from PySide2.QtWidgets import (QApplication, QHBoxLayout, QLabel, QProgressBar, QPushButton,
+    QShortcut, QVBoxLayout, QWidget)
+# import phases for --profile-startup
+IMPORTS = [("import QtCore, QtWidgets", time.perf_counter())]
 
+from viewer import Viewer
+IMPORTS.append(("import viewer, Qt3D", time.perf_counter()))
+from model import DataModel, DATA_FILE, PAYLOAD_BUDGET, configureMeshes, shutdownMeshes
+IMPORTS.append(("import model, numpy", time.perf_counter()))
 from detail import ObjectDetail
 from treeview import TreeView
-from model import DataModel
-from viewer import Viewer
+from decimate import LOD_LEVELS, lodSettings
+from tracing import tracer, StartupProfile
+from history import UNDO_BUDGET
+IMPORTS.append(("import panels", time.perf_counter()))
+
+# modules that are only imported once a scene needs them
+LAZY_MODULES = ("stlloader", "meshcache", "diskcache", "importer", "instancing")
 
 class MainWindow(QWidget):
-    def __init__(self):
+    def __init__(self, args, profile=None):
         super().__init__()
-        self._model = DataModel()
+        self._profile = profile
+        self._profile_path = args.profile_startup
+        self._model = DataModel(args.save_interval, args.journal, args.scene, args.progressive)
+        self._model.payload_budget = args.payload_budget
+        self._model.history.max_bytes = args.undo_mb << 20
+        if profile is not None:
+            profile.mark("DataModel.initData")
         self._3dview = Viewer(self._model.getRootEntity())
 
         layout = QHBoxLayout()
         viewer = QWidget.createWindowContainer(self._3dview)
         panel = QVBoxLayout()
         
-        layout.addWidget(viewer, 4)
+        left = QVBoxLayout()
+        left.addWidget(viewer, 1)
+        layout.addLayout(left, 4)
         layout.addLayout(panel, 1)
 
+        self._overlay = None
+        if args.trace_overlay:
+            self._overlay = QLabel()
+            self._overlay.setStyleSheet("font-family: monospace")
+            left.insertWidget(0, self._overlay)
+            self._overlay_timer = QTimer(self)
+            self._overlay_timer.timeout.connect(self.updateOverlay)
+            self._overlay_timer.start(500)
+
         self._tree = TreeView()
         panel.addWidget(self._tree)
 
@@ -37,38 +68,196 @@ class MainWindow(QWidget):
         bStl = QPushButton("+STL")
         bStl.clicked.connect(lambda: self._model.addShape("stl"))
         bMinus = QPushButton("-")
-        bMinus.clicked.connect(lambda: self._model.delShape())
+        bMinus.clicked.connect(lambda: self._model.delSelection())
         bGroup = QPushButton("+Group")
         bGroup.clicked.connect(lambda: self._model.addGroup())
+        bMove = QPushButton("Move")
+        bMove.setToolTip("Move the selection into the current group")
+        bMove.clicked.connect(lambda: self._model.reparentSelection())
         bUndo = QPushButton("U")
+        bUndo.clicked.connect(lambda: self._model.undoChange())
         bRedo = QPushButton("R")
+        bRedo.clicked.connect(lambda: self._model.redoChange())
+        QShortcut(QKeySequence.Undo, self, self._model.undoChange)
+        QShortcut(QKeySequence.Redo, self, self._model.redoChange)
 
         buttonLayout.addWidget(bBox)
         buttonLayout.addWidget(bSphere)
         buttonLayout.addWidget(bStl)
         buttonLayout.addWidget(bGroup)
         buttonLayout.addWidget(bMinus)
-        # buttonLayout.addWidget(bUndo)
-        # buttonLayout.addWidget(bRedo)
+        buttonLayout.addWidget(bMove)
+        buttonLayout.addWidget(bUndo)
+        buttonLayout.addWidget(bRedo)
 
         panel.addLayout(buttonLayout)
+        self._undo = bUndo
+        self._redo = bRedo
+        self._history = QLabel()
+        panel.addWidget(self._history)
 
         self._detail = ObjectDetail()
         panel.addLayout(self._detail)
 
+        self._import_progress = QProgressBar()
+        self._import_progress.setRange(0, 100)
+        self._import_progress.hide()
+        panel.addWidget(self._import_progress)
+        configureMeshes(activity=self.importActivity)
+
+        self._load_progress = QProgressBar()
+        self._load_progress.setRange(0, 100)
+        self._load_progress.hide()
+        panel.addWidget(self._load_progress)
+        self._buttons = [bBox, bSphere, bStl, bMinus, bGroup, bMove]
+        self._model.assignCallback("load", self.loadProgress)
+        self._model.assignCallback("history", self.historyChanged)
+        self._3dview.setFirstFrameCallback(self.firstFrame)
+        if self._model.loading is not None:
+            self._load_progress.show()
+            self.setEditable(False)
+
         self.setLayout(layout)
 
         self._model.assignCallback("tree", self._tree.updateData)
+        self._model.assignCallback("tree-change", self._tree.changeData)
         self._tree.setCallback(self._model.selectElement)
+        self._tree.setSelectionCallback(self._model.setSelection)
+        self._model.assignCallback("selection", self._tree.selectNodes)
+        self._tree.setExpandCallback(self._model.expandGroup)
+        self._tree.setCollapseCallback(self._model.collapseGroup)
 
         self._model.assignCallback("detail", self._detail.updateValue)
-        self._detail.setCallback(self._model.setValue)
+        self._detail.setCallback(self._model.editSelection)
+        self._detail.setPreviewCallback(self._model.previewValue)
 
         self._3dview.setCallback(self._model.incUpdate)
+        self._3dview.setPicking(self._model.pick)
+        if args.cull:
+            self._3dview.setCulling(self._model.cullEntities)
+        else:
+            # still loads referenced scenes that come into view
+            self._3dview.setCulling(self._model.loadVisiblePayloads)
+        if profile is not None:
+            profile.mark("widgets")
+
+    def updateOverlay(self):
+        t = tracer()
+        text = "{:.0f} fps  {:.1f} ms".format(t.fps(), t.lastFrame() * 1000)
+        for name, count, total, worst in t.topSpans(3):
+            text += "   {} {:.0f} ms/{}".format(name, total, count)
+        self._overlay.setText(text)
+
+    def historyChanged(self, stats):
+        self._undo.setEnabled(stats["undo"] > 0 and self._model.loading is None)
+        self._redo.setEnabled(stats["redo"] > 0 and self._model.loading is None)
+        self._history.setText("undo {} / redo {}, {:.1f} of {} MB".format(
+            stats["undo"], stats["redo"], stats["bytes"] / (1 << 20), stats["max_bytes"] >> 20))
+
+    def loadProgress(self, done, total):
+        if done < total:
+            self._load_progress.setFormat("loading scene {}/{} %p%".format(done, total))
+            self._load_progress.setValue(int(done * 100 / max(total, 1)))
+            return
+        self._load_progress.hide()
+        self.setEditable(True)
+        self.historyChanged(self._model.history.stats())
+        print("scene fully loaded after {:.3f}s, {} nodes".format(time.perf_counter() - START, total))
+
+    def setEditable(self, on):
+        """ The model drops edits while loading, so the controls making them are locked """
+        for b in self._buttons:
+            b.setEnabled(on)
+        self._detail.setEditable(on)
+        self._3dview.setEditable(on)
+
+    def firstFrame(self):
+        print("first frame after {:.3f}s".format(time.perf_counter() - START))
+        if self._model.loading is None and self._model.load_time is not None:
+            print("scene built in {:.3f}s before the window".format(self._model.load_time))
+        if self._profile is not None:
+            self.reportStartup()
+
+    def reportStartup(self):
+        profile = self._profile
+        profile.mark("first frame")
+        print(profile.report())
+        loaded = [m for m in LAZY_MODULES if m in sys.modules]
+        print("lazy modules loaded:", ", ".join(loaded) or "none")
+        for name, count, total, worst in tracer().topSpans(5):
+            print("  {:<30} {:>6} calls {:>9.1f} ms".format(name, count, total))
+        if self._profile_path:
+            rst = profile.asDict()
+            rst["lazy_loaded"] = loaded
+            rst["nodes"] = len(self._model._data) - 1
+            with open(self._profile_path, "w") as fp:
+                json.dump(rst, fp, indent=2)
+        QTimer.singleShot(0, QApplication.quit)
+
+    def importActivity(self, pending, progress):
+        if pending == 0:
+            self._import_progress.hide()
+        else:
+            self._import_progress.setFormat("loading {} STL files %p%".format(pending))
+            self._import_progress.setValue(int(progress * 100))
+            self._import_progress.show()
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    view = MainWindow()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--save-interval", type=float, default=1.0,
+        help="seconds between scene snapshots")
+    parser.add_argument("--journal", action="store_true",
+        help="append edits to a change journal instead of rewriting data.json")
+    parser.add_argument("--scene", default=DATA_FILE,
+        help="scene file, .json or binary .p3ds")
+    parser.add_argument("--mesh-cache-mb", type=int, default=512,
+        help="memory budget for unreferenced cached meshes")
+    parser.add_argument("--disk-cache-mb", type=int, default=2048,
+        help="size cap of the preprocessed mesh cache, 0 disables it")
+    parser.add_argument("--no-lod", action="store_true",
+        help="always render STL files at full resolution")
+    parser.add_argument("--lowest-lod-while-dragging", action="store_true",
+        help="render the coarsest STL level while the view is dragged")
+    parser.add_argument("--payload-budget", type=int, default=PAYLOAD_BUDGET,
+        help="nodes of referenced scenes kept loaded before collapsed ones are unloaded")
+    parser.add_argument("--undo-mb", type=int, default=UNDO_BUDGET >> 20,
+        help="memory for undo and redo steps, the oldest are dropped beyond it")
+    parser.add_argument("--cull", action="store_true",
+        help="disable entities outside the view using the spatial index")
+    parser.add_argument("--progressive", action="store_true",
+        help="show the window at once and build the scene in slices on the event loop")
+    parser.add_argument("--profile-startup", nargs="?", const="", metavar="FILE",
+        help="print import, scene, widget and first frame times then quit, optionally as JSON")
+    parser.add_argument("--trace", metavar="FILE",
+        help="record timing spans and frame times, written as a Chrome trace on exit")
+    parser.add_argument("--trace-overlay", action="store_true",
+        help="show fps, frame time and the slowest spans above the view")
+    args, qt_args = parser.parse_known_args()
+    profile = None
+    if args.profile_startup is not None:
+        profile = StartupProfile(START)
+        for name, t in IMPORTS:
+            profile.mark(name, t)
+        profile.mark("parse arguments")
+    if args.trace or args.trace_overlay or profile is not None:
+        tracer().enable()
+    configureMeshes(budget=args.mesh_cache_mb << 20,
+        lod_levels=None if args.no_lod else LOD_LEVELS,
+        disk_cap=args.disk_cache_mb << 20)
+    lodSettings().drag_lowest = args.lowest_lod_while_dragging
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    if profile is not None:
+        profile.mark("QApplication")
+    view = MainWindow(args, profile)
     view.resize(1024,768)
     view.show()
+    if profile is not None:
+        profile.mark("show")
+    # the last debounced edit must reach the model before it is closed
+    app.aboutToQuit.connect(view._detail.commitEdits)
+    app.aboutToQuit.connect(shutdownMeshes)
+    app.aboutToQuit.connect(view._model.close)
+    if args.trace:
+        app.aboutToQuit.connect(lambda: tracer().exportChrome(args.trace))
     sys.exit(app.exec_())
\ No newline at end of file
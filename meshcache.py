@@ -0,0 +1,169 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import stlloader
+import decimate
+
+def fileHash(path, chunk=1 << 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as fp:
+        while True:
+            b = fp.read(chunk)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+class MeshEntry():
+    def __init__(self, key, mesh):
+        self.key = key
+        self.mesh = mesh
+        self.geometry = None
+        # one geometry per level, full resolution first
+        self.geometries = []
+        self.refs = 0
+
+    @property
+    def nbytes(self):
+        return self.mesh.nbytes
+
+class MeshCache():
+    def __init__(self, budget=512 << 20, loader=stlloader.load):
+        self.budget = budget
+        self.loader = loader
+        # optional DiskCache with preprocessed meshes
+        self.disk = None
+        # grid resolutions of the decimated levels, None disables them
+        self.lod_levels = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = {}
+        # (path, mtime, size) -> content key, skips hashing unchanged files
+        self._paths = {}
+        # unreferenced entries, oldest first
+        self._lru = OrderedDict()
+        # importer workers call keyOf, contains and load while the GUI thread
+        # acquires and releases, every bookkeeping change holds this lock
+        self._lock = threading.RLock()
+
+    def setBudget(self, budget):
+        with self._lock:
+            self.budget = budget
+            self.evict()
+
+    def keyOf(self, path):
+        st = os.stat(path)
+        stamp = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            key = self._paths.get(stamp)
+        if key is None:
+            # hashed outside the lock, a race only hashes the same file twice
+            key = fileHash(path)
+            with self._lock:
+                self._paths[stamp] = key
+        return key
+
+    def contains(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def load(self, path, key, progress=None):
+        if self.disk is not None:
+            mesh = self.disk.load(path, key, progress)
+        else:
+            mesh = self.loader(path, progress)
+        if self.lod_levels:
+            mesh.lods = decimate.buildLODs(mesh, self.lod_levels, self.disk, key)
+        return mesh
+
+    def acquire(self, path, build=None):
+        """ Returns the shared entry for path, loading it on a miss """
+        key = self.keyOf(path)
+        if self.contains(key):
+            try:
+                return self.acquireLoaded(key, None, build)
+            except KeyError:
+                # evicted in between, load it again
+                pass
+        return self.acquireLoaded(key, self.load(path, key), build)
+
+    def acquireLoaded(self, key, mesh, build=None):
+        """ Like acquire, with the mesh already parsed elsewhere, mesh may be None on a hit """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                if mesh is None:
+                    raise KeyError(key)
+                self.misses += 1
+                entry = MeshEntry(key, mesh)
+                self._entries[key] = entry
+                self.nbytes += entry.nbytes
+            else:
+                self.hits += 1
+                self._lru.pop(key, None)
+            entry.refs += 1
+        if build is not None and entry.geometry is None:
+            # geometry is only built on the GUI thread, the entry is referenced so it stays
+            entry.geometries = [build(m) for m in [entry.mesh] + entry.mesh.lods]
+            entry.geometry = entry.geometries[0]
+        self.evict()
+        return entry
+
+    def release(self, entry):
+        with self._lock:
+            entry.refs -= 1
+            if entry.refs <= 0:
+                entry.refs = 0
+                self._lru[entry.key] = entry
+                self.evict()
+
+    def evict(self):
+        with self._lock:
+            while self.nbytes > self.budget and self._lru:
+                key, entry = self._lru.popitem(last=False)
+                del self._entries[key]
+                self.nbytes -= entry.nbytes
+                self.dispose(entry)
+                self.evictions += 1
+
+    def dispose(self, entry):
+        # Qt geometry is owned by its parent node, delete it explicitly
+        for geometry in entry.geometries:
+            if hasattr(geometry, "deleteLater"):
+                geometry.deleteLater()
+        entry.geometries = []
+        entry.geometry = None
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._lru):
+                entry = self._lru.pop(key)
+                del self._entries[key]
+                self.nbytes -= entry.nbytes
+                self.dispose(entry)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "unreferenced": len(self._lru),
+                "bytes": self.nbytes,
+                "budget": self.budget,
+            }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def meshCache():
+    """ The process-wide mesh cache """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MeshCache()
+        return _cache
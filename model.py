@@ -1,20 +1,97 @@
-from PySide2.QtCore import QObject, Qt, QUrl
+from PySide2.QtCore import QTimer
 from PySide2.Qt3DCore import Qt3DCore
 from PySide2.Qt3DExtras import Qt3DExtras
 from PySide2.Qt3DRender import (Qt3DRender)
-from PySide2.QtGui import QMatrix4x4, QQuaternion, QVector3D, QColor
-import os
-import json
-
-def inject_generic_repr(cls):
-    """ Injects a generic repr function """
-    def generic_repr(that):
-        class_items = ['{}={}'.format(k, v) for k, v in that.__dict__.items()
-            if k not in ['entity', 'transform', 'mesh', 'meterial']]
-        return '<{} '.format(that.__class__.__name__) + ', '.join(class_items) + '>'
-
-    cls.__repr__ = generic_repr
-    return cls
+from PySide2.QtGui import QQuaternion, QVector3D, QColor
+from decimate import lodSettings
+from respool import SharedPool, colorKey
+from scenecore import (SceneCore, RootNode, GroupNode, BoxNode, SphereNode, STLNode,
+    DATA_FILE, PAYLOAD_BUDGET)
+
+# Qt3D binding of the scene graph in scenecore.py: the node classes below
+# mirror core nodes into entities, DataModel adds timed saves and progressive
+# loading on the Qt event loop.
+
+_shared_parent = None
+
+def sharedParent():
+    """ Owner of the components shared between entities """
+    return _shared_parent
+
+_placeholder = None
+
+def placeholderMesh():
+    """ Unit cube shown while an STL file is still loading """
+    global _placeholder
+    if _placeholder is None:
+        _placeholder = Qt3DExtras.QCuboidMesh(sharedParent())
+    return _placeholder
+
+def _createMesh(key):
+    if key[0] == "box":
+        mesh = Qt3DExtras.QCuboidMesh(sharedParent())
+        mesh.setXExtent(key[1])
+        mesh.setYExtent(key[2])
+        mesh.setZExtent(key[3])
+    else:
+        mesh = Qt3DExtras.QSphereMesh(sharedParent())
+        mesh.setRadius(key[1])
+    return mesh
+
+def _createMaterial(key):
+    material = Qt3DExtras.QPhongMaterial(sharedParent())
+    material.setDiffuse(QColor(*key, 255))
+    return material
+
+def _disposeNode(node):
+    node.deleteLater()
+
+# one mesh per (shape, dimensions) and one material per color
+mesh_pool = SharedPool(_createMesh, _disposeNode)
+material_pool = SharedPool(_createMaterial, _disposeNode)
+
+# the STL import pool, mesh cache and disk cache are set up on the first STL
+# file, scenes without one never import them
+_mesh_settings = {}
+_mesh_importer = None
+
+def configureMeshes(**settings):
+    """ budget, lod_levels, disk_cap and activity (import progress slot) for STL loading """
+    _mesh_settings.update(settings)
+    if _mesh_importer is not None and "activity" in settings:
+        _mesh_importer.activity.connect(settings["activity"])
+
+def stlImporter():
+    global _mesh_importer
+    if _mesh_importer is None:
+        from importer import meshImporter
+        from meshcache import meshCache
+        cache = meshCache()
+        if "budget" in _mesh_settings:
+            cache.setBudget(_mesh_settings["budget"])
+        cache.lod_levels = _mesh_settings.get("lod_levels")
+        if _mesh_settings.get("disk_cap"):
+            from diskcache import DiskCache
+            cache.disk = DiskCache(cap=_mesh_settings["disk_cap"])
+        _mesh_importer = meshImporter()
+        if _mesh_settings.get("activity") is not None:
+            _mesh_importer.activity.connect(_mesh_settings["activity"])
+    return _mesh_importer
+
+def shutdownMeshes():
+    if _mesh_importer is not None:
+        _mesh_importer.shutdown()
+
+def homogeneousKey(objs):
+    """ The shared mesh key when every object is the same box or sphere, else None """
+    key = None
+    for el in objs:
+        if el.type != "entity" or el.shape not in ("box", "sphere"):
+            return None
+        if key is not None and el._mesh_key != key:
+            return None
+        key = el._mesh_key
+    return key
 
 class BindingEntity(Qt3DCore.QEntity):
     def __init__(self, *args):
@@ -29,59 +106,31 @@ class BindingEntity(Qt3DCore.QEntity):
         if self._callback is not None:
             self._callback(self.idnum)
 
-@inject_generic_repr
-class DataObject():
-    def __init__(self):
-        self.name = None
-        self.type = None
-        self.idnum = 0
-        self.parent = 0
-        self.entity = None
-    
-    def setName(self, _name):
-        self.name = _name
-
-    def destroy(self, data=None):
-        pass
-
-    def assignID(self, _id):
-        self.idnum = _id
-
-@inject_generic_repr
-class RootObject(DataObject):
+class RootObject(RootNode):
     def __init__(self):
         super().__init__()
-        self.name = "root"
-        self.type = "root"
-        self.children = []
-        self.parent = None
         self.entity = Qt3DCore.QEntity()
-    
-    def destroy(self, data=None):
-        raise RuntimeError("Root cannot be destroyed")
+        global _shared_parent
+        _shared_parent = self.entity
 
-@inject_generic_repr
-class EntityObject(DataObject):
+class EntityBinding():
+    """ Mixed in before an entity node class, mirrors it into a Qt3D entity """
     def __init__(self, name):
-        super().__init__()
-        self.name = name
-        self.type = "entity"
-        self.shape = None
+        super().__init__(name)
         self.entity = BindingEntity()
         self.transform = Qt3DCore.QTransform()
-        self.meterial = Qt3DExtras.QPhongMaterial(self.entity)
-        self.dx = 0
-        self.dy = 0
-        self.dz = 0
-        self.rx = 0
-        self.ry = 0
-        self.rz = 0
-        self.color = (0, 0, 0)
-
-        self.meterial.setDiffuse(QColor(*self.color, 255))
+        self.mesh = None
+        self.batch = None
+        self._mesh_key = None
+        self._material_key = None
+        self.meterial = None
 
         self.entity.addComponent(self.transform)
-        self.entity.addComponent(self.meterial)
+
+    def sync(self):
+        self.applyTransform()
+        self.colorChanged()
+        self.shapeChanged()
     
     def assignID(self, _id):
         super().assignID(_id)
@@ -89,442 +138,275 @@ class EntityObject(DataObject):
     
     def setCallback(self, fn):
         self.entity.setCallback(fn)
-    
-    def setTrans(self, dx=None, dy=None, dz=None):
-        if dx is not None:
-            self.dx = dx
-        if dy is not None:
-            self.dy = dy
-        if dz is not None:
-            self.dz = dz
+
+    def applyTransform(self):
+        """ Pushes the stored dx..rz to the QTransform """
         self.transform.setTranslation(QVector3D(self.dx, self.dy, self.dz))
+        self.transform.setRotation(QQuaternion.fromEulerAngles(self.rx, self.ry, self.rz))
+        if self.batch is not None:
+            self.batch.updateInstance(self)
     
-    def setRotate(self, rx=None, ry=None, rz=None):
-        if rx is not None:
-            self.rx = rx
-        if ry is not None:
-            self.ry = ry
-        if rz is not None:
-            self.rz = rz
-        # self.applyTransform()
-        self.transform.setRotationX(self.rx)
-        self.transform.setRotationY(self.ry)
-        self.transform.setRotationZ(self.rz)
+    def colorChanged(self):
+        key = colorKey(self.color)
+        if key != self._material_key:
+            # move to the pooled material of the new color
+            material = material_pool.acquire(key)
+            if self.meterial is not None:
+                self.entity.removeComponent(self.meterial)
+                material_pool.release(self._material_key)
+            self.entity.addComponent(material)
+            self.meterial = material
+            self._material_key = key
+        if self.batch is not None:
+            self.batch.updateInstance(self)
+
+    def shapeChanged(self):
+        key = self.meshKey()
+        if key is not None:
+            self.setPooledMesh(key)
     
-    def setColor(self, r, g, b):
-        self.color = (r, g, b)
-        self.meterial.setDiffuse(QColor(*self.color, 255))
+    def setPooledMesh(self, key):
+        if key == self._mesh_key:
+            return
+        mesh = mesh_pool.acquire(key)
+        if self.mesh is not None:
+            self.entity.removeComponent(self.mesh)
+        self.entity.addComponent(mesh)
+        if self._mesh_key is not None:
+            mesh_pool.release(self._mesh_key)
+        self.mesh = mesh
+        self._mesh_key = key
     
-    def setParent(self, _id, par):
-        self.parent = _id
+    def attach(self, par):
         self.entity.setParent(par.entity)
-        par.children.append(self.idnum)
+
+    def detach(self, par):
+        # drawn on its own again, the old group rebuilds its batch
+        if self.batch is not None:
+            self.batch = None
+            self.entity.setEnabled(True)
+
+    def setVisible(self, on):
+        # instanced entities are drawn by their group's batch
+        if self.batch is None:
+            self.entity.setEnabled(on)
+    
+    def release(self):
+        if self._mesh_key is not None:
+            self.entity.removeComponent(self.mesh)
+            mesh_pool.release(self._mesh_key)
+            self.mesh = None
+            self._mesh_key = None
+        if self.meterial is not None:
+            self.entity.removeComponent(self.meterial)
+            material_pool.release(self._material_key)
+            self.meterial = None
+        super().release()
     
     def destroy(self, data=None):
         self.entity.setParent(None)
-        if self.parent is not None:
-            data[self.parent].children.remove(self.idnum)
+        super().destroy(data)
+
+class BoxObject(EntityBinding, BoxNode):
+    pass
 
-@inject_generic_repr
-class BoxObject(EntityObject):
+class SphereObject(EntityBinding, SphereNode):
+    pass
+
+class STLObject(EntityBinding, STLNode):
     def __init__(self, name):
         super().__init__(name)
-        self.shape = "box"
-        self.length = 5
-        self.width  = 5
-        self.height = 5
-        self.mesh = Qt3DExtras.QCuboidMesh()
-        self.mesh.setXExtent(self.length)
-        self.mesh.setYExtent(self.width)
-        self.mesh.setZExtent(self.height)
-        self.entity.addComponent(self.mesh)
+        self.placeholder = None
+        self.lod = None
+        self.lod_index = 0
+        self._ticket = None
     
-    def setSize(self, l=None, w=None, h=None):
-        if l is not None:
-            self.length = l
-        if w is not None:
-            self.width = w
-        if h is not None:
-            self.height = h
-        self.mesh.setXExtent(self.length)
-        self.mesh.setYExtent(self.width)
-        self.mesh.setZExtent(self.height)
-
-@inject_generic_repr
-class SphereObject(EntityObject):
-    def __init__(self, name):
-        super().__init__(name)
-        self.shape = "sphere"
-        self.radius = 5
-        self.mesh = Qt3DExtras.QSphereMesh()
-        self.mesh.setRadius(self.radius)
+    def urlChanged(self):
+        self.releaseMesh()
+        self.load_progress = 0.0
+        self.placeholder = placeholderMesh()
+        self.entity.addComponent(self.placeholder)
+        import stlloader
+        ticket = stlImporter().request(self.url, self.onMeshLoaded,
+            lambda mesh: stlloader.buildGeometry(mesh, sharedParent()))
+        if ticket.progress < 1:
+            self._ticket = ticket
+    
+    def onMeshLoaded(self, entry, error):
+        self._ticket = None
+        self.load_progress = 1.0
+        if error is not None:
+            print("load stl failed:", error)
+            self.load_error = str(error)
+            self.triangle_count = 0
+            self.bounds = None
+            return
+        self.removePlaceholder()
+        # entities loading the same file share one geometry renderer
+        self._cached = entry
+        data = entry.mesh
+        self.load_error = None
+        self.triangle_count = data.triangle_count
+        self.bounds = data.bounds
+        self.parse_time = data.parse_time
+        self.mesh = entry.geometry
         self.entity.addComponent(self.mesh)
+        if len(entry.geometries) > 1 and lodSettings().camera is not None:
+            self.setupLOD()
     
-    def setRadius(self, r):
-        self.radius = r
-        self.mesh.setRadius(self.radius)
-
-@inject_generic_repr
-class STLObject(EntityObject):
-    def __init__(self, name):
-        super().__init__(name)
-        self.shape = "stl"
-        self.url = None
-        self.mesh = None
-        self.scale = 1
+    def setupLOD(self):
+        settings = lodSettings()
+        (x0, y0, z0), (x1, y1, z1) = self.bounds
+        center = QVector3D((x0 + x1) / 2, (y0 + y1) / 2, (z0 + z1) / 2)
+        radius = QVector3D(x1 - x0, y1 - y0, z1 - z0).length() / 2
+        self.lod = Qt3DRender.QLevelOfDetail(self.entity)
+        self.lod.setCamera(settings.camera)
+        self.lod.setThresholdType(Qt3DRender.QLevelOfDetail.ProjectedScreenPixelSizeThreshold)
+        self.lod.setThresholds(settings.thresholds[:len(self._cached.geometries) - 1])
+        self.lod.setVolumeOverride(Qt3DRender.QLevelOfDetailBoundingSphere(center, radius))
+        self.lod.currentIndexChanged.connect(self.setLODLevel)
+        self.entity.addComponent(self.lod)
+        settings.register(self)
     
-    def setURL(self, _url):
-        if _url is None:
+    def setLODLevel(self, i):
+        self.lod_index = i
+        self.applyLOD()
+    
+    def applyLOD(self):
+        if self._cached is None or not self._cached.geometries:
             return
-        self.mesh = Qt3DRender.QMesh()
-        self.mesh.setSource(QUrl.fromLocalFile(_url))
-        self.entity.addComponent(self.mesh)
-        self.url = _url
+        levels = self._cached.geometries
+        if lodSettings().force_lowest:
+            geometry = levels[-1]
+        else:
+            geometry = levels[min(self.lod_index, len(levels) - 1)]
+        if geometry is not self.mesh:
+            self.entity.removeComponent(self.mesh)
+            self.mesh = geometry
+            self.entity.addComponent(self.mesh)
     
-    def setScale(self, s):
-        self.scale = s
-        self.transform.setScale(s)
-
-@inject_generic_repr
-class GroupObject(DataObject):
+    def removePlaceholder(self):
+        if self.placeholder is not None:
+            self.entity.removeComponent(self.placeholder)
+            self.placeholder = None
+    
+    def releaseMesh(self):
+        if self._ticket is not None:
+            stlImporter().cancel(self._ticket)
+            self._ticket = None
+        self.removePlaceholder()
+        if self.lod is not None:
+            lodSettings().unregister(self)
+            self.entity.removeComponent(self.lod)
+            self.lod.deleteLater()
+            self.lod = None
+            self.lod_index = 0
+        if self.mesh is not None:
+            self.entity.removeComponent(self.mesh)
+            self.mesh = None
+        if self._cached is not None:
+            from meshcache import meshCache
+            meshCache().release(self._cached)
+            self._cached = None
+
+    def release(self):
+        self.releaseMesh()
+        super().release()
+
+    def sync(self):
+        super().sync()
+        self.scaleChanged()
+
+    def scaleChanged(self):
+        self.transform.setScale(self.scale)
+
+class GroupObject(GroupNode):
     def __init__(self, name):
-        super().__init__()
-        self.name = name
-        self.type = "group"
-        self.children = []
+        super().__init__(name)
         self.entity = Qt3DCore.QEntity()
         self.transform = Qt3DCore.QTransform()
-        self.dx = 0
-        self.dy = 0
-        self.dz = 0
-        self.rx = 0
-        self.ry = 0
-        self.rz = 0
-        self.color = (0, 0, 0)
+        self.batch = None
 
         self.entity.addComponent(self.transform)
     
-    def setTrans(self, dx=None, dy=None, dz=None):
-        if dx is not None:
-            self.dx = dx
-        if dy is not None:
-            self.dy = dy
-        if dz is not None:
-            self.dz = dz
+    def setInstanced(self, on, data):
+        """ Draws the children in one instanced call when they share a primitive mesh """
+        super().setInstanced(on, data)
+        if self.batch is not None:
+            for i in self.children:
+                data[i].batch = None
+                data[i].entity.setEnabled(True)
+            self.batch.destroy()
+            self.batch = None
+        if not on:
+            return
+        objs = [data[i] for i in self.children]
+        key = homogeneousKey(objs)
+        if key is None:
+            return
+        from instancing import InstancedBatch
+        self.batch = InstancedBatch(self.entity, key)
+        for el in objs:
+            el.batch = self.batch
+            el.entity.setEnabled(False)
+        self.batch.setInstances(objs)
+
+    def release(self):
+        if self.batch is not None:
+            self.batch.destroy()
+            self.batch = None
+        super().release()
+
+    def sync(self):
+        self.applyTransform()
+
+    def applyTransform(self):
         self.transform.setTranslation(QVector3D(self.dx, self.dy, self.dz))
+        self.transform.setRotation(QQuaternion.fromEulerAngles(self.rx, self.ry, self.rz))
     
-    def setRotate(self, rx=None, ry=None, rz=None):
-        if rx is not None:
-            self.rx = rx
-        if ry is not None:
-            self.ry = ry
-        if rz is not None:
-            self.rz = rz
-        self.transform.setRotationX(self.rx)
-        self.transform.setRotationY(self.ry)
-        self.transform.setRotationZ(self.rz)
-    
-    def setParent(self, _id, par):
-        self.parent = _id
+    def attach(self, par):
         self.entity.setParent(par.entity)
-        par.children.append(self.idnum)
     
     def destroy(self, data=None):
         self.entity.setParent(None)
-        if self.parent is not None:
-            data[self.parent].children.remove(self.idnum)
-        def recDestroy(i):
-            if i in data:
-                if data[i].type == 'group':
-                    for j in data[i].children:
-                        recDestroy(j)
-                del data[i]
-        for j in self.children:
-            recDestroy(j)
-
-class DataModel(QObject):
-    def __init__(self):
-        self._data = {}
-        self._sel = 0
-        self._no = 0
-
-        self._update_tree_callback = None
-        self._update_detail_callback = None
-
-        self.initData()
-
-        self._stack = []
-    
-    def assignCallback(self, s, fn):
-        if s == "tree":
-            self._update_tree_callback = fn
-            self.updateTree()
-        elif s == "detail":
-            self._update_detail_callback = fn
-            self.updateDetail()
-    
-    def initData(self):
-        self._data[0] = RootObject()
-        if os.path.exists(os.path.expanduser("~/.pyqt3dviewer/data.json")):
-            print("load from file")
-            data = json.load(open(os.path.expanduser("~/.pyqt3dviewer/data.json")))
-            for entry in data:
-                self.loadData(entry, 0)
-    
-    def loadData(self, data, parent):
-        if data["type"] == "entity":
-            self._no += 1
-            if data["shape"] == "box":
-                el = BoxObject(data["name"])
-                self._data[self._no] = el
-                el.assignID(self._no)
-                el.setCallback(self.touchElement)
-                el.setParent(parent, self._data[parent])
-                el.setTrans(*data["pos"][:3])
-                el.setRotate(*data["pos"][3:])
-                el.setColor(*data["color"])
-                el.setSize(*data["size"])
-            elif data["shape"] == "sphere":
-                el = SphereObject(data["name"])
-                self._data[self._no] = el
-                el.assignID(self._no)
-                el.setCallback(self.touchElement)
-                el.setParent(parent, self._data[parent])
-                el.setTrans(*data["pos"][:3])
-                el.setRotate(*data["pos"][3:])
-                el.setColor(*data["color"])
-                el.setRadius(*data["size"])
-            elif data["shape"] == "stl":
-                el = STLObject(data["name"])
-                self._data[self._no] = el
-                el.assignID(self._no)
-                el.setCallback(self.touchElement)
-                el.setParent(parent, self._data[parent])
-                el.setTrans(*data["pos"][:3])
-                el.setRotate(*data["pos"][3:])
-                el.setColor(*data["color"])
-                el.setScale(data["scale"])
-                el.setURL(data["url"])
-        elif data["type"] == "group":
-            self._no += 1
-            el = GroupObject(data["name"])
-            num = self._no
-            self._data[num] = el
-            el.assignID(num)
-            el.setParent(parent, self._data[parent])
-            el.setTrans(*data["pos"][:3])
-            el.setRotate(*data["pos"][3:])
-            for entry in data["children"]:
-                self.loadData(entry, num)
-    
-    def dumpData(self, i):
-        if i == 0:
-            return [self.dumpData(j) for j in self._data[0].children]
-        rst = {}
-        el = self._data[i]
-        rst["name"] = el.name
-        if el.type == "entity":
-            rst["type"] = "entity"
-            rst["pos"] = [el.dx, el.dy, el.dz, el.rx, el.ry, el.rz]
-            rst["color"] = list(el.color)
-            if el.shape == "box":
-                rst["shape"] = "box"
-                rst["size"] = [el.length, el.width, el.height]
-            elif el.shape == "sphere":
-                rst["shape"] = "sphere"
-                rst["size"] = [el.radius]
-            elif el.shape == "stl":
-                rst["shape"] = "stl"
-                rst["scale"] = el.scale
-                rst["url"] = el.url
-            else:
-                rst["shape"] = el.shape
-        elif el.type == "group":
-            rst["type"] = "group"
-            rst["pos"] = [el.dx, el.dy, el.dz, el.rx, el.ry, el.rz]
-            rst["children"] = [self.dumpData(j) for j in self._data[i].children]
+        super().destroy(data)
+
+class DataModel(SceneCore):
+    """ SceneCore mirrored into Qt3D entities, saving on a timer """
+    NODES = { "root": RootObject, "group": GroupObject, "box": BoxObject,
+        "sphere": SphereObject, "stl": STLObject }
+
+    def __init__(self, save_interval=1.0, journal=False, path=DATA_FILE, progressive=False):
+        self._save_timer = QTimer()
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(int(save_interval * 1000))
+        self._save_timer.timeout.connect(self.saveSnapshot)
+        super().__init__(save_interval, journal, path, progressive)
+
+    def scheduleSave(self):
+        if not self._save_timer.isActive():
+            self._save_timer.start()
+
+    def scheduleSlice(self):
+        QTimer.singleShot(0, self.loadSlice)
+
+    def takePendingSave(self):
+        if self._save_timer.isActive():
+            self._save_timer.stop()
+            return True
+        return False
+
+    def resourceReport(self):
+        rst = super().resourceReport()
+        from meshcache import meshCache
+        batches = [el.batch for el in self._data.values() if el.type == "group" and el.batch is not None]
+        rst.update({
+            "meshes": mesh_pool.stats(),
+            "materials": material_pool.stats(),
+            "stl": meshCache().stats(),
+            "instanced": { "batches": len(batches), "instances": sum(len(b) for b in batches) },
+        })
         return rst
-    
-    def dumpToFile(self):
-        os.makedirs(os.path.expanduser("~/.pyqt3dviewer"), exist_ok=True)
-        fp = open(os.path.expanduser("~/.pyqt3dviewer/data.json"), "w")
-        json.dump(self.dumpData(0), fp)
-        fp.close()
-    
-    def findCurrentParent(self):
-        if self._data[self._sel].type == 'group':
-            return self._sel
-        else:
-            return 0
-
-    def addShape(self, shape):
-        self._no += 1
-        par = self.findCurrentParent()
-        name = "{} {}".format(shape, self._no)
-        if shape == 'sphere':
-            self._data[self._no] = SphereObject(name)
-        elif shape == 'box':
-            self._data[self._no] = BoxObject(name)
-        elif shape == 'stl':
-            self._data[self._no] = STLObject(name)
-        self._data[self._no].assignID(self._no)
-        self._data[self._no].setCallback(self.touchElement)
-        self._data[self._no].setParent(par, self._data[par])
-
-        self.updateTree()
-        self.dumpToFile()
-    
-    def addGroup(self):
-        self._no += 1
-        par = self.findCurrentParent()
-        name = "{} {}".format("Group", self._no)
-        self._data[self._no] = GroupObject(name)
-        self._data[self._no].assignID(self._no)
-        self._data[self._no].setParent(par, self._data[par])
-
-        self.updateTree()
-        self.dumpToFile()
-    
-    def delShape(self, _id=None):
-        if _id is None:
-            _id = self._sel
-        if _id != 0:
-            el = self._data[_id]
-            el.destroy(self._data)
-            del self._data[_id]
-            self._sel = 0
-            self.updateDetail()
-            self.updateTree()
-            self.dumpToFile()
-
-    def selectElement(self, _id):
-        self._sel = int(_id)
-        self.updateDetail()
-    
-    def touchElement(self, _id):
-        self.selectElement(_id)
-        self.updateTree()
-
-    def setValue(self, _id, **vargs):
-        if _id != 0:
-            if "name" in vargs:
-                self._data[_id].setName(vargs["name"])
-                self.updateTree()
-            
-            if self._data[_id].type == 'entity' or self._data[_id].type == 'group':
-                do_translate = False
-                dx, dy, dz = None, None, None
-                if "dx" in vargs:
-                    do_translate = True
-                    dx = vargs["dx"]
-                if "dy" in vargs:
-                    do_translate = True
-                    dy = vargs["dy"]
-                if "dz" in vargs:
-                    do_translate = True
-                    dz = vargs["dz"]
-                if do_translate:
-                    self._data[_id].setTrans(dx, dy, dz)
-                
-                do_rotate = False
-                rx, ry, rz = None, None, None
-                if "rx" in vargs:
-                    do_rotate = True
-                    rx = vargs["rx"]
-                if "ry" in vargs:
-                    do_rotate = True
-                    ry = vargs["ry"]
-                if "rz" in vargs:
-                    do_rotate = True
-                    rz = vargs["rz"]
-                if do_rotate:
-                    self._data[_id].setRotate(rx, ry, rz)
-
-            if self._data[_id].type == 'entity':
-                if "color" in vargs:
-                    self._data[_id].setColor(*vargs["color"])
-
-                if self._data[_id].shape == "box":
-                    do_change = False
-                    l, w, h = None, None, None
-                    if "length" in vargs:
-                        do_change = True
-                        l = vargs["length"]
-                    if "width" in vargs:
-                        do_change = True
-                        w = vargs["width"]
-                    if "height" in vargs:
-                        do_change = True
-                        h = vargs["height"]
-                    if do_change:
-                        self._data[_id].setSize(l, w, h)
-                
-                if self._data[_id].shape == "sphere" and "radius" in vargs:
-                    self._data[_id].setRadius(vargs["radius"])
-                
-                if self._data[_id].shape == "stl":
-                    if "url" in vargs:
-                        self._data[_id].setURL(vargs["url"])
-                    if "scale" in vargs:
-                        self._data[_id].setScale(vargs["scale"])
-
-            self.dumpToFile()
-            self.updateDetail()
-
-    def updateDetail(self):
-        if self._update_detail_callback is not None:
-            self._update_detail_callback(self._sel, self._data[self._sel])
-    
-    def updateTree(self):
-        if self._update_tree_callback is not None:
-            self._update_tree_callback(self._data, self._sel)
 
     def getRootEntity(self):
         return self._data[0].entity
-    
-    def incUpdate(self, **vargs):
-        if self._sel != 0 and (
-            self._data[self._sel].type == "entity" or
-            self._data[self._sel].type == "group"):
-            el = self._data[self._sel]
-
-            do_translate = False
-            dx, dy, dz = None, None, None
-            if "dx" in vargs:
-                do_translate = True
-                dx = vargs["dx"] + el.dx
-            if "dy" in vargs:
-                do_translate = True
-                dy = vargs["dy"] + el.dy
-            if "dz" in vargs:
-                do_translate = True
-                dz = vargs["dz"] + el.dz
-            if do_translate:
-                el.setTrans(dx, dy, dz)
-            
-            do_rotate = False
-            rx, ry, rz = None, None, None
-            if "rx" in vargs:
-                do_rotate = True
-                rx = (vargs["rx"] + el.rx + 180) % 360 - 180
-            if "ry" in vargs:
-                do_rotate = True
-                ry = (vargs["ry"] + el.ry + 180) % 360 - 180
-            if "rz" in vargs:
-                do_rotate = True
-                rz = (vargs["rz"] + el.rz + 180) % 360 - 180
-            if do_rotate:
-                el.setRotate(rx, ry, rz)
-            
-            if "update" in vargs:
-                self.updateDetail()
-                self.dumpToFile()
-    
-    def recordChange(self):
-        pass
-
-    def undoChange(self):
-        pass
-
-    def redoChange(self):
-        pass
\ No newline at end of file
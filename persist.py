@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+def atomicWrite(path, data):
+    """ Writes bytes or json data to a temp file and renames it over path """
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, "wb" if isinstance(data, bytes) else "w") as fp:
+        if isinstance(data, bytes):
+            fp.write(data)
+        else:
+            json.dump(data, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp, path)
+
+class SceneWriter():
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+
+        self.requests = 0
+        self.writes = 0
+        self.last_latency = 0.0
+        self.last_error = None
+
+        self._pending = None
+        self._done = []
+        self._failed = []
+        self._has_pending = False
+        self._writing = False
+        self._closed = False
+        self._last_write = 0.0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="SceneWriter", daemon=True)
+        self._thread.start()
+
+    def markDirty(self):
+        with self._cond:
+            self.requests += 1
+
+    def submit(self, data, done=None, failed=None):
+        """ Queues data for writing, done() runs after it is on disk and failed(error) if it never got there """
+        with self._cond:
+            self._pending = data
+            if done is not None:
+                self._done.append(done)
+            if failed is not None:
+                self._failed.append(failed)
+            self._has_pending = True
+            self._cond.notify_all()
+
+    def _write(self, data, done, failed):
+        start = time.perf_counter()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            atomicWrite(self.path, data)
+            self.last_error = None
+        except OSError as e:
+            self.last_error = e
+            log.warning("writing %s failed: %s", self.path, e)
+        self.last_latency = time.perf_counter() - start
+        self.writes += 1
+        if self.last_error is None:
+            for fn in done:
+                fn()
+        else:
+            for fn in failed:
+                fn(self.last_error)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while (not self._has_pending or self._writing) and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._has_pending:
+                    return
+                # bound the write rate, later submits replace the pending data
+                wait = self._last_write + self.interval - time.monotonic()
+                while wait > 0 and not self._closed:
+                    self._cond.wait(wait)
+                    wait = self._last_write + self.interval - time.monotonic()
+                if not self._has_pending or self._writing:
+                    # taken over by flush() while waiting
+                    continue
+                data = self._pending
+                done = self._done
+                failed = self._failed
+                self._pending = None
+                self._done = []
+                self._failed = []
+                self._has_pending = False
+                self._writing = True
+            self._write(data, done, failed)
+            with self._cond:
+                self._writing = False
+                self._last_write = time.monotonic()
+                self._cond.notify_all()
+
+    def flush(self):
+        with self._cond:
+            done = self._done
+            failed = self._failed
+            if self._has_pending:
+                data = self._pending
+                self._pending = None
+                self._done = []
+                self._failed = []
+                self._has_pending = False
+            else:
+                data = None
+            while self._writing:
+                self._cond.wait()
+            if data is not None:
+                self._writing = True
+        if data is not None:
+            self._write(data, done, failed)
+            with self._cond:
+                self._writing = False
+                self._last_write = time.monotonic()
+                self._cond.notify_all()
+
+    def close(self):
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "requests": self.requests,
+                "writes": self.writes,
+                "coalesced": max(self.requests - self.writes, 0),
+                "pending": self._has_pending,
+                "last_latency": self.last_latency,
+                "last_error": None if self.last_error is None else str(self.last_error),
+            }
@@ -0,0 +1,107 @@
+import sys
+import json
+
+def meshKey(shape, *dims):
+    # dims come from spinboxes and json, round away float noise
+    return (shape,) + tuple(round(float(d), 6) for d in dims)
+
+def colorKey(color):
+    return tuple(int(c) for c in color)
+
+class SharedPool():
+    def __init__(self, create, dispose=None):
+        self.create = create
+        self.dispose = dispose
+        self.created = 0
+        self.disposed = 0
+        self._items = {}
+
+    def acquire(self, key):
+        item = self._items.get(key)
+        if item is None:
+            item = [self.create(key), 0]
+            self._items[key] = item
+            self.created += 1
+        item[1] += 1
+        return item[0]
+
+    def release(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return
+        item[1] -= 1
+        if item[1] <= 0:
+            del self._items[key]
+            self.disposed += 1
+            if self.dispose is not None:
+                self.dispose(item[0])
+
+    def refs(self, key):
+        item = self._items.get(key)
+        return 0 if item is None else item[1]
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self):
+        return {
+            "live": len(self._items),
+            "references": sum(item[1] for item in self._items.values()),
+            "created": self.created,
+            "disposed": self.disposed,
+        }
+
+def sceneReport(tree):
+    """ GPU resource counts for a dumpData tree, one per object vs pooled """
+    entities = 0
+    meshes = set()
+    colors = set()
+    primitives = 0
+    instanced = 0
+    batches = 0
+    def walk(entries, batched):
+        nonlocal entities, primitives, instanced, batches
+        for e in entries:
+            if e["type"] == "group":
+                children = e["children"]
+                inst = e.get("instanced", False) and homogeneous(children) is not None
+                if inst:
+                    batches += 1
+                walk(children, inst)
+                continue
+            entities += 1
+            if e["shape"] in ("box", "sphere"):
+                primitives += 1
+                meshes.add(meshKey(e["shape"], *e["size"]))
+                if batched:
+                    instanced += 1
+            colors.add(colorKey(e["color"]))
+    walk(tree, False)
+    return {
+        "entities": entities,
+        "unpooled": { "meshes": primitives, "materials": entities },
+        "pooled": { "meshes": len(meshes), "materials": len(colors) },
+        "instanced": { "batches": batches, "instances": instanced,
+            "entities": entities - instanced + batches },
+    }
+
+def homogeneous(children):
+    """ The shared mesh key when every child is the same box or sphere, else None """
+    key = None
+    for e in children:
+        if e["type"] != "entity" or e["shape"] not in ("box", "sphere"):
+            return None
+        k = meshKey(e["shape"], *e["size"])
+        if key is not None and k != key:
+            return None
+        key = k
+    return key
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != "report":
+        print("usage: respool.py report SCENE.json")
+        sys.exit(1)
+    tree = json.load(open(sys.argv[2]))
+    if isinstance(tree, dict):
+        tree = tree["scene"]
+    print(json.dumps(sceneReport(tree), indent=2))
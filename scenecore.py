@@ -0,0 +1,1687 @@
+import os
+import json
+import time
+import numpy as np
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from persist import SceneWriter
+from journal import SceneJournal
+from binscene import BinaryScene, SceneBuilder, isBinary
+from respool import SharedPool, meshKey
+from spatial import SceneIndex
+from history import SceneHistory
+from scenestore import SceneStore, Column, ColorColumn, columns
+from tracing import traced, tracedCallback
+
+DATA_DIR = os.path.expanduser("~/.pyqt3dviewer")
+DATA_FILE = os.path.join(DATA_DIR, "data.json")
+
+# transforms, colors and sizes of every node live in shared numpy columns
+scene_store = SceneStore()
+
+def _readScene(path):
+    if isBinary(path):
+        with BinaryScene(path) as scene:
+            return scene.tree()
+    data = json.load(open(path))
+    return data["scene"] if isinstance(data, dict) else data
+
+# one parsed tree per referenced scene file, however many groups load it
+payload_pool = SharedPool(_readScene)
+
+# nodes of loaded payloads kept before collapsed ones are unloaded
+PAYLOAD_BUDGET = 50000
+
+def inject_generic_repr(cls):
+    """ Injects a generic repr function """
+    def generic_repr(that):
+        class_items = ['{}={}'.format(k, v) for k, v in that.__dict__.items()
+            if k not in ['entity', 'transform', 'mesh', 'meterial', 'placeholder', 'lod', 'batch']]
+        class_items += ['{}={}'.format(k, getattr(that, k)) for k in columns(type(that))]
+        return '<{} '.format(that.__class__.__name__) + ', '.join(class_items) + '>'
+
+    cls.__repr__ = generic_repr
+    return cls
+
+class ChildList():
+    """ Child ids in order, with O(1) append, remove and membership
+
+    Positions are served from a list that is rebuilt on the first index
+    after a removal, so the tree view pays for it once per change.
+    """
+    __slots__ = ("_ids", "_order")
+
+    def __init__(self, ids=()):
+        self._ids = dict.fromkeys(ids)
+        self._order = None
+
+    def append(self, _id):
+        self._ids[_id] = None
+        if self._order is not None:
+            self._order.append(_id)
+
+    def remove(self, _id):
+        del self._ids[_id]
+        self._order = None
+
+    def __contains__(self, _id):
+        return _id in self._ids
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __reversed__(self):
+        return reversed(list(self._ids))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, k):
+        if self._order is None:
+            self._order = list(self._ids)
+        return self._order[k]
+
+    def __repr__(self):
+        return repr(list(self._ids))
+
+@inject_generic_repr
+class Node():
+    """ Scene graph node without any Qt objects
+
+    Subclasses in a binding layer mirror the node into a renderer by
+    overriding the sync, applyTransform, colorChanged, shapeChanged,
+    urlChanged, scaleChanged, attach, detach and setVisible hooks, which do
+    nothing here. sync runs once the initial values are in the store.
+    """
+    _store = scene_store
+
+    def __init__(self, kind=None):
+        self.name = None
+        self.type = None
+        self.idnum = 0
+        self.parent = 0
+        self._row = None if kind is None else self._store.alloc(kind)
+
+    def setName(self, _name):
+        self.name = _name
+
+    def destroy(self, data=None):
+        pass
+
+    def release(self):
+        if self._row is not None:
+            self._store.free(self._row)
+            self._row = None
+
+    def assignID(self, _id):
+        self.idnum = _id
+
+    def sync(self):
+        pass
+
+    def setVisible(self, on):
+        pass
+
+@inject_generic_repr
+class RootNode(Node):
+    def __init__(self):
+        super().__init__()
+        self.name = "root"
+        self.type = "root"
+        self.children = ChildList()
+        self.parent = None
+
+    def destroy(self, data=None):
+        raise RuntimeError("Root cannot be destroyed")
+
+class TransformNode(Node):
+    dx = Column("pos", 0)
+    dy = Column("pos", 1)
+    dz = Column("pos", 2)
+    rx = Column("pos", 3)
+    ry = Column("pos", 4)
+    rz = Column("pos", 5)
+    color = ColorColumn()
+
+    def setTrans(self, dx=None, dy=None, dz=None):
+        if dx is not None:
+            self.dx = dx
+        if dy is not None:
+            self.dy = dy
+        if dz is not None:
+            self.dz = dz
+        self.applyTransform()
+
+    def setRotate(self, rx=None, ry=None, rz=None):
+        if rx is not None:
+            self.rx = rx
+        if ry is not None:
+            self.ry = ry
+        if rz is not None:
+            self.rz = rz
+        self.applyTransform()
+
+    def applyTransform(self):
+        """ Called after dx..rz changed """
+        pass
+
+    def setParent(self, _id, par):
+        self.parent = _id
+        self._store.parent[self._row] = -1 if par._row is None else par._row
+        par.children.append(self.idnum)
+        self.attach(par)
+
+    def attach(self, par):
+        pass
+
+    def moveTo(self, _id, data):
+        """ Detaches from the current parent and appends to the children of _id """
+        old = data[self.parent]
+        old.children.remove(self.idnum)
+        self.detach(old)
+        self.setParent(_id, data[_id])
+
+    def detach(self, par):
+        pass
+
+    def destroy(self, data=None):
+        if self.parent is not None:
+            data[self.parent].children.remove(self.idnum)
+        self.release()
+
+@inject_generic_repr
+class EntityNode(TransformNode):
+    def __init__(self, name, shape):
+        super().__init__(shape)
+        self.name = name
+        self.type = "entity"
+        self.shape = shape
+
+    def setCallback(self, fn):
+        pass
+
+    def setColor(self, r, g, b):
+        self.color = (r, g, b)
+        self.colorChanged()
+
+    def colorChanged(self):
+        pass
+
+    def meshKey(self):
+        return None
+
+    def shapeChanged(self):
+        pass
+
+@inject_generic_repr
+class BoxNode(EntityNode):
+    length = Column("size", 0)
+    width = Column("size", 1)
+    height = Column("size", 2)
+
+    def __init__(self, name):
+        super().__init__(name, "box")
+        self.length = 5
+        self.width  = 5
+        self.height = 5
+
+    def setSize(self, l=None, w=None, h=None):
+        if l is not None:
+            self.length = l
+        if w is not None:
+            self.width = w
+        if h is not None:
+            self.height = h
+        self.shapeChanged()
+
+    def meshKey(self):
+        return meshKey("box", self.length, self.width, self.height)
+
+@inject_generic_repr
+class SphereNode(EntityNode):
+    radius = Column("size", 0)
+
+    def __init__(self, name):
+        super().__init__(name, "sphere")
+        self.radius = 5
+
+    def setRadius(self, r):
+        self.radius = r
+        self.shapeChanged()
+
+    def meshKey(self):
+        return meshKey("sphere", self.radius)
+
+@inject_generic_repr
+class STLNode(EntityNode):
+    scale = Column("scale")
+
+    def __init__(self, name):
+        super().__init__(name, "stl")
+        self.url = None
+        self.triangle_count = 0
+        self.bounds = None
+        self.parse_time = 0
+        self.load_error = None
+        self.load_progress = 0.0
+        self._cached = None
+
+    def setURL(self, _url):
+        if _url is None:
+            return
+        self.url = _url
+        self.urlChanged()
+
+    def urlChanged(self):
+        pass
+
+    def setScale(self, s):
+        self.scale = s
+        self.scaleChanged()
+
+    def scaleChanged(self):
+        pass
+
+@inject_generic_repr
+class GroupNode(TransformNode):
+    def __init__(self, name):
+        super().__init__("group")
+        self.name = name
+        self.type = "group"
+        self.children = ChildList()
+        self.instanced = False
+        # scene file whose nodes are loaded as the children on demand
+        self.ref = None
+        self.payload = None
+
+    def setInstanced(self, on, data):
+        self.instanced = on
+
+    def release(self):
+        if self.payload is not None:
+            payload_pool.release(self.payload)
+            self.payload = None
+        super().release()
+
+    def destroy(self, data=None):
+        super().destroy(data)
+        def recDestroy(i):
+            if i in data:
+                if data[i].type == 'group':
+                    for j in data[i].children:
+                        recDestroy(j)
+                data[i].release()
+                del data[i]
+        for j in self.children:
+            recDestroy(j)
+
+    def clearChildren(self, data):
+        children = self.children
+        self.children = ChildList()
+        for i in children:
+            data[i].parent = None
+            data[i].destroy(data)
+            del data[i]
+
+# fields that previewValue applies while an edit is still in progress
+PREVIEW_FIELDS = ("dx", "dy", "dz", "rx", "ry", "rz", "color",
+    "length", "width", "height", "radius", "scale")
+
+class SceneBatch():
+    """ Notifications deferred by SceneCore.batch() until the outermost one ends """
+    def __init__(self):
+        self.ids = set()
+        self.changed = []
+        self.structure = False
+        self.tree = False
+        self.select = None
+        self.selection = False
+        self.history = False
+        self.detail = False
+        self.disk = False
+        self.cull = False
+        self.groups = set()
+
+# seconds of node building per event loop turn while loading progressively
+LOAD_SLICE = 0.012
+
+def countNodes(entries):
+    return sum(1 + (countNodes(e["children"]) if e["type"] == "group" else 0) for e in entries)
+
+class ProgressiveLoad():
+    """ Children still to be built, as [parent id, entries, next position] per group """
+    def __init__(self, total, seq, scene=None):
+        self.queue = deque()
+        self.total = total
+        self.done = 0
+        self.seq = seq
+        self.scene = scene
+        self.instanced = []
+        self.started = time.perf_counter()
+
+class SceneCore():
+    """ Scene graph, editing, loading and saving without Qt
+
+    Batch jobs use it directly; DataModel in model.py binds it to Qt3D
+    entities by swapping in node classes from NODES.
+    """
+    NODES = { "root": RootNode, "group": GroupNode, "box": BoxNode,
+        "sphere": SphereNode, "stl": STLNode }
+
+    def __init__(self, save_interval=1.0, journal=False, path=DATA_FILE, progressive=False,
+            readonly=False):
+        self._data = {}
+        self._sel = 0
+        # selected ids in selection order, _sel is the one in the detail panel
+        self._selection = {}
+        self._no = 0
+        self._index = SceneIndex(self._data, scene_store)
+        self._culled = set()
+        # hidden flag per index item and the index generation it belongs to
+        self._cull_mask = None
+        self._cull_generation = -1
+        self._cull_planes = None
+        self._refs = set()
+        self._visible_refs = set()
+        self._expanded = set()
+        # loaded payload groups, least recently used first, with their node counts
+        self._payloads = OrderedDict()
+        self.payload_budget = PAYLOAD_BUDGET
+
+        self._path = path
+        self._binary = path.endswith(".p3ds")
+        self._journal_path = os.path.splitext(path)[0] + ".journal"
+
+        # readonly scenes replay a leftover journal in memory but never touch the files
+        self._readonly = readonly
+        self._journal_mode = journal and not readonly
+        self._journal = None
+        self._replaying = False
+
+        self._update_tree_callback = None
+        self._change_tree_callback = None
+        self._update_detail_callback = None
+        self._selection_callback = None
+        self._batch_callback = None
+        self._load_callback = None
+        self._batch = None
+        self._batch_depth = 0
+        # created once the initial scene is in, loading is not undoable
+        self.history = None
+        self._undoing = False
+        self._history_callback = None
+        # values before a preview or drag, recorded as the old side of the edit
+        self._preview_old = {}
+        self._drag = None
+
+        self._progressive = progressive
+        self.loading = None
+        self.load_time = None
+
+        self._writer = None if readonly else SceneWriter(path, save_interval)
+        self._save_pending = False
+
+        self.initData()
+
+        self.history = SceneHistory()
+
+    def createNode(self, kind, name=None):
+        if kind == "root":
+            return self.NODES["root"]()
+        return self.NODES[kind](name)
+
+    def children(self, _id=0):
+        return list(self._data[_id].children)
+
+    def scheduleSave(self):
+        """ Asks for a snapshot, taken here by the next flushToFile or close """
+        self._save_pending = True
+
+    def takePendingSave(self):
+        pending = self._save_pending
+        self._save_pending = False
+        return pending
+
+    def assignCallback(self, s, fn):
+        fn = tracedCallback("callback." + s, fn)
+        if s == "tree":
+            self._update_tree_callback = fn
+            self.updateTree()
+        elif s == "tree-change":
+            self._change_tree_callback = fn
+        elif s == "detail":
+            self._update_detail_callback = fn
+            self.updateDetail()
+        elif s == "selection":
+            self._selection_callback = fn
+        elif s == "batch":
+            self._batch_callback = fn
+        elif s == "load":
+            self._load_callback = fn
+        elif s == "history":
+            self._history_callback = fn
+            self.updateHistory()
+
+    @contextmanager
+    def batch(self):
+        """ Defers tree, detail and disk refreshes to the end of the outermost batch
+
+        The yielded SceneBatch collects the changed ids, which are also passed
+        to the "batch" callback on commit.
+        """
+        if self._batch is None:
+            self._batch = SceneBatch()
+        self._batch_depth += 1
+        # everything recorded inside is undone in one step
+        history = self.history
+        if history is not None:
+            history.begin()
+        try:
+            yield self._batch
+        finally:
+            if history is not None:
+                history.end()
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                b = self._batch
+                self._batch = None
+                self.commitBatch(b)
+
+    @traced("model.commitBatch")
+    def commitBatch(self, b):
+        for i in b.groups:
+            self.refreshBatch(i)
+        if b.cull:
+            self.recull()
+        if b.structure or b.tree:
+            self.updateTree()
+        else:
+            for i in dict.fromkeys(b.changed):
+                if i in self._data:
+                    self.changeTree("change", i)
+        if b.select is not None:
+            self.changeTree("select", b.select if b.select in self._data else 0)
+        if b.selection:
+            self.updateSelection()
+        if b.detail:
+            self.updateDetail()
+        if b.disk:
+            self.dumpToFile()
+        if self._batch_callback is not None and b.ids:
+            self._batch_callback(b.ids)
+        if b.history:
+            self.updateHistory()
+
+    def initData(self):
+        self._data[0] = self.createNode("root")
+        if self._progressive and os.path.exists(self._path):
+            self.beginLoading()
+            return
+        start = time.perf_counter()
+        with self.batch():
+            self.loadInitial()
+        self.load_time = time.perf_counter() - start
+
+    def loadInitial(self):
+        seq = 0
+        if os.path.exists(self._path) and self._binary:
+            print("load from file")
+            with BinaryScene(self._path) as scene:
+                seq = scene.seq
+                self._no = scene.no
+                self.loadScene(scene)
+        elif os.path.exists(self._path):
+            print("load from file")
+            data = json.load(open(self._path))
+            if isinstance(data, dict):
+                # snapshot written by journal compaction
+                seq = data["seq"]
+                self._no = data["no"]
+                data = data["scene"]
+            for entry in data:
+                self.loadData(entry, 0)
+        self.openJournal(seq)
+
+    def beginLoading(self):
+        """ Builds the scene in time slices on the event loop, top-level nodes first """
+        print("load from file")
+        if self._binary:
+            scene = BinaryScene(self._path)
+            self._no = scene.no
+            load = ProgressiveLoad(len(scene), scene.seq, scene)
+            load.queue.append([0, list(scene.children(-1)), 0])
+        else:
+            data = json.load(open(self._path))
+            seq = 0
+            if isinstance(data, dict):
+                seq = data["seq"]
+                self._no = data["no"]
+                data = data["scene"]
+            self.reserveIDs(data)
+            load = ProgressiveLoad(countNodes(data), seq)
+            load.queue.append([0, data, 0])
+        self.loading = load
+        self.scheduleSlice()
+
+    def reserveIDs(self, entries):
+        """ Numbers the entries in pre-order like loadData, so journals replay onto the same nodes """
+        stack = list(reversed(entries))
+        while stack:
+            entry = stack.pop()
+            entry["id"] = self.takeID(entry.get("id"))
+            if entry["type"] == "group" and entry.get("ref") is None:
+                stack.extend(reversed(entry["children"]))
+
+    @traced("model.loadSlice")
+    def loadSlice(self):
+        load = self.loading
+        if load is None:
+            return
+        deadline = time.perf_counter() + LOAD_SLICE
+        created = []
+        with self.batch():
+            while load.queue and time.perf_counter() < deadline:
+                item = load.queue[0]
+                parent, entries, pos = item
+                if pos >= len(entries):
+                    load.queue.popleft()
+                    continue
+                item[2] += 1
+                if load.scene is not None:
+                    entry = load.scene.node(entries[pos])
+                    children = list(load.scene.children(entries[pos])) if entry["type"] == "group" else None
+                else:
+                    entry = entries[pos]
+                    children = entry.get("children")
+                num = self.loadNode(entry, parent, deep=False)
+                created.append(num)
+                if entry["type"] == "group":
+                    # a group's children wait behind the rest of its level
+                    if children and entry.get("ref") is None:
+                        load.queue.append([num, children, 0])
+                    if entry.get("instanced"):
+                        load.instanced.append(num)
+                load.done += 1
+        if self._change_tree_callback is not None:
+            for i in created:
+                self.changeTree("loaded", i)
+        else:
+            self.updateTree()
+        if load.queue:
+            self.reportLoad()
+            self.scheduleSlice()
+        else:
+            self.finishLoading()
+
+    def prioritizeGroup(self, _id):
+        """ Builds the children of an expanded group before the rest of the queue """
+        if self.loading is None:
+            return
+        queue = self.loading.queue
+        for k, item in enumerate(queue):
+            if item[0] == _id:
+                del queue[k]
+                queue.appendleft(item)
+                return
+
+    def finishLoading(self):
+        load = self.loading
+        with self.batch():
+            for i in load.instanced:
+                self._data[i].setInstanced(True, self._data)
+        if load.scene is not None:
+            load.scene.close()
+        self.loading = None
+        self.openJournal(load.seq)
+        self.load_time = time.perf_counter() - load.started
+        self.reportLoad(load)
+
+    def reportLoad(self, load=None):
+        load = load or self.loading
+        if self._load_callback is not None:
+            self._load_callback(load.done, load.total)
+
+    def scheduleSlice(self):
+        """ Asks for the next loadSlice, bindings run it on their event loop """
+
+    def openJournal(self, seq):
+        journal = SceneJournal(self._journal_path)
+        records = journal.load(seq)
+        if records:
+            print("replay {} journal records".format(len(records)))
+            self._replaying = True
+            for rec in records:
+                self.replayChange(rec)
+            self._replaying = False
+        if self._journal_mode:
+            self._journal = journal
+            journal.open()
+        elif os.path.exists(self._journal_path) and not self._readonly:
+            if records:
+                self.saveSnapshot()
+                self._writer.flush()
+            journal.remove()
+
+    def expandGroup(self, _id):
+        """ A group opened in the tree, its payload is loaded """
+        self.prioritizeGroup(_id)
+        self._expanded.add(_id)
+        if _id in self._payloads:
+            self._payloads.move_to_end(_id)
+        self.loadPayload(_id)
+
+    def collapseGroup(self, _id):
+        self._expanded.discard(_id)
+        self.trimPayloads()
+
+    def isReferenced(self, _id):
+        """ Whether the node is content of a referenced file, which is never saved """
+        p = self._data[_id].parent
+        while p:
+            if self._data[p].ref is not None:
+                return True
+            p = self._data[p].parent
+        return False
+
+    def insideReference(self, _id):
+        """ Whether nodes added under the node would end up in a referenced scene """
+        el = self._data[_id]
+        return el.type == "group" and (el.ref is not None or self.isReferenced(_id))
+
+    def refPath(self, _id):
+        """ Absolute path of a group's reference, relative to the file holding the group """
+        base = os.path.dirname(os.path.abspath(self._path))
+        p = self._data[_id].parent
+        while p:
+            if self._data[p].payload is not None:
+                base = os.path.dirname(self._data[p].payload)
+                break
+            p = self._data[p].parent
+        return os.path.normpath(os.path.join(base, os.path.expanduser(self._data[_id].ref)))
+
+    def setReference(self, _id, ref):
+        el = self._data[_id]
+        if el.ref is None and el.children:
+            print("only an empty group can reference a scene file")
+            return
+        self.unloadPayload(_id)
+        el.ref = ref
+        if ref is not None:
+            self._refs.add(_id)
+            if _id in self._expanded:
+                self.loadPayload(_id)
+
+    @traced("model.loadPayload")
+    def loadPayload(self, _id):
+        """ Builds the nodes of the file a group references as its children """
+        el = self._data.get(_id)
+        if (self.loading is not None or el is None or el.type != "group" or
+                el.ref is None or el.payload is not None):
+            return
+        path = self.refPath(_id)
+        p = el.parent
+        while p:
+            if self._data[p].payload == path:
+                print("skip recursive reference", el.ref)
+                return
+            p = self._data[p].parent
+        try:
+            entries = payload_pool.acquire(path)
+        except (OSError, ValueError, KeyError) as e:
+            print("load reference failed:", path, e)
+            return
+        el.payload = path
+        with self.batch():
+            created = [self.loadNode(entry, _id, fresh=True) for entry in entries]
+            self.refreshBatch(_id)
+            self.recull()
+        self._payloads[_id] = countNodes(entries)
+        if self._change_tree_callback is not None:
+            for i in created:
+                self.changeTree("loaded", i)
+        else:
+            self.updateTree()
+        self.trimPayloads()
+
+    @traced("model.unloadPayload")
+    def unloadPayload(self, _id):
+        """ Drops the nodes built from a group's reference, nested payloads included """
+        el = self._data.get(_id)
+        if el is None or el.type != "group" or el.payload is None:
+            return
+        self.changeTree("unload", _id)
+        stack = list(el.children)
+        while stack:
+            child = self._data[stack.pop()]
+            if child.type == "group":
+                self._payloads.pop(child.idnum, None)
+                stack.extend(child.children)
+        el.clearChildren(self._data)
+        payload_pool.release(el.payload)
+        el.payload = None
+        self._payloads.pop(_id, None)
+        self._culled = set(i for i in self._culled if i in self._data)
+        self._index.invalidate()
+        self.refreshBatch(_id)
+        self.changeTree("unloaded", _id)
+        for i in [i for i in self._selection if i not in self._data]:
+            del self._selection[i]
+        if self._sel not in self._data:
+            self._sel = 0
+            self.updateDetail()
+            self.changeTree("select", 0)
+
+    def trimPayloads(self):
+        """ Unloads the least recently used payloads that are neither expanded nor in view """
+        for i in [i for i in self._payloads if i not in self._data]:
+            del self._payloads[i]
+        while sum(self._payloads.values()) > self.payload_budget:
+            victim = next((i for i in self._payloads
+                if i not in self._expanded and i not in self._visible_refs), None)
+            if victim is None:
+                return
+            self.unloadPayload(victim)
+
+    def loadVisiblePayloads(self, planes):
+        """ Loads the payloads of reference groups whose origin is inside the view planes """
+        self._refs = set(i for i in self._refs if i in self._data)
+        if planes is None or not self._refs or self.loading is not None:
+            self._visible_refs = set()
+            return
+        visible = self._index.originsInFrustum(list(self._refs), planes)
+        self._visible_refs = set(visible)
+        for i in visible:
+            if i not in self._data:
+                continue
+            if self._data[i].payload is None:
+                self.loadPayload(i)
+            elif i in self._payloads:
+                self._payloads.move_to_end(i)
+
+    def clearData(self):
+        with self.batch() as b:
+            b.structure = True
+            for i in list(self._data[0].children):
+                self._data[i].destroy(self._data)
+                del self._data[i]
+        self._sel = 0
+        self._selection = {}
+        self._no = 0
+        self._culled = set()
+        self._refs = set()
+        self._visible_refs = set()
+        self._expanded = set()
+        self._payloads = OrderedDict()
+        self._index.invalidate()
+        if self.history is not None:
+            self.history.clear()
+            self.updateHistory()
+
+    def replayChange(self, rec):
+        try:
+            if rec["op"] == "add":
+                self.createShape(rec["shape"], self.takeID(rec["id"]), rec["parent"], rec["name"])
+            elif rec["op"] == "group":
+                self.createGroup(self.takeID(rec["id"]), rec["parent"], rec["name"])
+            elif rec["op"] == "del":
+                self.delShape(rec["id"])
+            elif rec["op"] == "set":
+                self.setValue(rec["id"], **rec["values"])
+            elif rec["op"] == "parent":
+                self.reparentNodes([rec["id"]], rec["parent"])
+            elif rec["op"] == "load":
+                self.restoreNodes([rec["parent"]], [rec["node"]])
+        except KeyError:
+            print("skip journal record", rec)
+
+    def journalChange(self, op, **fields):
+        if self._batch is not None:
+            self._batch.ids.add(fields["id"])
+        if self._journal is not None and not self._replaying:
+            if fields["id"] in self._data and self.isReferenced(fields["id"]):
+                return
+            self._journal.append(op, **fields)
+
+    def takeID(self, _id=None):
+        if _id is None:
+            self._no += 1
+            return self._no
+        self._no = max(self._no, _id)
+        return _id
+
+    @traced("model.loadData")
+    def loadData(self, data, parent):
+        with self.batch() as b:
+            b.structure = True
+            self.loadNode(data, parent)
+
+    def loadNode(self, data, parent, deep=True, fresh=False):
+        # payload nodes get new ids, the file may be loaded under many groups
+        num = self.takeID(None if fresh else data.get("id"))
+        if data["type"] == "entity":
+            el = self.createNode(data["shape"], data["name"])
+            row = el._row
+            scene_store.color[row] = data["color"]
+            if data["shape"] == "box":
+                scene_store.size[row] = data["size"]
+            elif data["shape"] == "sphere":
+                scene_store.size[row, 0] = data["size"][0]
+            elif data["shape"] == "stl":
+                scene_store.scale[row] = data["scale"]
+        else:
+            el = self.createNode("group", data["name"])
+        scene_store.pos[el._row] = data["pos"]
+        self._data[num] = el
+        el.assignID(num)
+        # the values are in the store before the node is built and attached once
+        el.sync()
+        el.setParent(parent, self._data[parent])
+        if el.type == "entity":
+            el.setCallback(self.touchElement)
+            if el.shape == "stl":
+                el.setURL(data["url"])
+        else:
+            el.ref = data.get("ref")
+            if el.ref is not None:
+                self._refs.add(num)
+            if deep:
+                if el.ref is None:
+                    for entry in data["children"]:
+                        self.loadNode(entry, num, fresh=fresh)
+                if data.get("instanced"):
+                    el.setInstanced(True, self._data)
+        self._index.invalidate()
+        if self._batch is not None:
+            self._batch.ids.add(num)
+        return num
+
+    @traced("model.loadScene")
+    def loadScene(self, scene, i=-1, parent=0):
+        with self.batch():
+            self.loadSceneNode(scene, i, parent)
+
+    def loadSceneNode(self, scene, i, parent):
+        # decodes one node at a time straight from the mapped columns
+        for j in scene.children(i):
+            entry = scene.node(j)
+            instanced = entry.pop("instanced", False)
+            self.loadData(entry, parent)
+            if entry["type"] == "group":
+                self.loadSceneNode(scene, j, entry["id"])
+                if instanced:
+                    self._data[entry["id"]].setInstanced(True, self._data)
+
+    def columnValues(self, ids=None):
+        """ pos, color and size lists of every node (or of ids) from one gather of the store columns """
+        if ids is None:
+            ids = [i for i in self._data if i != 0]
+        rows = [self._data[i]._row for i in ids]
+        store = scene_store
+        pos = store.pos[rows].tolist()
+        color = store.color[rows].tolist()
+        size = store.size[rows].tolist()
+        scale = store.scale[rows].tolist()
+        return { i: (pos[k], color[k], size[k], scale[k]) for k, i in enumerate(ids) }
+
+    def dumpBinary(self, seq=0):
+        builder = SceneBuilder()
+        cols = self.columnValues()
+        def walk(i, parent):
+            el = self._data[i]
+            pos, color, size, scale = cols[i]
+            if el.type == "group":
+                k = builder.addNode("group", parent, i, el.name, pos, url=el.ref,
+                    instanced=el.instanced)
+                if el.ref is None:
+                    for j in el.children:
+                        walk(j, k)
+                builder.closeNode(k)
+            elif el.shape == "box":
+                builder.addNode("box", parent, i, el.name, pos, color, size)
+            elif el.shape == "sphere":
+                builder.addNode("sphere", parent, i, el.name, pos, color, size[:1])
+            elif el.shape == "stl":
+                builder.addNode("stl", parent, i, el.name, pos, color, [scale], el.url)
+        for j in self._data[0].children:
+            walk(j, -1)
+        return builder.tobytes(seq, self._no)
+
+    def dumpData(self, i, ids=False, cols=None):
+        if cols is None:
+            cols = self.columnValues()
+        if i == 0:
+            return [self.dumpData(j, ids, cols) for j in self._data[0].children]
+        rst = {}
+        el = self._data[i]
+        pos, color, size, scale = cols[i]
+        rst["name"] = el.name
+        if ids:
+            rst["id"] = i
+        if el.type == "entity":
+            rst["type"] = "entity"
+            rst["pos"] = pos
+            rst["color"] = color
+            if el.shape == "box":
+                rst["shape"] = "box"
+                rst["size"] = size
+            elif el.shape == "sphere":
+                rst["shape"] = "sphere"
+                rst["size"] = size[:1]
+            elif el.shape == "stl":
+                rst["shape"] = "stl"
+                rst["scale"] = scale
+                rst["url"] = el.url
+            else:
+                rst["shape"] = el.shape
+        elif el.type == "group":
+            rst["type"] = "group"
+            rst["pos"] = pos
+            if el.instanced:
+                rst["instanced"] = True
+            if el.ref is not None:
+                # referenced content stays in its own file
+                rst["ref"] = el.ref
+                rst["children"] = []
+            else:
+                rst["children"] = [self.dumpData(j, ids, cols) for j in self._data[i].children]
+        return rst
+
+    @traced("model.dumpToFile")
+    def dumpToFile(self):
+        if self._replaying or self._readonly:
+            return
+        if self._batch is not None:
+            self._batch.disk = True
+            return
+        if self._journal is not None:
+            if self._journal.needsCompaction():
+                self.compactJournal()
+            return
+        # only marks the scene dirty, the snapshot is taken once per interval
+        # and written on the writer thread
+        self._writer.markDirty()
+        self.scheduleSave()
+
+    @traced("model.saveSnapshot")
+    def saveSnapshot(self):
+        if self.loading is not None or self._readonly:
+            return
+        if self._binary:
+            self._writer.submit(self.dumpBinary())
+        else:
+            self._writer.submit(self.dumpData(0))
+
+    @traced("model.compactJournal")
+    def compactJournal(self):
+        journal = self._journal
+        seq = journal.seq
+        journal.compacting = True
+        self._writer.markDirty()
+        if self._binary:
+            data = self.dumpBinary(seq)
+        else:
+            data = { "seq": seq, "no": self._no, "scene": self.dumpData(0, True) }
+        self._writer.submit(data, lambda: journal.truncate(seq), journal.abortCompaction)
+
+    def flushToFile(self):
+        if self._readonly:
+            return
+        if self.takePendingSave():
+            self.saveSnapshot()
+        self._writer.flush()
+
+    def close(self):
+        if self._readonly:
+            if self.loading is not None and self.loading.scene is not None:
+                self.loading.scene.close()
+            self.loading = None
+            return
+        if self.loading is not None:
+            # nothing can have changed, keep the file as it is
+            if self.loading.scene is not None:
+                self.loading.scene.close()
+            self.loading = None
+            self.takePendingSave()
+            self._writer.close()
+            return
+        if self.takePendingSave():
+            self.saveSnapshot()
+        if self._journal is not None and self._journal.records > 0:
+            self.compactJournal()
+        self._writer.close()
+        if self._journal is not None:
+            self._journal.close()
+
+    def persistStats(self):
+        if self._writer is None:
+            return None
+        return self._writer.stats()
+
+    def findCurrentParent(self):
+        if self._data[self._sel].type == 'group':
+            return self._sel
+        else:
+            return 0
+
+    def createShape(self, shape, num, par, name):
+        self._data[num] = self.createNode(shape, name)
+        self._data[num].assignID(num)
+        self._data[num].setCallback(self.touchElement)
+        self._data[num].sync()
+        self._data[num].setParent(par, self._data[par])
+        self._index.invalidate()
+
+    def createGroup(self, num, par, name):
+        self._data[num] = self.createNode("group", name)
+        self._data[num].assignID(num)
+        self._data[num].sync()
+        self._data[num].setParent(par, self._data[par])
+        self._index.invalidate()
+
+    @traced("model.addShape")
+    def addShape(self, shape):
+        # the scene is read only until progressive loading finishes
+        if self.loading is not None:
+            return
+        par = self.findCurrentParent()
+        if self.insideReference(par):
+            print("cannot add nodes to a referenced scene")
+            return
+        num = self.takeID()
+        name = "{} {}".format(shape, num)
+        self.createShape(shape, num, par, name)
+        self.refreshBatch(par)
+        self.journalChange("add", id=num, parent=par, shape=shape, name=name)
+        self.recordChange(self.nodesRecord("add", [num]))
+
+        self.changeTree("insert", num)
+        self.dumpToFile()
+
+    @traced("model.addGroup")
+    def addGroup(self):
+        if self.loading is not None:
+            return
+        par = self.findCurrentParent()
+        if self.insideReference(par):
+            print("cannot add nodes to a referenced scene")
+            return
+        num = self.takeID()
+        name = "{} {}".format("Group", num)
+        self.createGroup(num, par, name)
+        self.refreshBatch(par)
+        self.journalChange("group", id=num, parent=par, name=name)
+        self.recordChange(self.nodesRecord("add", [num]))
+
+        self.changeTree("insert", num)
+        self.dumpToFile()
+
+    @traced("model.delShape")
+    def delShape(self, _id=None):
+        if self.loading is not None:
+            return
+        if _id is None:
+            _id = self._sel
+        if _id != 0:
+            el = self._data[_id]
+            self.recordChange(self.nodesRecord("del", [_id]))
+            self.journalChange("del", id=_id)
+            self.changeTree("remove", _id)
+            removed = self.subtreeIDs(_id)
+            self._culled.difference_update(removed)
+            for i in removed:
+                self._preview_old.pop(i, None)
+            el.destroy(self._data)
+            del self._data[_id]
+            self._index.invalidate()
+            self.refreshBatch(el.parent)
+            self.changeTree("removed", _id)
+            self._sel = 0
+            self._selection = {}
+            self.updateDetail()
+            self.changeTree("select", 0)
+            self.dumpToFile()
+
+    def subtreeIDs(self, _id):
+        """ The node and all nodes below it """
+        rst = []
+        stack = [_id]
+        while stack:
+            i = stack.pop()
+            rst.append(i)
+            if self._data[i].type == "group":
+                stack.extend(self._data[i].children)
+        return rst
+
+    @traced("model.selectElement")
+    def selectElement(self, _id):
+        self._sel = int(_id)
+        self._selection = dict.fromkeys([self._sel]) if self._sel != 0 else {}
+        self.updateDetail()
+
+    def touchElement(self, _id):
+        self.selectElement(_id)
+        self.changeTree("select", self._sel)
+
+    @traced("model.setSelection")
+    def setSelection(self, ids, current=None):
+        """ Selects many nodes, current (else the last of ids) goes to the detail panel """
+        self._selection = dict.fromkeys(int(i) for i in ids if i != 0 and i in self._data)
+        if current not in self._selection:
+            current = next(reversed(self._selection), 0)
+        self._sel = current
+        self.updateDetail()
+
+    def toggleElement(self, _id):
+        """ Adds a node to the selection or drops it from it, and shows the change in the tree """
+        if _id in self._selection:
+            del self._selection[_id]
+            if self._sel == _id:
+                self._sel = next(reversed(self._selection), 0)
+        elif _id != 0:
+            self._selection[_id] = None
+            self._sel = _id
+        self.updateDetail()
+        self.updateSelection()
+
+    def selection(self):
+        return list(self._selection)
+
+    def selectionRoots(self, ids=None):
+        """ The selected (or given) ids without those that have an ancestor among them """
+        if ids is None:
+            ids = list(self._selection)
+        ids = [i for i in ids if i != 0 and i in self._data]
+        chosen = set(ids)
+        rst = []
+        for i in ids:
+            p = self._data[i].parent
+            while p and p not in chosen:
+                p = self._data[p].parent
+            if not p:
+                rst.append(i)
+        return rst
+
+    @traced("model.delSelection")
+    def delSelection(self):
+        if self.loading is not None:
+            return
+        with self.batch():
+            for i in self.selectionRoots():
+                self.delShape(i)
+
+    def offsetSelection(self, **vargs):
+        """ Moves or rotates the selected nodes, descendants of selected groups follow them """
+        self.offsetNodes(self.selectionRoots(), **vargs)
+
+    def reparentSelection(self):
+        """ Moves the selected nodes into the current group, or to the root when it is not a group """
+        self.reparentNodes(self.selection(), self.findCurrentParent())
+
+    @traced("model.colorNodes")
+    def colorNodes(self, ids, color):
+        """ Gives many entities the same color, written to the store in one step """
+        if self.loading is not None:
+            return
+        ids = [i for i in ids if i in self._data and self._data[i].type == "entity"]
+        if not ids:
+            return
+        rows = [self._data[i]._row for i in ids]
+        old = scene_store.color[rows]
+        scene_store.color[rows] = color
+        self.recordChange({ "op": "color", "ids": np.array(ids), "old": old,
+            "new": scene_store.color[rows] })
+        with self.batch():
+            for i in ids:
+                self._data[i].colorChanged()
+                self.journalChange("set", id=i, values={ "color": list(color) })
+            self.updateDetail()
+            self.dumpToFile()
+
+    @traced("model.reparentNodes")
+    def reparentNodes(self, ids, parent):
+        """ Moves nodes under another group or the root, keeping their local transforms
+
+        Nodes of referenced scenes, and groups the target is inside of, stay where they are.
+        """
+        if self.loading is not None:
+            return
+        target = self._data.get(parent)
+        if target is None or target.type not in ("root", "group"):
+            return
+        if self.insideReference(parent):
+            print("cannot move nodes into a referenced scene")
+            return
+        above = set()
+        p = parent
+        while p is not None:
+            above.add(p)
+            p = self._data[p].parent
+        ids = [i for i in self.selectionRoots(ids) if i not in above
+            and self._data[i].parent != parent and not self.isReferenced(i)]
+        if not ids:
+            return
+        self.recordChange({ "op": "parent", "ids": ids,
+            "old": [self._data[i].parent for i in ids], "new": parent })
+        with self.batch() as b:
+            b.structure = True
+            for i in ids:
+                old = self._data[i].parent
+                self._data[i].moveTo(parent, self._data)
+                self.refreshBatch(old)
+                self.journalChange("parent", id=i, parent=parent)
+            self.refreshBatch(parent)
+            self._index.invalidate()
+            self.recull()
+            self.dumpToFile()
+
+    def editSelection(self, _id, **vargs):
+        """ Applies a detail panel edit of the current node, a color goes to the whole selection """
+        if "color" not in vargs or _id not in self._selection or len(self._selection) < 2:
+            self.setValue(_id, **vargs)
+            return
+        preview = self._preview_old.get(_id, {})
+        if "color" in preview and _id in self._data:
+            # so undo brings back the color from before the preview
+            scene_store.color[self._data[_id]._row] = preview.pop("color")
+        with self.batch():
+            self.colorNodes(self.selection(), vargs.pop("color"))
+            if vargs:
+                self.setValue(_id, **vargs)
+
+    @traced("model.setValue")
+    def setValue(self, _id, **vargs):
+        if self.loading is not None:
+            return
+        # a debounced edit may arrive after its node was deleted
+        if _id != 0 and _id in self._data:
+            old = self.currentValues(_id, vargs)
+            old.update((k, v) for k, v in self._preview_old.pop(_id, {}).items() if k in old)
+            if old:
+                self.recordChange({ "op": "set", "id": _id, "old": old,
+                    "new": { k: vargs[k] for k in old } })
+            if "name" in vargs:
+                self._data[_id].setName(vargs["name"])
+                self.changeTree("change", _id)
+            
+            self.applyValues(_id, vargs)
+            self.journalChange("set", id=_id, values=vargs)
+            self.dumpToFile()
+            self.updateDetail()
+
+    @traced("model.previewValue")
+    def previewValue(self, _id, **vargs):
+        """ Shows an edit in the scene without saving, journaling or refreshing panels """
+        if self.loading is not None:
+            return
+        if _id != 0 and _id in self._data:
+            vargs = { k: v for k, v in vargs.items() if k in PREVIEW_FIELDS }
+            old = self._preview_old.setdefault(_id, {})
+            for k, v in self.currentValues(_id, vargs).items():
+                old.setdefault(k, v)
+            self.applyValues(_id, vargs)
+
+    def currentValues(self, _id, keys):
+        """ The present values of the fields in keys that the node has """
+        el = self._data[_id]
+        rst = {}
+        for k in keys:
+            if k == "color":
+                if el.type == "entity":
+                    rst[k] = list(el.color)
+            elif k in ("instanced", "ref"):
+                if el.type == "group":
+                    rst[k] = getattr(el, k)
+            elif k == "name" or (el.type != "root" and hasattr(el, k)):
+                rst[k] = getattr(el, k)
+        return rst
+
+    def applyValues(self, _id, vargs):
+        if self._data[_id].type == 'entity' or self._data[_id].type == 'group':
+            do_translate = False
+            dx, dy, dz = None, None, None
+            if "dx" in vargs:
+                do_translate = True
+                dx = vargs["dx"]
+            if "dy" in vargs:
+                do_translate = True
+                dy = vargs["dy"]
+            if "dz" in vargs:
+                do_translate = True
+                dz = vargs["dz"]
+            if do_translate:
+                self._data[_id].setTrans(dx, dy, dz)
+            
+            do_rotate = False
+            rx, ry, rz = None, None, None
+            if "rx" in vargs:
+                do_rotate = True
+                rx = vargs["rx"]
+            if "ry" in vargs:
+                do_rotate = True
+                ry = vargs["ry"]
+            if "rz" in vargs:
+                do_rotate = True
+                rz = vargs["rz"]
+            if do_rotate:
+                self._data[_id].setRotate(rx, ry, rz)
+
+        if self._data[_id].type == 'group' and "instanced" in vargs:
+            self._data[_id].setInstanced(bool(vargs["instanced"]), self._data)
+
+        if self._data[_id].type == 'group' and "ref" in vargs:
+            self.setReference(_id, vargs["ref"] or None)
+
+        if self._data[_id].type == 'entity':
+            if "color" in vargs:
+                self._data[_id].setColor(*vargs["color"])
+
+            if self._data[_id].shape == "box":
+                do_change = False
+                l, w, h = None, None, None
+                if "length" in vargs:
+                    do_change = True
+                    l = vargs["length"]
+                if "width" in vargs:
+                    do_change = True
+                    w = vargs["width"]
+                if "height" in vargs:
+                    do_change = True
+                    h = vargs["height"]
+                if do_change:
+                    self._data[_id].setSize(l, w, h)
+            
+            if self._data[_id].shape == "sphere" and "radius" in vargs:
+                self._data[_id].setRadius(vargs["radius"])
+
+            if "length" in vargs or "width" in vargs or "height" in vargs or "radius" in vargs:
+                self.refreshBatch(self._data[_id].parent)
+            
+            if self._data[_id].shape == "stl":
+                if "url" in vargs:
+                    self._data[_id].setURL(vargs["url"])
+                if "scale" in vargs:
+                    self._data[_id].setScale(vargs["scale"])
+
+        if self._data[_id].type in ("entity", "group"):
+            self._index.markDirty(_id)
+            self.recull()
+
+    def refreshBatch(self, _id):
+        if self._batch is not None:
+            self._batch.groups.add(_id)
+            return
+        el = self._data.get(_id)
+        if el is not None and el.type == "group" and el.instanced:
+            el.setInstanced(True, self._data)
+
+    def resourceReport(self):
+        return {
+            "entities": len(self._data) - 1,
+            "payloads": dict(payload_pool.stats(), nodes=sum(self._payloads.values())),
+            "history": self.history.stats() if self.history is not None else None,
+        }
+
+    def spatialIndex(self):
+        return self._index
+
+    def worldMatrix(self, _id):
+        """ 4x4 numpy matrix from the node's space to scene space """
+        return self._index.worldMatrix(_id)
+
+    def worldAABB(self, _id):
+        return self._index.worldAABB(_id)
+
+    def pick(self, origin, direction, extend=False):
+        """ Selects the nearest entity along a scene-space ray, or toggles it with extend """
+        _id = self._index.pick(origin, direction)
+        if _id is not None:
+            if extend:
+                self.toggleElement(_id)
+            else:
+                self.touchElement(_id)
+        return _id
+
+    def cullEntities(self, planes):
+        """ Disables the entities outside the view frustum planes, None shows all """
+        self._cull_planes = planes
+        self.loadVisiblePayloads(planes)
+        index = self._index
+        if planes is None:
+            for i in self._culled:
+                if i in self._data:
+                    self._data[i].setVisible(True)
+            self._culled = set()
+            self._cull_mask = None
+            return
+        mask = index.hiddenMask(planes)
+        if self._cull_mask is not None and self._cull_generation == index.generation:
+            # same items as last time, only the flips cost Python work
+            flipped = np.nonzero(mask != self._cull_mask)[0]
+            for i, off in zip(index.itemIds(flipped), mask[flipped].tolist()):
+                self._data[i].setVisible(not off)
+                if off:
+                    self._culled.add(i)
+                else:
+                    self._culled.discard(i)
+        else:
+            hidden = set(index.itemIds(np.nonzero(mask)[0]))
+            for i in hidden - self._culled:
+                self._data[i].setVisible(False)
+            for i in self._culled - hidden:
+                if i in self._data:
+                    self._data[i].setVisible(True)
+            self._culled = hidden
+        self._cull_mask = mask
+        self._cull_generation = index.generation
+
+    def recull(self):
+        if self._batch is not None:
+            self._batch.cull = True
+            return
+        if self._cull_planes is not None:
+            self.cullEntities(self._cull_planes)
+
+    @traced("model.updateDetail")
+    def updateDetail(self):
+        if self._batch is not None:
+            self._batch.detail = True
+            return
+        if self._update_detail_callback is not None:
+            self._update_detail_callback(self._sel, self._data[self._sel])
+
+    def updateSelection(self):
+        if self._batch is not None:
+            self._batch.selection = True
+            return
+        if self._selection_callback is not None:
+            self._selection_callback(list(self._selection), self._sel)
+        else:
+            self.changeTree("select", self._sel)
+
+    @traced("model.updateTree")
+    def updateTree(self):
+        if self._batch is not None:
+            self._batch.tree = True
+            return
+        if self._update_tree_callback is not None:
+            self._update_tree_callback(self._data, self._sel)
+
+    @traced("model.changeTree")
+    def changeTree(self, op, _id):
+        # op is one of insert, loaded, remove, removed, unload, unloaded, change, select
+        if self._batch is not None:
+            if op == "select":
+                self._batch.select = _id
+            elif op == "change":
+                self._batch.changed.append(_id)
+            else:
+                # structural changes end in one tree reset
+                self._batch.structure = True
+            return
+        if self._change_tree_callback is not None:
+            self._change_tree_callback(op, _id)
+        elif op not in ("remove", "unload"):
+            self.updateTree()
+
+    @traced("model.incUpdate")
+    def incUpdate(self, **vargs):
+        """ Moves the whole selection by a view drag delta, saved once the drag ends """
+        if self.loading is not None:
+            return
+        ids = self.selectionRoots()
+        if not ids:
+            return
+        rows = [self._data[i]._row for i in ids]
+
+        delta = [vargs.get(k, 0) for k in ("dx", "dy", "dz", "rx", "ry", "rz")]
+        if any(delta):
+            if self._drag is None:
+                self._drag = (ids, scene_store.pos[rows])
+            scene_store.offset(rows, delta)
+            for i in ids:
+                self._data[i].applyTransform()
+                self._index.markDirty(i)
+
+        if "update" in vargs and self._drag is not None:
+            # the whole drag becomes one undo step, a plain click saves nothing
+            drag_ids, old = self._drag
+            self._drag = None
+            if drag_ids == ids:
+                self.recordChange({ "op": "pos", "ids": np.array(ids), "old": old,
+                    "new": scene_store.pos[rows] })
+            drag_ids = [i for i in drag_ids if i in self._data]
+            drag_rows = [self._data[i]._row for i in drag_ids]
+            with self.batch():
+                self.recull()
+                for i, p in zip(drag_ids, scene_store.pos[drag_rows].tolist()):
+                    self.journalChange("set", id=i, values=dict(zip(
+                        ("dx", "dy", "dz", "rx", "ry", "rz"), p)))
+                self.updateDetail()
+                self.dumpToFile()
+
+    @traced("model.offsetNodes")
+    def offsetNodes(self, ids, **vargs):
+        """ Moves many nodes by the same dx..rz in one vectorized step """
+        if self.loading is not None:
+            return
+        ids = [i for i in ids if i != 0 and i in self._data]
+        delta = [vargs.get(k, 0) for k in ("dx", "dy", "dz", "rx", "ry", "rz")]
+        if not ids or not any(delta):
+            return
+        rows = [self._data[i]._row for i in ids]
+        old = scene_store.pos[rows]
+        pos = scene_store.offset(rows, delta)
+        self.recordChange({ "op": "pos", "ids": np.array(ids), "old": old, "new": pos })
+        pos = pos.tolist()
+        with self.batch():
+            for i, p in zip(ids, pos):
+                self._data[i].applyTransform()
+                self._index.markDirty(i)
+                self.journalChange("set", id=i, values=dict(zip(("dx", "dy", "dz", "rx", "ry", "rz"), p)))
+            self.recull()
+            self.updateDetail()
+            self.dumpToFile()
+
+    def nodesRecord(self, op, ids):
+        """ An add or del record holding the subtrees of ids with their parents """
+        nodes = []
+        for i in ids:
+            cols = self.columnValues(self.subtreeIDs(i))
+            nodes.append(self.dumpData(i, True, cols))
+        return { "op": op, "ids": list(ids), "parents": [self._data[i].parent for i in ids],
+            "nodes": nodes }
+
+    def recordChange(self, rec):
+        if self.history is None or self._undoing or self._replaying or self.loading is not None:
+            return
+        self.history.record(rec)
+        self.updateHistory()
+
+    @traced("model.undoChange")
+    def undoChange(self):
+        if self.loading is not None or self.history is None:
+            return
+        rec = self.history.takeUndo()
+        if rec is not None:
+            self.applyRecord(rec, False)
+
+    @traced("model.redoChange")
+    def redoChange(self):
+        if self.loading is not None or self.history is None:
+            return
+        rec = self.history.takeRedo()
+        if rec is not None:
+            self.applyRecord(rec, True)
+
+    def applyRecord(self, rec, redo):
+        """ Puts back the new (redo) or old side of a history record, journaled and saved """
+        self._undoing = True
+        try:
+            with self.batch() as b:
+                b.history = True
+                self.applyStep(rec, redo)
+        finally:
+            self._undoing = False
+
+    def applyStep(self, rec, redo):
+        op = rec["op"]
+        if op == "steps":
+            for step in (rec["steps"] if redo else reversed(rec["steps"])):
+                self.applyStep(step, redo)
+        elif op == "pos" or op == "color":
+            self.writeColumn(op, rec["ids"], rec["new" if redo else "old"])
+        elif op == "set":
+            if rec["id"] in self._data:
+                self.setValue(rec["id"], **rec["new" if redo else "old"])
+        elif op == "parent":
+            if redo:
+                self.reparentNodes(rec["ids"], rec["new"])
+            else:
+                for i, p in zip(rec["ids"], rec["old"]):
+                    self.reparentNodes([i], p)
+        elif (op == "add") == redo:
+            # an add redone or a delete undone
+            self.restoreNodes(rec["parents"], rec["nodes"])
+        else:
+            for i in rec["ids"]:
+                if i in self._data:
+                    self.delShape(i)
+
+    def writeColumn(self, column, ids, values):
+        """ Writes pos or color rows of many nodes at once, skipping nodes that are gone """
+        keep = [k for k, i in enumerate(ids.tolist()) if i in self._data]
+        ids = ids[keep].tolist()
+        rows = [self._data[i]._row for i in ids]
+        getattr(scene_store, column)[rows] = values[keep]
+        with self.batch():
+            if column == "pos":
+                for i, p in zip(ids, values[keep].tolist()):
+                    self._data[i].applyTransform()
+                    self._index.markDirty(i)
+                    self.journalChange("set", id=i, values=dict(zip(
+                        ("dx", "dy", "dz", "rx", "ry", "rz"), p)))
+                self.recull()
+            else:
+                for i, c in zip(ids, values[keep].tolist()):
+                    self._data[i].colorChanged()
+                    self.journalChange("set", id=i, values={ "color": c })
+            self.updateDetail()
+            self.dumpToFile()
+
+    def restoreNodes(self, parents, nodes):
+        """ Builds deleted subtrees again under their parents, with their ids """
+        with self.batch():
+            for par, node in zip(parents, nodes):
+                if par not in self._data or node["id"] in self._data:
+                    continue
+                self.loadData(node, par)
+                self.refreshBatch(par)
+                self.journalChange("load", id=node["id"], parent=par, node=node)
+            self.dumpToFile()
+
+    def updateHistory(self):
+        if self._batch is not None:
+            self._batch.history = True
+            return
+        if self._history_callback is not None and self.history is not None:
+            self._history_callback(self.history.stats())
@@ -0,0 +1,145 @@
+import numpy as np
+
+KINDS = { "root": 0, "group": 1, "box": 2, "sphere": 3, "stl": 4 }
+
+class SceneStore():
+    """ Struct-of-arrays columns for node transforms, colors and shape parameters
+
+    pos holds dx dy dz rx ry rz, size holds length width height for boxes and
+    the radius for spheres, scale is the STL scale. Rows of removed nodes are
+    reused by the next allocation.
+    """
+    COLUMNS = ("pos", "color", "size", "scale", "parent", "kind", "alive")
+
+    def __init__(self, capacity=1024):
+        self.pos = np.zeros((capacity, 6))
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)
+        self.size = np.zeros((capacity, 3))
+        self.scale = np.ones(capacity)
+        self.parent = np.full(capacity, -1, dtype=np.int64)
+        self.kind = np.zeros(capacity, dtype=np.uint8)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self._free = []
+        self._top = 0
+
+    def _grow(self):
+        n = len(self.alive)
+        for name in self.COLUMNS:
+            col = getattr(self, name)
+            grown = np.empty((n * 2,) + col.shape[1:], dtype=col.dtype)
+            grown[:n] = col
+            setattr(self, name, grown)
+
+    def alloc(self, kind):
+        if self._free:
+            row = self._free.pop()
+        else:
+            if self._top == len(self.alive):
+                self._grow()
+            row = self._top
+            self._top += 1
+        self.pos[row] = 0
+        self.color[row] = 0
+        self.size[row] = 0
+        self.scale[row] = 1
+        self.parent[row] = -1
+        self.kind[row] = KINDS[kind]
+        self.alive[row] = True
+        return row
+
+    def free(self, row):
+        if self.alive[row]:
+            self.alive[row] = False
+            self._free.append(row)
+
+    def rows(self):
+        return np.nonzero(self.alive[:self._top])[0]
+
+    def __len__(self):
+        return self._top - len(self._free)
+
+    def offset(self, rows, delta):
+        """ Adds a (6,) dx..rz delta to many rows, rotated angles wrap into [-180, 180) """
+        rows = np.asarray(rows, dtype=np.int64)
+        delta = np.asarray(delta, dtype=np.float64)
+        pos = self.pos[rows] + delta
+        turned = np.nonzero(delta[3:])[0] + 3
+        pos[:, turned] = (pos[:, turned] + 180) % 360 - 180
+        self.pos[rows] = pos
+        return pos
+
+    def handle(self, row):
+        return NodeHandle(self, row)
+
+    def nbytes(self):
+        return sum(getattr(self, name)[:self._top].nbytes for name in self.COLUMNS)
+
+class Column():
+    """ Attribute stored in a SceneStore column, owners carry _store and _row """
+    def __init__(self, name, index=None):
+        self.name = name
+        self.index = index
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        col = getattr(obj._store, self.name)
+        if self.index is None:
+            return col[obj._row].item()
+        return col[obj._row, self.index].item()
+
+    def __set__(self, obj, value):
+        col = getattr(obj._store, self.name)
+        if self.index is None:
+            col[obj._row] = value
+        else:
+            col[obj._row, self.index] = value
+
+class ColorColumn(Column):
+    def __init__(self):
+        super().__init__("color")
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        return tuple(obj._store.color[obj._row].tolist())
+
+    def __set__(self, obj, value):
+        obj._store.color[obj._row] = value
+
+def columns(cls):
+    """ Names of the Column attributes of a class """
+    return [k for k in dir(cls) if isinstance(getattr(cls, k, None), Column)]
+
+class NodeHandle():
+    """ Lightweight view of one store row """
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    dx = Column("pos", 0)
+    dy = Column("pos", 1)
+    dz = Column("pos", 2)
+    rx = Column("pos", 3)
+    ry = Column("pos", 4)
+    rz = Column("pos", 5)
+    color = ColorColumn()
+    scale = Column("scale")
+    parent = Column("parent")
+
+    @property
+    def row(self):
+        return self._row
+
+    @property
+    def kind(self):
+        return next(k for k, v in KINDS.items() if v == self._store.kind[self._row])
+
+    @property
+    def size(self):
+        return tuple(self._store.size[self._row].tolist())
+
+    def __repr__(self):
+        return "<NodeHandle row={} kind={}>".format(self._row, self.kind)
@@ -0,0 +1,572 @@
+import numpy as np
+from scenestore import KINDS
+
+LEAF_SIZE = 8
+
+def eulerQuaternions(rx, ry, rz):
+    """ Quaternions (x, y, z, w) matching QTransform's euler order, angles in degrees """
+    hx, hy, hz = (np.radians(np.asarray(a, dtype=np.float64)) / 2 for a in (rx, ry, rz))
+    cx, sx = np.cos(hx), np.sin(hx)
+    cy, sy = np.cos(hy), np.sin(hy)
+    cz, sz = np.cos(hz), np.sin(hz)
+    # q = qy * qx * qz, as QQuaternion::fromEulerAngles
+    return np.stack([
+        cy * sx * cz + sy * cx * sz,
+        sy * cx * cz - cy * sx * sz,
+        cy * cx * sz - sy * sx * cz,
+        cy * cx * cz + sy * sx * sz,
+    ], axis=-1)
+
+def localMatrices(pos, scale=None):
+    """ (n, 4, 4) matrices T * R * S from (n, 6) rows of dx dy dz rx ry rz """
+    pos = np.asarray(pos, dtype=np.float64).reshape(-1, 6)
+    x, y, z, w = np.moveaxis(eulerQuaternions(pos[:, 3], pos[:, 4], pos[:, 5]), -1, 0)
+    m = np.zeros((len(pos), 4, 4))
+    m[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    m[:, 0, 1] = 2 * (x * y - z * w)
+    m[:, 0, 2] = 2 * (x * z + y * w)
+    m[:, 1, 0] = 2 * (x * y + z * w)
+    m[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    m[:, 1, 2] = 2 * (y * z - x * w)
+    m[:, 2, 0] = 2 * (x * z - y * w)
+    m[:, 2, 1] = 2 * (y * z + x * w)
+    m[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    if scale is not None:
+        m[:, :3, :3] *= np.asarray(scale, dtype=np.float64).reshape(-1, 1, 1)
+    m[:, :3, 3] = pos[:, :3]
+    m[:, 3, 3] = 1
+    return m
+
+def localBounds(el):
+    """ Object space AABB (lo, hi) of an entity, None when it has no extent yet """
+    if el.shape == "box":
+        h = np.array([el.length, el.width, el.height], dtype=np.float64) / 2
+        return -h, h
+    if el.shape == "sphere":
+        h = np.full(3, float(el.radius))
+        return -h, h
+    if el.shape == "stl" and el.bounds is not None:
+        return np.array(el.bounds[0], dtype=np.float64), np.array(el.bounds[1], dtype=np.float64)
+    return None
+
+def transformBounds(matrices, lo, hi):
+    """ World AABBs of (n, 3) local boxes under (n, 4, 4) matrices """
+    # center/extent form: |R| * extent bounds the rotated box exactly
+    c = (lo + hi) / 2
+    e = (hi - lo) / 2
+    wc = np.einsum("nij,nj->ni", matrices[:, :3, :3], c) + matrices[:, :3, 3]
+    we = np.einsum("nij,nj->ni", np.abs(matrices[:, :3, :3]), e)
+    return wc - we, wc + we
+
+def framePlanes(m):
+    """ The six inward planes (a, b, c, d) of a clip matrix, Gribb-Hartmann """
+    m = np.asarray(m, dtype=np.float64)
+    return np.array([m[3] + m[0], m[3] - m[0], m[3] + m[1], m[3] - m[1], m[3] + m[2], m[3] - m[2]])
+
+class BVH():
+    """ Bounding volume hierarchy over AABBs, stored in flat arrays in pre-order """
+    def __init__(self, lo, hi):
+        self.lo = np.asarray(lo, dtype=np.float64)
+        self.hi = np.asarray(hi, dtype=np.float64)
+        n = len(self.lo)
+        self.items = np.zeros(n, dtype=np.int64)
+        node_lo, node_hi, left, right, start, count, parent = [], [], [], [], [], [], []
+        self.leaf_of = np.zeros(n, dtype=np.int64)
+        filled = 0
+        with np.errstate(invalid="ignore"):
+            # empty boxes have nan centers and sort last
+            centers = (self.lo + self.hi) / 2
+        stack = [(np.arange(n), -1, None)]
+        while stack:
+            idx, par, side = stack.pop()
+            node = len(left)
+            node_lo.append(self.lo[idx].min(axis=0) if len(idx) else np.zeros(3))
+            node_hi.append(self.hi[idx].max(axis=0) if len(idx) else np.zeros(3))
+            left.append(-1)
+            right.append(-1)
+            parent.append(par)
+            if par >= 0:
+                (left if side == 0 else right)[par] = node
+            if len(idx) <= LEAF_SIZE:
+                start.append(filled)
+                count.append(len(idx))
+                self.items[filled:filled + len(idx)] = idx
+                self.leaf_of[idx] = node
+                filled += len(idx)
+                continue
+            start.append(0)
+            count.append(0)
+            c = centers[idx]
+            axis = int(np.argmax(c.max(axis=0) - c.min(axis=0)))
+            half = len(idx) // 2
+            order = np.argpartition(c[:, axis], half)
+            stack.append((idx[order[half:]], node, 1))
+            stack.append((idx[order[:half]], node, 0))
+        self.node_lo = np.array(node_lo).reshape(-1, 3)
+        self.node_hi = np.array(node_hi).reshape(-1, 3)
+        self.left = np.array(left, dtype=np.int64)
+        self.right = np.array(right, dtype=np.int64)
+        self.start = np.array(start, dtype=np.int64)
+        self.count = np.array(count, dtype=np.int64)
+        self.parent = np.array(parent, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.lo)
+
+    def refit(self, rows, lo, hi):
+        """ Updates the boxes of items `rows` and their ancestors, O(k log n) """
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        self.lo[rows] = lo
+        self.hi[rows] = hi
+        nodes = set()
+        for node in self.leaf_of[rows].tolist():
+            while node >= 0 and node not in nodes:
+                nodes.add(node)
+                node = int(self.parent[node])
+        # children always come after their parent in pre-order
+        for node in sorted(nodes, reverse=True):
+            if self.count[node] > 0 or self.left[node] < 0:
+                items = self.items[self.start[node]:self.start[node] + self.count[node]]
+                if len(items):
+                    self.node_lo[node] = self.lo[items].min(axis=0)
+                    self.node_hi[node] = self.hi[items].max(axis=0)
+            else:
+                l, r = self.left[node], self.right[node]
+                self.node_lo[node] = np.minimum(self.node_lo[l], self.node_lo[r])
+                self.node_hi[node] = np.maximum(self.node_hi[l], self.node_hi[r])
+
+    def _traverse(self, test):
+        """ Items of every leaf whose box passes test(lo, hi) along the whole path """
+        rst = []
+        if len(self.left) == 0:
+            return rst
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if not test(self.node_lo[node], self.node_hi[node]):
+                continue
+            if self.left[node] < 0:
+                rst.extend(self.items[self.start[node]:self.start[node] + self.count[node]].tolist())
+            else:
+                stack.append(self.left[node])
+                stack.append(self.right[node])
+        return rst
+
+    def queryBox(self, lo, hi):
+        lo = np.asarray(lo, dtype=np.float64)
+        hi = np.asarray(hi, dtype=np.float64)
+        test = lambda a, b: bool(np.all(a <= hi) and np.all(b >= lo))
+        cand = np.array(self._traverse(test), dtype=np.int64)
+        if len(cand) == 0:
+            return cand
+        ok = np.all(self.lo[cand] <= hi, axis=1) & np.all(self.hi[cand] >= lo, axis=1)
+        return cand[ok]
+
+    def queryFrustum(self, planes):
+        planes = np.asarray(planes, dtype=np.float64)
+        n, d = planes[:, :3], planes[:, 3]
+        pos = n > 0
+        def test(lo, hi):
+            # the corner furthest along each plane normal must be inside
+            far = np.where(pos, hi, lo)
+            return bool(np.all(np.einsum("ij,ij->i", n, far) + d >= 0))
+        cand = np.array(self._traverse(test), dtype=np.int64)
+        if len(cand) == 0:
+            return cand
+        far = np.where(pos[None], self.hi[cand][:, None, :], self.lo[cand][:, None, :])
+        ok = np.all(np.einsum("pj,cpj->cp", n, far) + d >= 0, axis=1)
+        return cand[ok]
+
+    def frustumMask(self, planes):
+        """ Per item, whether its box passes the queryFrustum test, in one vectorized pass
+
+        Cheaper than walking the tree when a large share of the items is in view.
+        """
+        planes = np.asarray(planes, dtype=np.float64)
+        inside = np.ones(len(self.lo), dtype=bool)
+        with np.errstate(invalid="ignore"):
+            for n, d in zip(planes[:, :3], planes[:, 3]):
+                far = np.where(n > 0, self.hi, self.lo)
+                inside &= far @ n + d >= 0
+        return inside
+
+    def queryRay(self, origin, direction, tmax=np.inf):
+        """ Items whose box the ray hits, as (t_enter, row) sorted by distance """
+        origin = np.asarray(origin, dtype=np.float64)
+        with np.errstate(divide="ignore"):
+            inv = 1.0 / np.asarray(direction, dtype=np.float64)
+        def slab(lo, hi):
+            with np.errstate(invalid="ignore"):
+                t0 = (lo - origin) * inv
+                t1 = (hi - origin) * inv
+            t0 = np.nan_to_num(t0, nan=-np.inf)
+            t1 = np.nan_to_num(t1, nan=np.inf)
+            near = np.minimum(t0, t1).max(axis=-1)
+            far = np.maximum(t0, t1).min(axis=-1)
+            return near, far
+        def test(lo, hi):
+            near, far = slab(lo, hi)
+            return far >= max(near, 0) and near <= tmax
+        cand = np.array(self._traverse(test), dtype=np.int64)
+        if len(cand) == 0:
+            return []
+        near, far = slab(self.lo[cand], self.hi[cand])
+        ok = (far >= np.maximum(near, 0)) & (near <= tmax)
+        order = np.argsort(near[ok])
+        return list(zip(np.maximum(near[ok][order], 0).tolist(), cand[ok][order].tolist()))
+
+def rayTriangles(origin, direction, tri):
+    """ Nearest hit distance of a ray against (n, 3, 3) triangles, Moller-Trumbore """
+    if len(tri) == 0:
+        return None
+    e1 = tri[:, 1] - tri[:, 0]
+    e2 = tri[:, 2] - tri[:, 0]
+    p = np.cross(direction, e2)
+    det = np.einsum("ij,ij->i", e1, p)
+    ok = np.abs(det) > 1e-12
+    inv = np.zeros_like(det)
+    inv[ok] = 1.0 / det[ok]
+    s = origin - tri[:, 0]
+    u = np.einsum("ij,ij->i", s, p) * inv
+    q = np.cross(s, e1)
+    v = np.einsum("j,ij->i", direction, q) * inv
+    t = np.einsum("ij,ij->i", e2, q) * inv
+    ok &= (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+    if not ok.any():
+        return None
+    return float(t[ok].min())
+
+def rayLocal(el, origin, direction):
+    """ Exact hit distance of a ray in the entity's object space """
+    if el.shape == "sphere":
+        r = float(el.radius)
+        b = np.dot(origin, direction)
+        a = np.dot(direction, direction)
+        c = np.dot(origin, origin) - r * r
+        disc = b * b - a * c
+        if disc < 0:
+            return None
+        t = (-b - np.sqrt(disc)) / a
+        if t < 0:
+            t = (-b + np.sqrt(disc)) / a
+        return t if t >= 0 else None
+    if el.shape == "stl":
+        mesh = getattr(el, "_cached", None)
+        if mesh is None:
+            return None
+        return rayTriangles(origin, direction, mesh.mesh.triangles())
+    bounds = localBounds(el)
+    if bounds is None:
+        return None
+    lo, hi = bounds
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t0 = (lo - origin) / direction
+        t1 = (hi - origin) / direction
+    t0 = np.nan_to_num(t0, nan=-np.inf)
+    t1 = np.nan_to_num(t1, nan=np.inf)
+    near = np.minimum(t0, t1).max()
+    far = np.maximum(t0, t1).min()
+    if far < max(near, 0):
+        return None
+    return max(near, 0.0)
+
+class TransformCache():
+    """ World matrices of every node of a DataModel._data dict, recomputed lazily
+
+    Nodes are kept in pre-order so a subtree is the row range [row, end[row]),
+    marking a group dirty is O(1) and its children are refreshed in one matrix
+    product per tree level on the next query.
+    """
+    def __init__(self, data, store=None):
+        self._data = data
+        self.store = store
+        self._ids = []
+        self._rows = {}
+        self._rebuild = True
+        self._local_dirty = set()
+        self._pending = set()
+        self._changed = set()
+        self.rebuilt = False
+
+    def invalidate(self):
+        """ Nodes were added, removed or moved to another group """
+        self._rebuild = True
+
+    def markDirty(self, _id):
+        """ The local transform or size of _id changed """
+        self._local_dirty.add(_id)
+
+    def _walk(self):
+        ids, parent, depth, end = [], [], [], []
+        stack = [(0, -1, 0)]
+        while stack:
+            i, par, d = stack.pop()
+            if i == "end":
+                end[par] = len(ids)
+                continue
+            el = self._data.get(i)
+            if el is None:
+                continue
+            row = len(ids)
+            ids.append(i)
+            parent.append(par)
+            depth.append(d)
+            end.append(row + 1)
+            children = getattr(el, "children", None)
+            if children:
+                stack.append(("end", row, 0))
+                for c in reversed(children):
+                    stack.append((c, row, d + 1))
+        self._ids = ids
+        self._rows = { i: k for k, i in enumerate(ids) }
+        self.parent = np.array(parent, dtype=np.int64)
+        self.depth = np.array(depth, dtype=np.int64)
+        self.end = np.array(end, dtype=np.int64)
+        self.entity = np.array([self._data[i].type == "entity" for i in ids], dtype=bool)
+        if self.store is not None:
+            srow = [getattr(self._data[i], "_row", None) for i in ids]
+            self.srow = np.array([-1 if r is None else r for r in srow], dtype=np.int64)
+
+    def _updateLocal(self, rows):
+        if self.store is not None:
+            return self._updateLocalColumns(rows)
+        els = [self._data[self._ids[r]] for r in rows]
+        pos = np.array([[el.dx, el.dy, el.dz, el.rx, el.ry, el.rz] if el.type != "root"
+            else [0] * 6 for el in els], dtype=np.float64).reshape(-1, 6)
+        scale = np.array([getattr(el, "scale", 1) for el in els], dtype=np.float64)
+        self.local[rows] = localMatrices(pos, scale)
+        for r, el in zip(rows, els):
+            b = localBounds(el) if el.type == "entity" else None
+            if b is None:
+                self.lo[r] = np.inf
+                self.hi[r] = -np.inf
+                if el.type == "entity":
+                    self._pending.add(r)
+            else:
+                self._pending.discard(r)
+                self.lo[r], self.hi[r] = b
+
+    def _updateLocalColumns(self, rows):
+        """ _updateLocal reading dx..rz, sizes and scale straight from the store """
+        store = self.store
+        srow = self.srow[rows]
+        known = srow >= 0
+        pos = np.zeros((len(rows), 6))
+        pos[known] = store.pos[srow[known]]
+        scale = np.ones(len(rows))
+        scale[known] = store.scale[srow[known]]
+        self.local[rows] = localMatrices(pos, scale)
+        kind = np.full(len(rows), KINDS["root"], dtype=np.uint8)
+        kind[known] = store.kind[srow[known]]
+        size = np.zeros((len(rows), 3))
+        size[known] = store.size[srow[known]]
+        lo = np.full((len(rows), 3), np.inf)
+        hi = np.full((len(rows), 3), -np.inf)
+        box = kind == KINDS["box"]
+        lo[box], hi[box] = -size[box] / 2, size[box] / 2
+        sphere = kind == KINDS["sphere"]
+        lo[sphere] = -size[sphere][:, :1]
+        hi[sphere] = size[sphere][:, :1]
+        for k in np.nonzero(kind == KINDS["stl"])[0].tolist():
+            r = int(rows[k])
+            b = localBounds(self._data[self._ids[r]])
+            if b is None:
+                self._pending.add(r)
+            else:
+                self._pending.discard(r)
+                lo[k], hi[k] = b
+        self.lo[rows] = lo
+        self.hi[rows] = hi
+
+    def _updateWorld(self, rows):
+        # parents come before children, so one product per depth level
+        depth = self.depth[rows]
+        for d in np.unique(depth).tolist():
+            sel = rows[depth == d]
+            if d == 0:
+                self.world[sel] = self.local[sel]
+            else:
+                self.world[sel] = self.world[self.parent[sel]] @ self.local[sel]
+
+    def update(self):
+        if self._rebuild:
+            self._walk()
+            n = len(self._ids)
+            self.local = np.zeros((n, 4, 4))
+            self.world = np.zeros((n, 4, 4))
+            self.lo = np.zeros((n, 3))
+            self.hi = np.zeros((n, 3))
+            self._pending = set()
+            self._local_dirty.clear()
+            self._changed.clear()
+            rows = np.arange(n)
+            self._updateLocal(rows)
+            self._updateWorld(rows)
+            self._rebuild = False
+            self.rebuilt = True
+            return
+        # meshes still loading get their bounds once they arrive
+        arrived = [r for r in self._pending if localBounds(self._data[self._ids[r]]) is not None]
+        if not self._local_dirty and not arrived:
+            return
+        dirty = sorted(self._rows[i] for i in self._local_dirty if i in self._rows)
+        self._local_dirty.clear()
+        self._updateLocal(np.array(sorted(set(dirty) | set(arrived)), dtype=np.int64))
+        ranges = [np.arange(r, self.end[r]) for r in dirty]
+        rows = np.unique(np.concatenate(ranges)) if ranges else np.zeros(0, dtype=np.int64)
+        self._updateWorld(rows)
+        self._changed.update(rows.tolist())
+        self._changed.update(arrived)
+
+    def takeChanged(self):
+        """ Rows whose world matrix or bounds changed since the last call """
+        self.update()
+        rows = self._changed
+        self._changed = set()
+        return np.array(sorted(rows), dtype=np.int64)
+
+    def pendingIds(self):
+        """ Entities whose mesh has not arrived yet """
+        return [self._ids[r] for r in self._pending]
+
+    def rowOf(self, _id):
+        self.update()
+        return self._rows.get(_id)
+
+    def idOf(self, row):
+        return self._ids[row]
+
+    def worldMatrix(self, _id):
+        row = self.rowOf(_id)
+        return None if row is None else self.world[row].copy()
+
+    def entityBounds(self, rows):
+        """ World AABBs of entity rows, empty (inf, -inf) while unknown """
+        rows = np.asarray(rows, dtype=np.int64)
+        lo = self.lo[rows].copy()
+        hi = self.hi[rows].copy()
+        valid = np.isfinite(lo[:, 0])
+        if valid.any():
+            lo[valid], hi[valid] = transformBounds(self.world[rows[valid]], lo[valid], hi[valid])
+        return lo, hi
+
+    def worldAABB(self, _id):
+        """ World box of an entity, or of all entities below a group """
+        row = self.rowOf(_id)
+        if row is None:
+            return None
+        rows = np.arange(row, self.end[row])
+        rows = rows[self.entity[rows]]
+        if len(rows) == 0:
+            return None
+        lo, hi = self.entityBounds(rows)
+        lo, hi = lo.min(axis=0), hi.max(axis=0)
+        if not np.isfinite(lo).all():
+            return None
+        return lo, hi
+
+class SceneIndex():
+    """ World-space AABB index over the entities of a DataModel._data dict, Qt free """
+    def __init__(self, data, store=None):
+        self._data = data
+        self.transforms = TransformCache(data, store)
+        self.bvh = None
+        self._rows = None
+        self._item = {}
+        # bumped when the entity items are renumbered
+        self.generation = 0
+
+    def invalidate(self):
+        """ Entities were added or removed """
+        self.transforms.invalidate()
+
+    def markDirty(self, _id):
+        self.transforms.markDirty(_id)
+
+    def update(self):
+        tc = self.transforms
+        changed = tc.takeChanged()
+        if tc.rebuilt or self.bvh is None:
+            tc.rebuilt = False
+            self.generation += 1
+            self._rows = np.nonzero(tc.entity)[0]
+            self._item = { r: k for k, r in enumerate(self._rows.tolist()) }
+            self.bvh = BVH(*tc.entityBounds(self._rows))
+            return
+        items = [self._item[r] for r in changed.tolist() if r in self._item]
+        if items:
+            lo, hi = tc.entityBounds(self._rows[items])
+            self.bvh.refit(items, lo, hi)
+
+    def _ids(self, items):
+        return [self.transforms.idOf(r) for r in self._rows[items].tolist()]
+
+    def entities(self):
+        self.update()
+        return self._ids(np.arange(len(self._rows)))
+
+    def worldMatrix(self, _id):
+        return self.transforms.worldMatrix(_id)
+
+    def worldAABB(self, _id):
+        return self.transforms.worldAABB(_id)
+
+    def raycast(self, origin, direction):
+        """ Entity ids hit by the ray as (t, id), nearest first, exact per shape """
+        self.update()
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        world = self.transforms.world
+        hits = []
+        best = np.inf
+        for t_box, k in self.bvh.queryRay(origin, direction):
+            if t_box > best:
+                break
+            row = self._rows[k]
+            inv = np.linalg.inv(world[row])
+            lo = inv[:3, :3] @ origin + inv[:3, 3]
+            ld = inv[:3, :3] @ direction
+            _id = self.transforms.idOf(row)
+            t = rayLocal(self._data[_id], lo, ld)
+            if t is not None:
+                hits.append((t, _id))
+                best = min(best, t)
+        hits.sort()
+        return hits
+
+    def pick(self, origin, direction):
+        hits = self.raycast(origin, direction)
+        return hits[0][1] if hits else None
+
+    def queryBox(self, lo, hi):
+        self.update()
+        return self._ids(self.bvh.queryBox(lo, hi))
+
+    def queryFrustum(self, planes):
+        """ Entity ids that may be inside, meshes still loading count as inside """
+        self.update()
+        return self._ids(self.bvh.queryFrustum(planes)) + self.transforms.pendingIds()
+
+    def hiddenMask(self, planes):
+        """ Per entity item, whether it is outside the planes, meshes still loading are not """
+        self.update()
+        hidden = ~self.bvh.frustumMask(planes)
+        pending = [self._item[r] for r in self.transforms._pending if r in self._item]
+        hidden[pending] = False
+        return hidden
+
+    def itemIds(self, items):
+        """ Entity ids of item numbers, like those of hiddenMask """
+        return self._ids(np.asarray(items, dtype=np.int64))
+
+    def originsInFrustum(self, ids, planes):
+        """ The ids whose local origin lies inside the planes, for nodes without bounds """
+        tc = self.transforms
+        tc.update()
+        rows = [tc.rowOf(i) for i in ids]
+        pts = tc.world[rows, :3, 3] if rows else np.zeros((0, 3))
+        planes = np.asarray(planes, dtype=np.float64)
+        inside = np.all(pts @ planes[:, :3].T + planes[:, 3] >= 0, axis=1)
+        return [i for i, ok in zip(ids, inside.tolist()) if ok]
@@ -0,0 +1,219 @@
+import os
+import time
+from array import array
+import numpy as np
+
+LOADER_VERSION = 1
+
+BINARY_HEADER = 84
+BINARY_FACET = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("v", "<f4", (3, 3)),
+    ("attr", "<u2"),
+])
+
+CHUNK = 1 << 18
+
+class STLError(ValueError):
+    pass
+
+class Cancelled(Exception):
+    pass
+
+class STLMesh():
+    def __init__(self, path, buffer, parse_time=0, indices=None, bounds=None):
+        self.path = path
+        # interleaved position/normal rows, ready for a QBuffer; without
+        # indices every 3 rows form a triangle
+        self.buffer = buffer
+        self.indices = indices
+        # decimated levels, coarsest last
+        self.lods = []
+        if indices is None:
+            self.triangle_count = len(buffer) // 3
+        else:
+            self.triangle_count = len(indices) // 3
+        if bounds is not None:
+            self.bounds = bounds
+        elif len(buffer):
+            vertices = self.vertices
+            self.bounds = (tuple(vertices.min(axis=0).tolist()), tuple(vertices.max(axis=0).tolist()))
+        else:
+            self.bounds = ((0.0, 0.0, 0.0), (0.0, 0.0, 0.0))
+        self.parse_time = parse_time
+
+    @property
+    def vertices(self):
+        return self.buffer[:, :3]
+
+    @property
+    def normals(self):
+        return self.buffer[:, 3:]
+
+    @property
+    def nbytes(self):
+        rst = self.buffer.nbytes + sum(lod.nbytes for lod in self.lods)
+        if self.indices is not None:
+            rst += self.indices.nbytes
+        return rst
+
+    def triangles(self):
+        """ Triangle corner positions as an (n, 3, 3) array """
+        if self.indices is None:
+            return self.vertices.reshape(-1, 3, 3)
+        return self.vertices[self.indices].reshape(-1, 3, 3)
+
+def weld(mesh):
+    """ Merges rows with identical position and normal into an indexed mesh """
+    if mesh.indices is not None or len(mesh.buffer) == 0:
+        return mesh
+    rows = np.ascontiguousarray(mesh.buffer)
+    keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows.shape[1]))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return STLMesh(mesh.path, rows[first], mesh.parse_time,
+        inverse.astype(np.uint32).ravel(), mesh.bounds)
+
+def isBinary(path):
+    size = os.path.getsize(path)
+    if size < BINARY_HEADER:
+        return False
+    with open(path, "rb") as fp:
+        fp.seek(80)
+        count = int(np.frombuffer(fp.read(4), dtype="<u4")[0])
+    return size == BINARY_HEADER + count * BINARY_FACET.itemsize
+
+def readBinary(path):
+    """ Maps the facets of a binary STL, returns (triangles, normals) views """
+    size = os.path.getsize(path)
+    count = (size - BINARY_HEADER) // BINARY_FACET.itemsize
+    if count == 0:
+        return np.zeros((0, 3, 3), np.float32), np.zeros((0, 3), np.float32)
+    facets = np.memmap(path, dtype=BINARY_FACET, mode="r", offset=BINARY_HEADER, shape=(count,))
+    return facets["v"], facets["normal"]
+
+def readASCII(path, progress=None):
+    """ Streams an ASCII STL line by line, returns (triangles, normals) """
+    verts = array("f")
+    norms = array("f")
+    size = max(os.path.getsize(path), 1)
+    done = 0
+    with open(path, "rb") as fp:
+        for n, line in enumerate(fp):
+            done += len(line)
+            if progress is not None and n % 65536 == 0:
+                progress(0.5 * done / size)
+            line = line.strip()
+            try:
+                if line.startswith(b"vertex"):
+                    verts.extend(float(x) for x in line.split()[1:4])
+                elif line.startswith(b"facet"):
+                    norms.extend(float(x) for x in line.split()[2:5])
+            except ValueError:
+                raise STLError("{}:{}: malformed line".format(path, n + 1))
+    if len(verts) % 9 != 0 or len(norms) * 3 != len(verts):
+        raise STLError("{}: truncated ASCII STL".format(path))
+    return (np.frombuffer(verts, dtype=np.float32).reshape(-1, 3, 3),
+        np.frombuffer(norms, dtype=np.float32).reshape(-1, 3))
+
+def faceNormals(tri, given=None):
+    """ Unit face normals, keeping the stored ones when they agree with the winding """
+    n = np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0])
+    length = np.linalg.norm(n, axis=1)
+    ok = length > 0
+    n[ok] /= length[ok, None]
+    if given is not None and len(given):
+        glen = np.linalg.norm(given, axis=1)
+        valid = np.isfinite(glen) & (np.abs(glen - 1) < 1e-3)
+        valid &= ~ok | (np.einsum("ij,ij->i", n, given) > 0)
+        n[valid] = given[valid]
+    return n.astype(np.float32, copy=False)
+
+def buildBuffer(tri, given=None, progress=None, base=0.0):
+    """ Fills the interleaved buffer chunk by chunk from the mapped triangles
+
+    The buffer stays with the mesh for the caches and LOD building; byteArray
+    makes the one Qt copy of it, so a loaded mesh holds its vertices twice.
+    """
+    buffer = np.empty((len(tri) * 3, 6), dtype=np.float32)
+    facets = buffer.reshape(-1, 3, 6)
+    for start in range(0, len(tri), CHUNK):
+        end = min(start + CHUNK, len(tri))
+        facets[start:end, :, :3] = tri[start:end]
+        normals = faceNormals(facets[start:end, :, :3], None if given is None else given[start:end])
+        facets[start:end, :, 3:] = normals[:, None, :]
+        if progress is not None:
+            progress(base + (1 - base) * end / len(tri))
+    return buffer
+
+def load(path, progress=None):
+    """ Parses an STL file, progress(fraction) may raise Cancelled to abort """
+    start = time.perf_counter()
+    if not os.path.exists(path):
+        raise STLError("{}: no such file".format(path))
+    if isBinary(path):
+        tri, given = readBinary(path)
+        base = 0.0
+    else:
+        tri, given = readASCII(path, progress)
+        base = 0.5
+    mesh = STLMesh(path, buildBuffer(tri, given, progress, base))
+    mesh.parse_time = time.perf_counter() - start
+    return mesh
+
+def byteArray(array):
+    """ A QByteArray holding a copy of the array's bytes, without the extra one of tobytes() """
+    from PySide2.QtCore import QByteArray
+    array = np.ascontiguousarray(array)
+    data = QByteArray()
+    data.resize(array.nbytes)
+    if array.nbytes:
+        np.frombuffer(memoryview(data), dtype=np.uint8)[:] = array.reshape(-1).view(np.uint8)
+    return data
+
+def buildGeometry(mesh, parent=None):
+    """ Wraps an STLMesh into a QGeometryRenderer """
+    from PySide2.Qt3DRender import Qt3DRender
+
+    geometry = Qt3DRender.QGeometry(parent)
+    buf = Qt3DRender.QBuffer(geometry)
+    buf.setData(byteArray(mesh.buffer))
+    stride = mesh.buffer.strides[0]
+    count = len(mesh.buffer)
+
+    position = Qt3DRender.QAttribute(geometry)
+    position.setName(Qt3DRender.QAttribute.defaultPositionAttributeName())
+    position.setAttributeType(Qt3DRender.QAttribute.VertexAttribute)
+    position.setVertexBaseType(Qt3DRender.QAttribute.Float)
+    position.setVertexSize(3)
+    position.setBuffer(buf)
+    position.setByteOffset(0)
+    position.setByteStride(stride)
+    position.setCount(count)
+    geometry.addAttribute(position)
+
+    normal = Qt3DRender.QAttribute(geometry)
+    normal.setName(Qt3DRender.QAttribute.defaultNormalAttributeName())
+    normal.setAttributeType(Qt3DRender.QAttribute.VertexAttribute)
+    normal.setVertexBaseType(Qt3DRender.QAttribute.Float)
+    normal.setVertexSize(3)
+    normal.setBuffer(buf)
+    normal.setByteOffset(12)
+    normal.setByteStride(stride)
+    normal.setCount(count)
+    geometry.addAttribute(normal)
+    geometry.setBoundingVolumePositionAttribute(position)
+
+    if mesh.indices is not None:
+        ibuf = Qt3DRender.QBuffer(geometry)
+        ibuf.setData(byteArray(mesh.indices.astype(np.uint32, copy=False)))
+        index = Qt3DRender.QAttribute(geometry)
+        index.setAttributeType(Qt3DRender.QAttribute.IndexAttribute)
+        index.setVertexBaseType(Qt3DRender.QAttribute.UnsignedInt)
+        index.setBuffer(ibuf)
+        index.setCount(len(mesh.indices))
+        geometry.addAttribute(index)
+
+    renderer = Qt3DRender.QGeometryRenderer(parent)
+    renderer.setPrimitiveType(Qt3DRender.QGeometryRenderer.Triangles)
+    renderer.setGeometry(geometry)
+    return renderer
@@ -0,0 +1,44 @@
+import os
+import subprocess
+import sys
+from scenecore import SceneCore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def leaveJournal(path):
+    """ A saved box plus edits that only reached the journal """
+    m = SceneCore(path=path)
+    m.addShape("box")
+    m.close()
+    m = SceneCore(path=path, journal=True)
+    m.setValue(1, name="journaled", dx=5)
+    # killed before compaction
+    m._journal.close()
+
+def listing(path):
+    return { name: open(os.path.join(path, name), "rb").read() for name in os.listdir(path) }
+
+def test_export_leaves_source_untouched(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    path = str(src / "scene.json")
+    leaveJournal(path)
+    before = listing(str(src))
+    assert "scene.journal" in before
+
+    out = str(tmp_path / "out.stl")
+    subprocess.run([sys.executable, os.path.join(ROOT, "export.py"), path, out],
+        check=True, capture_output=True)
+    assert os.path.getsize(out) > 84
+    assert listing(str(src)) == before
+
+def test_readonly_replays_journal_in_memory(tmp_path):
+    path = str(tmp_path / "scene.json")
+    leaveJournal(path)
+    before = listing(str(tmp_path))
+
+    scene = SceneCore(path=path, readonly=True)
+    assert scene._data[1].name == "journaled"
+    scene.setValue(1, name="changed")
+    scene.close()
+    assert listing(str(tmp_path)) == before
@@ -0,0 +1,54 @@
+import json
+from scenecore import SceneCore
+
+def writeScene(path):
+    """ An id-less JSON scene where pre-order and level-order numbering differ """
+    m = SceneCore(path=path)
+    m.addGroup()
+    m.setValue(1, name="outer")
+    m.selectElement(1)
+    m.addGroup()
+    m.setValue(2, name="inner")
+    m.selectElement(0)
+    m.addShape("box")
+    m.setValue(3, name="top")
+    m.close()
+    assert all("id" not in e for e in json.load(open(path)))
+
+def loadProgressive(path, **kwargs):
+    m = SceneCore(path=path, progressive=True, **kwargs)
+    while m.loading is not None:
+        m.loadSlice()
+    return m
+
+def nodes(m):
+    return { i: (el.name, el.parent, (el.dx, el.dy, el.dz)) for i, el in m._data.items() if i != 0 }
+
+def test_progressive_ids_match_eager(tmp_path):
+    path = str(tmp_path / "scene.json")
+    writeScene(path)
+    eager = SceneCore(path=path)
+    progressive = loadProgressive(path)
+    assert nodes(progressive) == nodes(eager)
+    eager.close()
+    progressive.close()
+
+def test_journal_replays_onto_same_nodes(tmp_path):
+    path = str(tmp_path / "scene.json")
+    writeScene(path)
+    m = SceneCore(path=path, journal=True)
+    top = [i for i, el in m._data.items() if el.name == "top"][0]
+    m.setValue(top, name="moved", dx=50)
+    # killed before the journal is compacted into the snapshot
+    m._journal.close()
+    with open(path + ".bak", "w") as fp:
+        fp.write(open(path).read())
+
+    eager = SceneCore(path=path, journal=True)
+    expected = nodes(eager)
+    eager._journal.close()
+    with open(path, "w") as fp:
+        fp.write(open(path + ".bak").read())
+    progressive = loadProgressive(path, journal=True)
+    assert nodes(progressive) == expected
+    assert expected[top][0] == "moved" and expected[top][2][0] == 50
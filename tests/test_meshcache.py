@@ -0,0 +1,39 @@
+import threading
+from meshcache import MeshCache
+
+class FakeMesh():
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+        self.lods = []
+
+def test_concurrent_key_and_acquire(tmp_path):
+    paths = []
+    for i in range(8):
+        p = tmp_path / "m{}.stl".format(i)
+        p.write_bytes(bytes([i]) * 100)
+        paths.append(str(p))
+    cache = MeshCache(budget=300, loader=lambda path, progress=None: FakeMesh(100))
+    keys = { p: cache.keyOf(p) for p in paths }
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(200):
+                for p in paths:
+                    assert cache.keyOf(p) == keys[p]
+                    cache.contains(keys[p])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for _ in range(200):
+        for p in paths:
+            cache.release(cache.acquire(p))
+    for t in threads:
+        t.join()
+    assert not errors
+    stats = cache.stats()
+    assert stats["bytes"] == 100 * stats["entries"] <= 300
+    assert stats["entries"] == stats["unreferenced"]
@@ -0,0 +1,36 @@
+from persist import SceneWriter
+from scenecore import SceneCore
+
+def test_failed_write_reports_error(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    writer = SceneWriter(str(blocker / "scene.json"), interval=0)
+    done, failed = [], []
+    writer.submit([], lambda: done.append(True), failed.append)
+    writer.close()
+    assert done == [] and len(failed) == 1
+    assert writer.stats()["last_error"] is not None
+
+def test_failed_compaction_is_retried(tmp_path):
+    path = str(tmp_path / "scene.json")
+    m = SceneCore(path=path, journal=True)
+    m.addShape("box")
+    m.setValue(1, name="kept")
+    journal = m._journal
+    records = journal.records
+    assert records > 0
+
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    m._writer.path = str(blocker / "scene.json")
+    m.compactJournal()
+    m._writer.flush()
+    assert not journal.compacting
+    assert journal.records == records
+
+    m._writer.path = path
+    m.compactJournal()
+    m._writer.flush()
+    assert journal.records == 0
+    m.close()
+    assert SceneCore(path=path)._data[1].name == "kept"
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import threading
+import functools
+from collections import deque
+
+class Tracer():
+    """ Opt-in timing spans and frame times, exported as Chrome trace events """
+    def __init__(self, capacity=200000, frames=600):
+        self.enabled = False
+        self.events = deque(maxlen=capacity)
+        self.frames = deque(maxlen=frames)
+        self.totals = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+        self._pid = os.getpid()
+
+    def enable(self, on=True):
+        self.enabled = on
+
+    def _now(self):
+        return (time.perf_counter_ns() - self._origin) / 1000
+
+    def record(self, name, start, dur, args=None):
+        event = { "name": name, "ph": "X", "ts": start, "dur": dur,
+            "pid": self._pid, "tid": threading.get_ident() }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+        with self._lock:
+            total = self.totals.get(name)
+            if total is None:
+                total = self.totals[name] = [0, 0.0, 0.0]
+            total[0] += 1
+            total[1] += dur
+            total[2] = max(total[2], dur)
+
+    def span(self, name, **args):
+        return _Span(self, name, args)
+
+    def frame(self, dt):
+        """ One rendered frame that took dt seconds """
+        if not self.enabled:
+            return
+        self.frames.append(dt)
+        self.events.append({ "name": "frame", "ph": "C", "ts": self._now(),
+            "pid": self._pid, "args": { "ms": dt * 1000 } })
+
+    def fps(self):
+        recent = list(self.frames)[-60:]
+        if not recent or sum(recent) == 0:
+            return 0.0
+        return len(recent) / sum(recent)
+
+    def lastFrame(self):
+        return self.frames[-1] if self.frames else 0.0
+
+    def topSpans(self, n=5):
+        """ (name, count, total ms, max ms) with the most total time first """
+        with self._lock:
+            rows = [(k, v[0], v[1] / 1000, v[2] / 1000) for k, v in self.totals.items()]
+        rows.sort(key=lambda r: -r[2])
+        return rows[:n]
+
+    def clear(self):
+        self.events.clear()
+        self.frames.clear()
+        with self._lock:
+            self.totals = {}
+
+    def exportChrome(self, path):
+        """ Writes the spans and frame counters for chrome://tracing or Perfetto """
+        with open(path, "w") as fp:
+            json.dump({ "traceEvents": list(self.events), "displayTimeUnit": "ms" }, fp)
+
+class _Span():
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = self.tracer._now() if self.tracer.enabled else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            self.tracer.record(self.name, self.start, self.tracer._now() - self.start, self.args)
+        return False
+
+class StartupProfile():
+    """ Startup phases, each timed from the previous mark """
+    def __init__(self, start):
+        self.start = start
+        self.phases = []
+        self._last = start
+
+    def mark(self, name, t=None):
+        t = time.perf_counter() if t is None else t
+        self.phases.append((name, t - self._last))
+        self._last = t
+
+    def total(self):
+        return self._last - self.start
+
+    def report(self):
+        lines = ["{:<32} {:>9.1f} ms".format(name, dt * 1000) for name, dt in self.phases]
+        lines.append("{:<32} {:>9.1f} ms".format("total", self.total() * 1000))
+        return "\n".join(lines)
+
+    def asDict(self):
+        return { "phases": dict(self.phases), "total": self.total() }
+
+_tracer = None
+
+def tracer():
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+def traced(name):
+    """ Decorator timing every call while tracing is enabled """
+    def wrap(fn):
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            t = tracer()
+            if not t.enabled:
+                return fn(*args, **kwargs)
+            start = t._now()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                t.record(name, start, t._now() - start)
+        return call
+    return wrap
+
+def tracedCallback(name, fn):
+    """ fn wrapped in a span, callbacks are wrapped when they are registered """
+    if fn is None:
+        return None
+    return traced(name)(fn)
@@ -1,38 +1,278 @@
-from PySide2.QtCore import(Property, QObject, QPropertyAnimation, Signal, Qt)
-from PySide2.QtWidgets import *
+from PySide2.QtCore import(QAbstractItemModel, QItemSelection, QItemSelectionModel, QModelIndex, Qt)
+from PySide2.QtWidgets import QAbstractItemView, QTreeView
 
-class TreeView(QTreeWidget):
+FETCH_BATCH = 256
+
+class SceneTreeModel(QAbstractItemModel):
+    def __init__(self):
+        super().__init__()
+        self._data = { }
+        # rows exposed to the view per group, children are fetched lazily
+        self._fetched = {}
+        # id -> row cache, rebuilt per parent when its children change
+        self._rows = {}
+        self._stale = set()
+        self._removing = None
+
+    def resetData(self, data):
+        self.beginResetModel()
+        self._data = data
+        self._fetched = {}
+        self._rows = {}
+        self._stale = set()
+        self.endResetModel()
+
+    def nodeID(self, index):
+        if not index.isValid():
+            return 0
+        return index.internalPointer().idnum
+
+    def rowOf(self, _id):
+        p = self._data[_id].parent
+        if p in self._stale or _id not in self._rows:
+            for r, c in enumerate(self._data[p].children):
+                self._rows[c] = r
+            self._stale.discard(p)
+        return self._rows[_id]
+
+    def isVisible(self, _id):
+        """ Whether the node is exposed to the view, i.e. fetched under every ancestor """
+        while _id != 0:
+            p = self._data[_id].parent
+            if self.rowOf(_id) >= self._fetched.get(p, 0):
+                return False
+            _id = p
+        return True
+
+    def indexOf(self, _id, fetch=False):
+        if _id == 0 or _id not in self._data:
+            return QModelIndex()
+        if fetch:
+            p = self._data[_id].parent
+            self.indexOf(p, True)
+            self.fetchTo(p, self.rowOf(_id))
+        elif not self.isVisible(_id):
+            return QModelIndex()
+        return self.createIndex(self.rowOf(_id), 0, self._data[_id])
+
+    def fetchTo(self, _id, row):
+        n = self._fetched.get(_id, 0)
+        if row >= n:
+            self.beginInsertRows(self.indexOf(_id), n, row)
+            self._fetched[_id] = row + 1
+            self.endInsertRows()
+
+    def index(self, row, column, parent=QModelIndex()):
+        p = self.nodeID(parent)
+        if column != 0 or row < 0 or row >= self._fetched.get(p, 0):
+            return QModelIndex()
+        return self.createIndex(row, 0, self._data[self._data[p].children[row]])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        p = index.internalPointer().parent
+        if p == 0 or p is None:
+            return QModelIndex()
+        return self.createIndex(self.rowOf(p), 0, self._data[p])
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0 or 0 not in self._data:
+            return 0
+        return self._fetched.get(self.nodeID(parent), 0)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        if 0 not in self._data:
+            return False
+        el = self._data[self.nodeID(parent)]
+        if el.type == "group" and el.ref is not None:
+            # a referenced file is loaded when the group is expanded
+            return True
+        return el.type in ("root", "group") and len(el.children) > 0
+
+    def canFetchMore(self, parent):
+        if 0 not in self._data:
+            return False
+        _id = self.nodeID(parent)
+        el = self._data[_id]
+        return el.type in ("root", "group") and self._fetched.get(_id, 0) < len(el.children)
+
+    def fetchMore(self, parent):
+        _id = self.nodeID(parent)
+        n = self._fetched.get(_id, 0)
+        self.fetchTo(_id, min(n + FETCH_BATCH, len(self._data[_id].children)) - 1)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            return index.internalPointer().name
+        if role == Qt.ToolTipRole:
+            return str(index.internalPointer().idnum)
+        return None
+
+    def insertNode(self, _id):
+        p = self._data[_id].parent
+        children = self._data[p].children
+        if p not in self._stale and _id in self._rows:
+            # numbered when an earlier sibling of the same slice was looked up
+            pass
+        elif children[-1] == _id and p not in self._stale:
+            # appended, the rows of the siblings stay valid
+            self._rows[_id] = len(children) - 1
+        else:
+            self._stale.add(p)
+        row = self.rowOf(_id)
+        if self.isVisible(p) and row <= self._fetched.get(p, 0):
+            self.beginInsertRows(self.indexOf(p), row, row)
+            self._fetched[p] = self._fetched.get(p, 0) + 1
+            self.endInsertRows()
+
+    def beginRemoveNode(self, _id):
+        p = self._data[_id].parent
+        row = self.rowOf(_id)
+        self._removing = (p, self.isVisible(p) and row < self._fetched.get(p, 0))
+        if self._removing[1]:
+            self.beginRemoveRows(self.indexOf(p), row, row)
+        stack = [_id]
+        while stack:
+            i = stack.pop()
+            self._rows.pop(i, None)
+            self._fetched.pop(i, None)
+            if self._data[i].type == "group":
+                stack.extend(self._data[i].children)
+
+    def endRemoveNode(self, _id):
+        p, visible = self._removing
+        self._removing = None
+        self._stale.add(p)
+        if visible:
+            self._fetched[p] -= 1
+            self.endRemoveRows()
+
+    def beginUnloadNode(self, _id):
+        n = self._fetched.get(_id, 0)
+        self._removing = (_id, n > 0 and self.isVisible(_id))
+        if self._removing[1]:
+            self.beginRemoveRows(self.indexOf(_id), 0, n - 1)
+        stack = list(self._data[_id].children)
+        while stack:
+            i = stack.pop()
+            self._rows.pop(i, None)
+            self._fetched.pop(i, None)
+            if self._data[i].type == "group":
+                stack.extend(self._data[i].children)
+
+    def endUnloadNode(self, _id):
+        _, visible = self._removing
+        self._removing = None
+        self._fetched.pop(_id, None)
+        self._stale.add(_id)
+        if visible:
+            self.endRemoveRows()
+
+    def changeNode(self, _id):
+        index = self.indexOf(_id)
+        if index.isValid():
+            self.dataChanged.emit(index, index)
+
+class TreeView(QTreeView):
     def __init__(self):
         super().__init__()
         self.setHeaderHidden(True)
-        self.itemPressed.connect(self.itemChange)
+        self.setUniformRowHeights(True)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self._model = SceneTreeModel()
+        self.setModel(self._model)
+        self.pressed.connect(self.itemChange)
+        # a plain click inside a selection only narrows it on release
+        self.clicked.connect(self.itemChange)
+        self.expanded.connect(self.itemExpanded)
+        self.collapsed.connect(self.itemCollapsed)
         self._sel_element_callback = None
-    
+        self._selection_callback = None
+        self._expand_callback = None
+        self._collapse_callback = None
+
     def setCallback(self, fn):
         self._sel_element_callback = fn
-    
-    def itemChange(self, it):
-        if self._sel_element_callback is not None:
-            self._sel_element_callback(int(it.text(1)))
-    
+
+    def setSelectionCallback(self, fn):
+        self._selection_callback = fn
+
+    def setExpandCallback(self, fn):
+        self._expand_callback = fn
+
+    def setCollapseCallback(self, fn):
+        self._collapse_callback = fn
+
+    def itemExpanded(self, index):
+        if self._expand_callback is not None:
+            self._expand_callback(self._model.nodeID(index))
+
+    def itemCollapsed(self, index):
+        if self._collapse_callback is not None:
+            self._collapse_callback(self._model.nodeID(index))
+
+    def itemChange(self, index):
+        if self._selection_callback is not None:
+            ids = [self._model.nodeID(i) for i in self.selectionModel().selectedIndexes()]
+            self._selection_callback(ids, self._model.nodeID(index))
+        elif self._sel_element_callback is not None:
+            self._sel_element_callback(self._model.nodeID(index))
+
     def updateData(self, data, sel=0):
-        self.clear()
-        groups = []
-        selItem = None
-        def item(i):
-            nonlocal groups, selItem
-            it = QTreeWidgetItem([data[i].name, str(i)])
-            if i == sel:
-                selItem = it
-            if data[i].type == "group":
-                groups.append(it)
-                for c in data[i].children:
-                    it.addChild(item(c))
-            return it
-        for c in data[0].children:
-            self.addTopLevelItem(item(c))
-        if selItem is not None:
-            selItem.setSelected(True)
-        for it in groups:
-            it.setExpanded(True)
-        # self.update()
\ No newline at end of file
+        self._model.resetData(data)
+        self.selectNode(sel)
+
+    def changeData(self, op, _id):
+        if op == "insert":
+            self._model.insertNode(_id)
+            index = self._model.indexOf(_id)
+            if index.isValid():
+                self.expand(index.parent())
+        elif op == "loaded":
+            self._model.insertNode(_id)
+        elif op == "remove":
+            self._model.beginRemoveNode(_id)
+        elif op == "removed":
+            self._model.endRemoveNode(_id)
+        elif op == "unload":
+            self._model.beginUnloadNode(_id)
+        elif op == "unloaded":
+            self._model.endUnloadNode(_id)
+        elif op == "change":
+            self._model.changeNode(_id)
+        elif op == "select":
+            self.selectNode(_id)
+
+    def revealNode(self, _id):
+        index = self._model.indexOf(_id, True)
+        p = index.parent()
+        while p.isValid():
+            self.expand(p)
+            p = p.parent()
+        return index
+
+    def selectNode(self, _id):
+        if _id == 0 or _id not in self._model._data:
+            self.selectionModel().clearSelection()
+            return
+        index = self.revealNode(_id)
+        self.selectionModel().setCurrentIndex(index, QItemSelectionModel.ClearAndSelect)
+        self.scrollTo(index)
+
+    def selectNodes(self, ids, current=0):
+        selection = QItemSelection()
+        for i in ids:
+            if i in self._model._data:
+                index = self.revealNode(i)
+                selection.select(index, index)
+        self.selectionModel().select(selection, QItemSelectionModel.ClearAndSelect)
+        if current != 0 and current in self._model._data:
+            index = self._model.indexOf(current)
+            self.selectionModel().setCurrentIndex(index, QItemSelectionModel.NoUpdate)
+            self.scrollTo(index)
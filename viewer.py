@@ -1,11 +1,15 @@
-from PySide2.QtCore import(Property, QObject, QPropertyAnimation, Signal, Qt)
-from PySide2.QtGui import (QGuiApplication, QMatrix4x4, QQuaternion, QVector3D, QColor)
+from PySide2.QtCore import Qt
+from PySide2.QtGui import (QMatrix4x4, QVector3D)
 from PySide2.Qt3DCore import (Qt3DCore)
 from PySide2.Qt3DExtras import (Qt3DExtras)
 from PySide2.Qt3DRender import (Qt3DRender)
-from PySide2.QtWidgets import *
+from PySide2.Qt3DLogic import (Qt3DLogic)
 import math
-from model import BindingEntity
+import time
+import numpy as np
+from spatial import framePlanes
+from decimate import lodSettings
+from tracing import tracer, traced
 
 class Viewer(Qt3DExtras.Qt3DWindow):
     def __init__(self, root):
@@ -25,11 +29,9 @@ class Viewer(Qt3DExtras.Qt3DWindow):
         self.light.setWorldDirection(QVector3D(100,-100,-100))
         self.rootEntity.addComponent(self.light)
 
-        self.picker = Qt3DRender.QObjectPicker(self.rootEntity)
-        self.rootEntity.addComponent(self.picker)
-        self.picker.clicked.connect(self.pickerTouch)
-
         self.press = None
+        self.press_x = 0
+        self.press_y = 0
         self.last_x = 0
         self.last_y = 0
 
@@ -41,14 +43,27 @@ class Viewer(Qt3DExtras.Qt3DWindow):
         self.rxy = 0
         self.rz = 280
 
+        self._pick = None
+        self._cull = None
         self.updateMatrix()
 
+        # input is summed between frames and applied once per frame
+        self._view_delta = dict.fromkeys(["rxy", "rz", "dx", "dy", "dz", "scale"], 0.0)
+        self._object_delta = {}
+        self._events = 0
+        self._updates = 0
+        self._rate_start = time.perf_counter()
+        self.input_rates = (0.0, 0.0)
+        self.first_frame = None
+        self._first_frame_callback = None
+        self.frame = Qt3DLogic.QFrameAction(self.rootEntity)
+        self.frame.triggered.connect(self.applyInput)
+        self.rootEntity.addComponent(self.frame)
+
+        lodSettings().camera = self.camera()
+
         self._callback = None
-    
-    def pickerTouch(self, ev):
-        e = ev.entity()
-        if isinstance(e, BindingEntity):
-            e.onClicked(ev)
+        self.editable = True
     
     def updateMatrix(self):
         m = QMatrix4x4()
@@ -57,7 +72,32 @@ class Viewer(Qt3DExtras.Qt3DWindow):
         m.rotate(self.rxy, QVector3D(0,0,1))
         m.translate(self.dx, self.dy, self.dz)
         self.transform.setMatrix(m)
+        self.cullScene()
+
+    def sceneMatrix(self):
+        """ Clip space from scene space, projection * view * root transform """
+        m = self.camera().projectionMatrix() * self.camera().viewMatrix() * self.transform.matrix()
+        return np.array([[m.row(i).x(), m.row(i).y(), m.row(i).z(), m.row(i).w()] for i in range(4)])
+
+    @traced("viewer.pickAt")
+    def pickAt(self, x, y, extend=False):
+        if self._pick is None or self.width() <= 0 or self.height() <= 0:
+            return
+        inv = np.linalg.inv(self.sceneMatrix())
+        nx = 2 * x / self.width() - 1
+        ny = 1 - 2 * y / self.height()
+        near = inv @ np.array([nx, ny, -1, 1])
+        far = inv @ np.array([nx, ny, 1, 1])
+        near = near[:3] / near[3]
+        far = far[:3] / far[3]
+        self._pick(near, far - near, extend)
+
+    @traced("viewer.cullScene")
+    def cullScene(self):
+        if self._cull is not None:
+            self._cull(framePlanes(self.sceneMatrix()))
     
+    @traced("viewer.mousePressEvent")
     def mousePressEvent(self, ev):
         if ev.button() == Qt.LeftButton:
             self.press = 'left'
@@ -69,55 +109,120 @@ class Viewer(Qt3DExtras.Qt3DWindow):
             self.press = None
         self.last_x = ev.x()
         self.last_y = ev.y()
+        self.press_x = ev.x()
+        self.press_y = ev.y()
+        lodSettings().dragging(self.press is not None)
         # print("press", self.last_x, self.last_y)
     
+    @traced("viewer.mouseReleaseEvent")
     def mouseReleaseEvent(self, ev):
+        self.applyInput()
+        if self.press == 'left' and abs(ev.x() - self.press_x) + abs(ev.y() - self.press_y) <= 2:
+            # Ctrl-click adds to or removes from the selection
+            self.pickAt(ev.x(), ev.y(), bool(ev.modifiers() & Qt.ControlModifier))
         self.incUpdate(update=True)
         self.press = None
+        lodSettings().dragging(False)
 
+    @traced("viewer.mouseMoveEvent")
     def mouseMoveEvent(self, ev):
         if self.press is not None:
+            self._events += 1
+            view = self._view_delta
+            xx = ev.x() - self.last_x
+            yy = ev.y() - self.last_y
             if self.press == 'left':
                 if ev.modifiers() & Qt.ControlModifier == 0:
-                    self.rxy = (self.rxy + ev.x() - self.last_x) % 360
-                    self.rz = (self.rz + ev.y() - self.last_y) % 360
+                    view["rxy"] += xx
+                    view["rz"] += yy
+                elif ev.modifiers() & Qt.AltModifier == 0:
+                    self.addObjectDelta(rz=xx, rx=yy)
                 else:
-                    xx = ev.x() - self.last_x
-                    yy = ev.y() - self.last_y
-                    if ev.modifiers() & Qt.AltModifier == 0:
-                        self.incUpdate(rz=xx, rx=yy)
-                    else:
-                        self.incUpdate(ry=xx, rx=yy)
-                # print(self.rxy, self.rz)
+                    self.addObjectDelta(ry=xx, rx=yy)
             elif self.press == 'middle':
-                rr = self.rxy/360*2*math.pi
-                xx = (ev.x() - self.last_x) * 0.5 * math.cos(rr) + \
-                    (ev.y() - self.last_y) * 0.5 * (-math.sin(rr))
-                yy = (ev.x() - self.last_x) * 0.5 * (-math.sin(rr)) + \
-                    (ev.y() - self.last_y) * 0.5 * (-math.cos(rr))
+                rr = (self.rxy + view["rxy"])/360*2*math.pi
+                px = xx * 0.5 * math.cos(rr) + yy * 0.5 * (-math.sin(rr))
+                py = xx * 0.5 * (-math.sin(rr)) + yy * 0.5 * (-math.cos(rr))
                 if ev.modifiers() & Qt.ControlModifier == 0:
-                    self.dx += xx
-                    self.dy += yy
+                    view["dx"] += px
+                    view["dy"] += py
                 else:
-                    self.incUpdate(dx=xx*0.5, dy=yy*0.5)
-                # print(self.dx, self.dy)
+                    self.addObjectDelta(dx=px*0.5, dy=py*0.5)
             elif self.press == 'right':
                 if ev.modifiers() & Qt.ControlModifier == 0:
-                    self.dz -= (ev.y() - self.last_y) * 0.5
+                    view["dz"] -= yy * 0.5
                 else:
-                    self.incUpdate(dz=(-(ev.y() - self.last_y) * 0.25))
+                    self.addObjectDelta(dz=-yy * 0.25)
             self.last_x = ev.x()
             self.last_y = ev.y()
-            self.updateMatrix()
     
+    @traced("viewer.wheelEvent")
     def wheelEvent(self, ev):
-        self.scale += ev.angleDelta().y() * 0.001
-        # print(self.scale)
-        self.updateMatrix()
+        self._events += 1
+        self._view_delta["scale"] += ev.angleDelta().y() * 0.001
+
+    def addObjectDelta(self, **vargs):
+        if not self.editable:
+            return
+        for k, v in vargs.items():
+            self._object_delta[k] = self._object_delta.get(k, 0) + v
+
+    @traced("viewer.applyInput")
+    def applyInput(self, dt=0):
+        """ Applies the input summed since the last frame in one update """
+        if dt:
+            tracer().frame(dt)
+        if self.first_frame is None:
+            self.first_frame = time.perf_counter()
+            if self._first_frame_callback is not None:
+                self._first_frame_callback()
+        view = self._view_delta
+        if any(view.values()):
+            self.rxy = (self.rxy + view["rxy"]) % 360
+            self.rz = (self.rz + view["rz"]) % 360
+            self.dx += view["dx"]
+            self.dy += view["dy"]
+            self.dz += view["dz"]
+            self.scale += view["scale"]
+            for k in view:
+                view[k] = 0.0
+            self.updateMatrix()
+            self._updates += 1
+        if self._object_delta:
+            delta = self._object_delta
+            self._object_delta = {}
+            self.incUpdate(**delta)
+            self._updates += 1
+        now = time.perf_counter()
+        if now - self._rate_start >= 1:
+            span = now - self._rate_start
+            self.input_rates = (self._events / span, self._updates / span)
+            self._events = 0
+            self._updates = 0
+            self._rate_start = now
+
+    def inputStats(self):
+        """ Raw input events and applied updates per second over the last second """
+        return { "events": self.input_rates[0], "updates": self.input_rates[1] }
     
     def incUpdate(self, **vargs):
         if self._callback is not None:
             self._callback(**vargs)
     
     def setCallback(self, fn):
-        self._callback = fn
\ No newline at end of file
+        self._callback = fn
+
+    def setEditable(self, on):
+        """ Ctrl-drags move the selection only when on """
+        self.editable = on
+        self._object_delta = {}
+
+    def setFirstFrameCallback(self, fn):
+        self._first_frame_callback = fn
+
+    def setPicking(self, fn):
+        self._pick = fn
+
+    def setCulling(self, fn):
+        self._cull = fn
+        self.cullScene()
\ No newline at end of file